@@ -0,0 +1,39 @@
+"""add movie rating aggregates
+
+Revision ID: 3f1c2a7d9b10
+Revises: 989d628ee86c
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '3f1c2a7d9b10'
+down_revision: Union[str, None] = '989d628ee86c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('movies') as batch_op:
+        batch_op.add_column(sa.Column('rating_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('rating_sum', sa.Float(), nullable=False, server_default='0'))
+    op.create_index(op.f('ix_ratings_movie_id'), 'ratings', ['movie_id'], unique=False)
+
+    op.execute(
+        """
+        UPDATE movies SET
+            rating_count = (SELECT COUNT(ratings.id) FROM ratings WHERE ratings.movie_id = movies.id),
+            rating_sum = (SELECT COALESCE(SUM(ratings.rating), 0) FROM ratings WHERE ratings.movie_id = movies.id)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_ratings_movie_id'), table_name='ratings')
+    with op.batch_alter_table('movies') as batch_op:
+        batch_op.drop_column('rating_sum')
+        batch_op.drop_column('rating_count')
@@ -0,0 +1,27 @@
+"""add movie updated_at
+
+Revision ID: 7a4e91c3d2b5
+Revises: 3f1c2a7d9b10
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '7a4e91c3d2b5'
+down_revision: Union[str, None] = '3f1c2a7d9b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('movies') as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.func.now()))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('movies') as batch_op:
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,27 @@
+"""index comment and reply parents
+
+Revision ID: b82d5f0e6a13
+Revises: 7a4e91c3d2b5
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'b82d5f0e6a13'
+down_revision: Union[str, None] = '7a4e91c3d2b5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_comments_movie_id'), 'comments', ['movie_id'], unique=False)
+    op.create_index(op.f('ix_replies_comment_id'), 'replies', ['comment_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_replies_comment_id'), table_name='replies')
+    op.drop_index(op.f('ix_comments_movie_id'), table_name='comments')
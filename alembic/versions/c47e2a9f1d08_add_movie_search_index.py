@@ -0,0 +1,46 @@
+"""add movie search index
+
+Revision ID: c47e2a9f1d08
+Revises: b82d5f0e6a13
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'c47e2a9f1d08'
+down_revision: Union[str, None] = 'b82d5f0e6a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute(
+            """
+            ALTER TABLE movies ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(description, '')), 'B')
+            ) STORED
+            """
+        )
+        op.create_index('ix_movies_search_vector', 'movies', ['search_vector'], postgresql_using='gin')
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(title, description)")
+        op.execute(
+            "INSERT INTO movies_fts (rowid, title, description) "
+            "SELECT id, coalesce(title, ''), coalesce(description, '') FROM movies"
+        )
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.drop_index('ix_movies_search_vector', table_name='movies')
+        op.drop_column('movies', 'search_vector')
+    elif dialect == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS movies_fts")
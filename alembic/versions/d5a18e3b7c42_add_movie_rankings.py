@@ -0,0 +1,43 @@
+"""add movie rankings
+
+Revision ID: d5a18e3b7c42
+Revises: c47e2a9f1d08
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'd5a18e3b7c42'
+down_revision: Union[str, None] = 'c47e2a9f1d08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'movie_rankings',
+        sa.Column('movie_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('rating_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['movie_id'], ['movies.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('movie_id'),
+    )
+    op.create_index('ix_movie_rankings_score', 'movie_rankings', [sa.text('score DESC'), 'movie_id'], unique=False)
+
+    # Backfill with the default prior (m=10, C=5.0); rebuild_rankings re-scores under other settings.
+    op.execute(
+        """
+        INSERT INTO movie_rankings (movie_id, score, rating_count)
+        SELECT id, (rating_sum + 50.0) / (rating_count + 10), rating_count
+        FROM movies WHERE rating_count > 0
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_movie_rankings_score', table_name='movie_rankings')
+    op.drop_table('movie_rankings')
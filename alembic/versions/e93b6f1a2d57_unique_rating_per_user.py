@@ -0,0 +1,51 @@
+"""unique rating per user
+
+Revision ID: e93b6f1a2d57
+Revises: d5a18e3b7c42
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'e93b6f1a2d57'
+down_revision: Union[str, None] = 'd5a18e3b7c42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Racing requests could store a second rating by the same user; keep the first.
+    op.execute(
+        """
+        DELETE FROM ratings WHERE id NOT IN (
+            SELECT MIN(id) FROM ratings GROUP BY movie_id, user_id
+        )
+        """
+    )
+    op.execute(
+        """
+        UPDATE movies SET
+            rating_count = (SELECT COUNT(ratings.id) FROM ratings WHERE ratings.movie_id = movies.id),
+            rating_sum = (SELECT COALESCE(SUM(ratings.rating), 0) FROM ratings WHERE ratings.movie_id = movies.id)
+        """
+    )
+    # Same default-prior backfill as d5a18e3b7c42.
+    op.execute("DELETE FROM movie_rankings")
+    op.execute(
+        """
+        INSERT INTO movie_rankings (movie_id, score, rating_count)
+        SELECT id, (rating_sum + 50.0) / (rating_count + 10), rating_count
+        FROM movies WHERE rating_count > 0
+        """
+    )
+    with op.batch_alter_table('ratings') as batch_op:
+        batch_op.create_unique_constraint('uq_ratings_movie_user', ['movie_id', 'user_id'])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('ratings') as batch_op:
+        batch_op.drop_constraint('uq_ratings_movie_user', type_='unique')
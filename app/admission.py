@@ -0,0 +1,242 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse
+
+from app.log import get_logger
+from app.replicas import is_read
+
+logger = get_logger("admission")
+
+
+RETRY_AFTER_SECONDS = "1"
+AUTH_PATHS = frozenset({"/login", "/signup"})
+ROUTE_CLASSES = ("read", "write", "auth")
+
+
+def route_class(method:str, path:str) -> str:
+    """Reads, writes and bcrypt-bound auth wait on different resources, so each gets its own limit."""
+    if path in AUTH_PATHS:
+        return "auth"
+    return "read" if is_read(method, path) else "write"
+
+
+class AdaptiveLimiter:
+    """Concurrency limit for one route class, adjusted by AIMD on observed latency.
+
+    A request that finishes under ``target_latency`` grows the limit by
+    ``1 / limit`` (about +1 per limit's worth of requests); a slower or failed
+    one shrinks it by ``backoff``, at most once per ``target_latency`` so a
+    burst of slow responses counts as one congestion signal. Requests over
+    the limit wait in a FIFO queue of ``max_queue`` for up to
+    ``queue_timeout`` seconds; beyond that they are shed.
+
+    Runs on the event loop only, so the counters need no lock.
+    """
+
+    def __init__(self, name:str, initial:int, min_limit:int, max_limit:int, max_queue:int, queue_timeout:float, target_latency:float, backoff:float=0.9):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.in_flight = 0
+        self.waiters = deque()
+        self.last_decrease = 0.0
+        self.admitted = 0
+        self.shed = 0
+
+    def has_capacity(self) -> bool:
+        return self.in_flight < math.floor(self.limit)
+
+    async def acquire(self) -> bool:
+        """Take a slot, queueing if needed; ``False`` means the request should be shed."""
+        if self.has_capacity() and not self.waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        if len(self.waiters) >= self.max_queue:
+            self.shed += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.done() and not waiter.cancelled():
+                # Granted a slot just as we gave up waiting; hand it on.
+                self.in_flight -= 1
+                self.wake()
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            self.shed += 1
+            return False
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+        self.admitted += 1
+        return True
+
+    def wake(self):
+        while self.waiters and self.has_capacity():
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def release(self, latency:float, failed:bool):
+        self.in_flight -= 1
+        now = time.monotonic()
+        if failed or latency > self.target_latency:
+            if now - self.last_decrease >= self.target_latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.last_decrease = now
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self.wake()
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": len(self.waiters),
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+
+def build_limiters(settings) -> dict[str, AdaptiveLimiter]:
+    return {
+        name: AdaptiveLimiter(
+            name,
+            initial=settings.concurrency_initial[name],
+            min_limit=settings.concurrency_min,
+            max_limit=settings.concurrency_max[name],
+            max_queue=settings.concurrency_queue_size,
+            queue_timeout=settings.concurrency_queue_timeout,
+            target_latency=settings.concurrency_latency_target[name],
+        )
+        for name in ROUTE_CLASSES
+    }
+
+
+# The limiters of the running app, for the /metrics collector.
+limiters = {}
+
+
+def set_limiters(active:dict[str, AdaptiveLimiter]):
+    global limiters
+    limiters = active
+
+
+def overloaded() -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, retry shortly"},
+        headers={"Retry-After": RETRY_AFTER_SECONDS},
+    )
+
+
+class ConcurrencyLimitMiddleware:
+    """Admit each request against its route class's limiter, or shed it with ``503``.
+
+    Latency is measured to the start of the response, so long streamed
+    bodies do not read as congestion; the slot is held until the body ends.
+    ``5xx`` responses count as congestion too.
+    """
+
+    def __init__(self, app, limiters:dict[str, AdaptiveLimiter], exempt:frozenset=frozenset()):
+        self.app = app
+        self.limiters = limiters
+        self.exempt = exempt
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt:
+            await self.app(scope, receive, send)
+            return
+        limiter = self.limiters[route_class(scope["method"], scope["path"])]
+        if not await limiter.acquire():
+            logger.warning("Shed %s %s: %s limit %s reached", scope["method"], scope["path"], limiter.name, math.floor(limiter.limit))
+            await overloaded()(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        latency = None
+        failed = True
+
+        async def send_wrapper(message):
+            nonlocal latency, failed
+            if message["type"] == "http.response.start":
+                latency = time.perf_counter() - started
+                failed = message["status"] >= 500
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            limiter.release(latency if latency is not None else time.perf_counter() - started, failed)
+
+
+class TokenBuckets:
+    """Per-user token buckets: ``rate`` requests a second on average, bursts up to ``burst``.
+
+    Buckets are refilled lazily on access and kept for the ``max_users`` most
+    recently seen users.
+    """
+
+    def __init__(self, rate:float, burst:int, max_users:int=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def take(self, key) -> float:
+        """Spend one token; returns 0 when allowed, else the seconds until a token is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+                self.limited += 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+def build_user_buckets(settings) -> TokenBuckets | None:
+    if settings.rate_limit_per_second <= 0:
+        return None
+    return TokenBuckets(settings.rate_limit_per_second, settings.rate_limit_burst)
+
+
+def rate_limited(get_user):
+    """Wrap a ``get_current_user`` dependency with the app's per-user token buckets (``429`` when empty)."""
+
+    async def current_user(request:Request, user=Depends(get_user)):
+        buckets = getattr(request.app.state, "user_buckets", None)
+        if buckets is not None:
+            wait = buckets.take(user.id)
+            if wait:
+                logger.warning("User %s is over their rate limit", user.id)
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Rate limit exceeded",
+                    headers={"Retry-After": str(math.ceil(wait))},
+                )
+        return user
+
+    return current_user
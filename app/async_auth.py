@@ -0,0 +1,68 @@
+from fastapi import Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth import (
+    credentials_error,
+    hash_password_async,
+    oath2_scheme,
+    token_cache,
+    user_matches_claims,
+    verify_access_token,
+    verify_password_async,
+)
+from app.async_database import get_async_db
+from app.models import User as UserModel
+from app.schemas import UserCreate
+from app.log import get_logger
+
+logger = get_logger("async_auth")
+
+
+async def get_user_by_username(username:str, db:AsyncSession):
+    db_user = await db.scalar(select(UserModel).where(UserModel.username == username))
+    if db_user is None:
+        logger.warning("User not found")
+        return None
+    logger.info("user %s has been found", username)
+    return db_user
+
+
+async def authenticate_user(username:str, password:str, db:AsyncSession):
+    db_user = await get_user_by_username(username, db)
+    if not db_user:
+        logger.warning("Invalid username or password")
+        return False
+    valid, new_hash = await verify_password_async(password, db_user.hashed_password)
+    if not valid:
+        logger.warning("Invalid username or password")
+        return False
+    if new_hash:
+        db_user.hashed_password = new_hash
+        await db.commit()
+        logger.info("Password hash for user %s upgraded", username)
+    return db_user
+
+
+async def create_user(user: UserCreate, db:AsyncSession):
+    hashed_password = await hash_password_async(user.password)
+    db_user = UserModel(username=user.username, email=user.email, hashed_password=hashed_password)
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+
+async def get_current_user(db:AsyncSession =Depends(get_async_db), token:str= Depends(oath2_scheme)):
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+    payload = verify_access_token(token)
+    if payload.get("uid") is not None:
+        db_user = await db.get(UserModel, payload["uid"])
+    else:
+        db_user = await get_user_by_username(payload["sub"], db)
+    if not user_matches_claims(db_user, payload):
+        logger.error("User not found")
+        raise credentials_error()
+    return token_cache.set(token, db_user, payload["exp"])
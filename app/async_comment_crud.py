@@ -0,0 +1,47 @@
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.async_crud import movie_exists
+from app.cache import invalidate_movie_detail
+from app.comment_crud import comment_listing_query
+from app.crud import touch_movie
+from app.models import Comment as CommentModel
+from app.schemas import CommentCreate
+from app.threads import comment_threads, reply_preview_query
+from app.log import get_logger
+
+
+logger = get_logger("async_comment_crud")
+
+
+async def create_movie_comment(movie_id:int, db:AsyncSession, comment:CommentCreate, user_id:int|None=None):
+    if not await movie_exists(db, movie_id):
+        logger.warning("Movie is not found")
+        raise HTTPException(status_code=404, detail="Movie not found")
+    db_comment = CommentModel(
+        **comment.model_dump(),
+        movie_id=movie_id,
+        user_id=user_id
+    )
+    db.add(db_comment)
+    await db.execute(touch_movie(movie_id))
+    await db.commit()
+    invalidate_movie_detail(movie_id)
+    await db.refresh(db_comment)
+    return db_comment
+
+
+async def get_comments(db:AsyncSession, movie_id:int, skip:int=0, limit:int=10, after:int|None=None, reply_limit:int=3):
+    if not await movie_exists(db, movie_id):
+        logger.warning("Movie is not found")
+        raise HTTPException(status_code=404, detail="Movie not found")
+    db_comments = (await db.scalars(comment_listing_query(movie_id, after).offset(skip).limit(limit))).all()
+    if not db_comments:
+        return []
+    preview = (await db.execute(reply_preview_query([c.id for c in db_comments], reply_limit))).all()
+    return comment_threads(db_comments, preview, reply_limit)
+
+
+async def get_comment_by_id(db:AsyncSession, comment_id:int):
+    return await db.scalar(select(CommentModel).where(CommentModel.id == comment_id))
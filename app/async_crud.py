@@ -0,0 +1,168 @@
+from fastapi import HTTPException
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.batch import cached_movie_details, movie_batch
+from app.cache import MISSING, get_cache_backend, invalidate_movie, movie_detail_key, movie_exists_key
+from app.config import get_settings
+from app.crud import (
+    dialect_name,
+    embeds_comments,
+    movie_detail,
+    movie_listing_query,
+    movie_page_query,
+    movie_versions_query,
+    threaded_movies,
+)
+from app.models import Movie as MovieModel, Rating as RatingModel
+from app.schemas import MovieCreate, MovieUpate
+from app.database import fills_cache
+from app.rankings import ranking_removal, top_movies_query
+from app.search import index_statements, search_query, unindex_statements
+from app.threads import comment_preview_query, movie_threads, previewed_comment_ids, reply_preview_query
+from app.log import get_logger
+
+
+logger = get_logger("async_crud")
+
+
+async def load_movie_threads(db:AsyncSession, movie_ids:list[int], settings=None) -> dict[int, dict]:
+    settings = settings or get_settings()
+    if not movie_ids:
+        return {}
+    per_movie, per_comment = settings.comment_preview_limit, settings.reply_preview_limit
+    comment_rows = (await db.execute(comment_preview_query(movie_ids, per_movie))).all()
+    comment_ids = previewed_comment_ids(comment_rows, per_movie)
+    reply_rows = (await db.execute(reply_preview_query(comment_ids, per_comment))).all() if comment_ids else []
+    return movie_threads(comment_rows, reply_rows, per_movie, per_comment)
+
+
+async def get_movies(db:AsyncSession, skip:int=0, limit:int=10, after:int|None=None, fieldset=None, settings=None):
+    db_movies = (await db.scalars(movie_page_query(skip, limit, after, fieldset))).all()
+    logger.info(" Average rating for db_movies")
+    if not embeds_comments(fieldset):
+        return db_movies
+    return threaded_movies(db_movies, await load_movie_threads(db, [m.id for m in db_movies], settings), fieldset)
+
+
+async def get_movies_by_id(db:AsyncSession, movie_id:int, settings=None):
+    cache = get_cache_backend()
+    cached = cache.get(movie_detail_key(movie_id))
+    if cached is not MISSING:
+        return cached
+    db_movies = (await db.scalars(movie_listing_query().where(MovieModel.id == movie_id))).first()
+    if not db_movies:
+        logger.warning("Movie is not found")
+        raise HTTPException(status_code=404, detail="Movie not found")
+    payload = movie_detail(db_movies, await load_movie_threads(db, [movie_id], settings))
+    if fills_cache(db):
+        cache.set(movie_detail_key(movie_id), payload)
+    return payload
+
+
+async def get_movies_by_ids(db:AsyncSession, movie_ids:list[int], comment_counts:bool=False, settings=None) -> dict:
+    movie_ids = list(dict.fromkeys(movie_ids))
+    found, uncached = cached_movie_details(movie_ids)
+    if uncached:
+        cache = get_cache_backend()
+        db_movies = (await db.scalars(movie_listing_query().where(MovieModel.id.in_(uncached)))).all()
+        threads = await load_movie_threads(db, [db_movie.id for db_movie in db_movies], settings)
+        for db_movie in db_movies:
+            found[db_movie.id] = movie_detail(db_movie, threads)
+            if fills_cache(db):
+                cache.set(movie_detail_key(db_movie.id), found[db_movie.id])
+    return movie_batch(movie_ids, found, comment_counts)
+
+
+async def movie_exists(db:AsyncSession, movie_id:int) -> bool:
+    cache = get_cache_backend()
+    if cache.get(movie_exists_key(movie_id)) is True:
+        return True
+    exists = await db.scalar(select(MovieModel.id).where(MovieModel.id == movie_id)) is not None
+    if exists and fills_cache(db):
+        cache.set(movie_exists_key(movie_id), True)
+    return exists
+
+
+async def get_movie_page_versions(db:AsyncSession, skip:int=0, limit:int=10, after:int|None=None):
+    return (await db.execute(movie_versions_query(skip, limit, after))).all()
+
+
+async def get_movie_version(db:AsyncSession, movie_id:int):
+    cached = get_cache_backend().get(movie_detail_key(movie_id))
+    if cached is not MISSING:
+        return cached["updated_at"]
+    updated_at = await db.scalar(select(MovieModel.updated_at).where(MovieModel.id == movie_id))
+    if updated_at is None:
+        logger.warning("Movie is not found")
+        raise HTTPException(status_code=404, detail="Movie not found")
+    return updated_at
+
+
+async def get_movies_by_id_and_user_id(db:AsyncSession, movie_id:int, user_id:int):
+    return await db.scalar(select(MovieModel).where(MovieModel.id == movie_id, MovieModel.user_id == user_id))
+
+
+async def get_top_movies(db:AsyncSession, skip:int=0, limit:int=10):
+    return (await db.execute(top_movies_query(skip, limit))).all()
+
+
+async def search_movies(db:AsyncSession, q:str, skip:int=0, limit:int=10, fieldset=None, settings=None):
+    statement = search_query(dialect_name(db), q, skip, limit)
+    movie_ids = (await db.scalars(statement)).all() if statement is not None else []
+    if not movie_ids:
+        return []
+    db_movies = {
+        db_movie.id: db_movie
+        for db_movie in await db.scalars(movie_listing_query(fieldset).where(MovieModel.id.in_(movie_ids)))
+    }
+    db_movies = [db_movies[movie_id] for movie_id in movie_ids if movie_id in db_movies]
+    if not embeds_comments(fieldset):
+        return db_movies
+    return threaded_movies(db_movies, await load_movie_threads(db, [m.id for m in db_movies], settings), fieldset)
+
+
+async def create_movies(db:AsyncSession, movie_paylaod:MovieCreate, user_id:int|None=None):
+    db_movie = MovieModel(
+        **movie_paylaod.model_dump(),
+        user_id=user_id
+    )
+    db.add(db_movie)
+    await db.flush()
+    for statement in index_statements(dialect_name(db), db_movie.id, db_movie.title, db_movie.description):
+        await db.execute(statement)
+    await db.commit()
+    await db.refresh(db_movie)
+    return db_movie
+
+
+async def edit_movie(db:AsyncSession, movie_id:int, movie_paylad:MovieUpate, user_id:int|None=None):
+    movie = await get_movies_by_id_and_user_id(db, movie_id, user_id)
+    if not movie:
+        logger.warning("Movie not found or User is not allow to edit this movie")
+        raise HTTPException(status_code=404, detail="Movie not found or User cannot fetch this movie")
+
+    for k, v in movie_paylad.model_dump(exclude_unset=True).items():
+        setattr(movie, k, v)
+
+    db.add(movie)
+    for statement in index_statements(dialect_name(db), movie.id, movie.title, movie.description):
+        await db.execute(statement)
+    await db.commit()
+    invalidate_movie(movie_id)
+    await db.refresh(movie)
+    return movie
+
+
+async def delete_movie(db:AsyncSession, movie_id:int, user_id:int|None=None):
+    movie = await get_movies_by_id_and_user_id(db, movie_id, user_id)
+    if movie is None:
+        logger.warning("Movie not found or User cannot fetch this movie")
+        return None
+    await db.execute(delete(RatingModel).where(RatingModel.movie_id == movie_id))
+    await db.execute(ranking_removal(movie_id))
+    await db.delete(movie)
+    for statement in unindex_statements(dialect_name(db), movie_id):
+        await db.execute(statement)
+    await db.commit()
+    invalidate_movie(movie_id)
@@ -0,0 +1,110 @@
+from functools import partial
+
+from fastapi import Depends, Request
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.config import get_settings
+from app.database import REPLICA_SESSION, install_statement_deadline, pool_options, with_statement_timeout
+from app.metrics import instrument_engine
+from app.replicas import read_engine
+
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url:str) -> str:
+    """Swap the blocking driver of ``url`` for its asyncio counterpart."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend!r} databases")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False, class_=AsyncSession)
+
+async_engine = None
+# Async twin of each read replica engine, keyed by the blocking engine whose
+# background health checks it shares.
+async_replica_engines = {}
+
+
+def create_instrumented_async_engine(url:str, settings):
+    options = pool_options(url, settings)
+    if "pool_size" in options:
+        # aiosqlite file databases default to NullPool, which takes no sizing.
+        options["poolclass"] = AsyncAdaptedQueuePool
+    engine = create_async_engine(url, **options)
+    instrument_engine(engine.sync_engine)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", install_statement_deadline)
+    return engine
+
+
+def init_async_engine(settings=None, replicas=None):
+    """Create the async engine, and a twin for every engine of ``replicas``."""
+    global async_engine, async_replica_engines
+    settings = settings or get_settings()
+    url = settings.async_db_url or to_async_url(settings.db_url)
+    async_engine = create_instrumented_async_engine(url, settings)
+    AsyncSessionLocal.configure(bind=async_engine)
+    if replicas is not None:
+        async_replica_engines = {
+            engine: create_instrumented_async_engine(to_async_url(engine.url.render_as_string(hide_password=False)), settings)
+            for engine in replicas.engines
+        }
+    return async_engine
+
+
+def get_async_engine():
+    """Create the async engine on first use, so sync deployments never import asyncpg/aiosqlite."""
+    return async_engine if async_engine is not None else init_async_engine()
+
+
+async def dispose_async_engine():
+    global async_engine, async_replica_engines
+    if async_engine is not None:
+        await async_engine.dispose()
+        async_engine = None
+    for engine in async_replica_engines.values():
+        await engine.dispose()
+    async_replica_engines = {}
+
+
+async def get_async_db():
+    get_async_engine()
+    async with AsyncSessionLocal() as db:
+        with_statement_timeout(db)
+        yield db
+
+
+def get_async_session_factory():
+    get_async_engine()
+    return AsyncSessionLocal
+
+
+def async_read_engine(request:Request):
+    engine = read_engine(request)
+    return async_replica_engines.get(engine) if engine is not None else None
+
+
+async def get_async_read_db(request:Request, primary:AsyncSession=Depends(get_async_db)):
+    """``get_read_db`` for the AsyncSession router: a healthy replica, or the primary session."""
+    engine = async_read_engine(request)
+    if engine is None:
+        yield primary
+        return
+    async with AsyncSessionLocal(bind=engine, info={REPLICA_SESSION: True}) as db:
+        with_statement_timeout(db)
+        yield db
+
+
+def get_async_read_session_factory(request:Request, primary=Depends(get_async_session_factory)):
+    engine = async_read_engine(request)
+    return primary if engine is None else partial(AsyncSessionLocal, bind=engine, info={REPLICA_SESSION: True})
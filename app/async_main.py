@@ -0,0 +1,184 @@
+from functools import partial
+from typing import List, Literal
+
+from fastapi import APIRouter, Depends, Query, Request, status
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import handlers
+from app.async_auth import get_current_user, authenticate_user, create_user, get_user_by_username
+from app.admission import rate_limited
+from app.export import stream_movie_export_async
+from app.bulk_import import insert_movie_batch_async
+from app.async_comment_crud import create_movie_comment, get_comments, get_comment_by_id
+from app.async_crud import (
+    create_movies,
+    get_movies,
+    get_movies_by_id,
+    get_movies_by_ids,
+    edit_movie,
+    get_movies_by_id_and_user_id,
+    get_movie_page_versions,
+    get_movie_version,
+    get_top_movies,
+    movie_exists,
+    search_movies,
+    delete_movie
+)
+from app.async_database import get_async_db, get_async_read_db, get_async_read_session_factory
+from app.async_ratingcrud import create_rating, get_ratings, update_rating
+from app.rating_buffer import RatingBuffer, get_rating_buffer
+from app.async_reply_crud import create_reply, get_replies
+from app.schemas import (
+    MovieUpate,
+    User as UserSchema,
+    UserCreate,
+    Movie as MovieSchema,
+    MovieCreate,
+    MovieBatchRequest,
+    CommentCreate,
+    Comment as CommentSchema,
+    ReplyCreate,
+    Reply as ReplySchema,
+    RatingCreate,
+    RankedMovie,
+)
+from app.config import Settings, get_app_settings
+from app.batch import movie_batch_params
+from app.fieldsets import Fieldset, movie_fieldset
+from app.serialization import ranked_movie_list_adapter, render
+from app.pagination import MAX_REPLY_PREVIEW, cursor_param
+
+router = APIRouter()
+
+# Authenticated endpoints depend on this, so every user is held to RATE_LIMIT_PER_SECOND.
+current_user = rate_limited(get_current_user)
+
+
+@router.post("/signup", status_code=status.HTTP_201_CREATED, tags=["USER"])
+async def signup(user:UserCreate, db:AsyncSession=Depends(get_async_db)):
+    handlers.reject_existing_user(await get_user_by_username(user.username, db), user.username)
+    return handlers.signed_up(await create_user(user, db))
+
+
+@router.post("/login", tags=["USER"])
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db:AsyncSession=Depends(get_async_db)):
+    return handlers.logged_in(await authenticate_user(form_data.username, form_data.password, db))
+
+
+@router.get("/Movies/", tags=["MOVIE"], response_model=List[MovieSchema])
+async def get_all_movies(request: Request, db:AsyncSession=Depends(get_async_read_db), skip:int=0, limit:int=10, after:int|None=Depends(cursor_param), fieldset:Fieldset|None=Depends(movie_fieldset), settings: Settings=Depends(get_app_settings)):
+    versions = await get_movie_page_versions(db, skip=skip, limit=limit, after=after)
+    etag, not_modified = handlers.movie_page_validators(request, versions, skip, limit, after, fieldset)
+    if not_modified is not None:
+        return not_modified
+    movies = await get_movies(db=db, skip=skip, limit=limit, after=after, fieldset=fieldset, settings=settings)
+    return handlers.movie_page(movies, etag, limit, fieldset)
+
+
+@router.get("/movie/{movie_id}", tags=["MOVIE"], response_model=MovieSchema)
+async def get_movie_by_id(movie_id: int, request: Request, db: AsyncSession=Depends(get_async_read_db), settings: Settings=Depends(get_app_settings)):
+    not_modified = handlers.movie_not_modified(request, movie_id, await get_movie_version(db, movie_id))
+    if not_modified is not None:
+        return not_modified
+    return handlers.movie_detail(movie_id, await get_movies_by_id(db, movie_id, settings))
+
+
+@router.post('/movies/create', status_code=status.HTTP_201_CREATED, tags=["MOVIE"])
+async def create_movie(moviePayload:MovieCreate, db: AsyncSession=Depends(get_async_db), user : UserSchema=Depends(current_user)):
+    return handlers.movie_created(await create_movies(db, moviePayload, user.id))
+
+
+@router.post('/movies/import', tags=["MOVIE"])
+async def import_movie_catalog(request: Request, format: Literal["ndjson", "csv"] | None = None, db: AsyncSession=Depends(get_async_db), user : UserSchema=Depends(current_user), settings: Settings=Depends(get_app_settings)):
+    async def insert_batch(rows):
+        await insert_movie_batch_async(db, rows)
+
+    return await handlers.import_catalog(request, format, insert_batch, settings, user.id)
+
+
+@router.get('/movies/export', tags=["MOVIE"])
+async def export_movie_catalog(gzip: bool = False, session_factory=Depends(get_async_read_session_factory), settings: Settings=Depends(get_app_settings)):
+    return handlers.export_response(stream_movie_export_async(session_factory, settings.export_batch_size, gzip), gzip)
+
+
+@router.get('/movies/search', tags=["MOVIE"], response_model=List[MovieSchema])
+async def search_movie_catalog(q: str = Query(..., min_length=1, max_length=200), db: AsyncSession=Depends(get_async_read_db), skip:int=0, limit:int=10, fieldset:Fieldset|None=Depends(movie_fieldset), settings: Settings=Depends(get_app_settings)):
+    return handlers.search_results(await search_movies(db, q, skip=skip, limit=limit, fieldset=fieldset, settings=settings), fieldset)
+
+
+@router.get('/movies/top', tags=["MOVIE"], response_model=List[RankedMovie])
+async def get_top_rated_movies(db: AsyncSession=Depends(get_async_read_db), skip:int=0, limit:int=10):
+    return render(ranked_movie_list_adapter, await get_top_movies(db, skip=skip, limit=limit))
+
+
+@router.get('/movies/batch', tags=["MOVIE"])
+async def get_movie_batch(batch: MovieBatchRequest=Depends(movie_batch_params), db: AsyncSession=Depends(get_async_read_db), settings: Settings=Depends(get_app_settings)):
+    return handlers.movie_batch(batch, await get_movies_by_ids(db, batch.ids, batch.comment_counts, settings))
+
+
+@router.post('/movies/batch', tags=["MOVIE"])
+async def post_movie_batch(batch: MovieBatchRequest, db: AsyncSession=Depends(get_async_read_db), settings: Settings=Depends(get_app_settings)):
+    """Same as ``GET /movies/batch``, for id lists too long for a query string."""
+    return handlers.movie_batch(batch, await get_movies_by_ids(db, batch.ids, batch.comment_counts, settings))
+
+
+@router.put('/movies/{movie_id}', status_code=status.HTTP_200_OK, tags=["MOVIE"])
+async def update_movie(movie_id:int, moviePayload:MovieUpate, db: AsyncSession=Depends(get_async_db), user : UserSchema=Depends(current_user)):
+    return handlers.movie_updated(await edit_movie(db, movie_id, moviePayload, user.id))
+
+
+@router.delete('/movies/{movie_id}', status_code=status.HTTP_200_OK, tags=["MOVIE"])
+async def delete__movie(movie_id:int, db: AsyncSession=Depends(get_async_db), user : UserSchema=Depends(current_user)):
+    handlers.require_owned_movie(await get_movies_by_id_and_user_id(db, movie_id, user.id))
+    await delete_movie(db, movie_id, user.id)
+    return handlers.movie_deleted()
+
+
+@router.post("/movies/{movie_id}/create_comment", tags=["COMMENT"])
+async def create_comment(movie_id: int, comment: CommentCreate, db: AsyncSession = Depends(get_async_db), user: UserSchema = Depends(current_user)):
+    return handlers.comment_created(movie_id, await create_movie_comment(movie_id, db, comment, user.id))
+
+
+@router.get("/movies/{movie_id}/comments", tags=["COMMENT"], response_model=List[CommentSchema])
+async def get_comments_of_a_movie(movie_id: int, request: Request, db: AsyncSession = Depends(get_async_read_db), skip:int=0, limit:int=10, after:int|None=Depends(cursor_param), reply_limit:int|None=Query(None, ge=0, le=MAX_REPLY_PREVIEW), settings: Settings=Depends(get_app_settings)):
+    if reply_limit is None:
+        reply_limit = settings.reply_preview_limit
+    validators, not_modified = handlers.comment_page_validators(request, movie_id, await get_movie_version(db, movie_id), skip, limit, after, reply_limit)
+    if not_modified is not None:
+        return not_modified
+    movie_comments = await get_comments(db, movie_id, skip=skip, limit=limit, after=after, reply_limit=reply_limit)
+    return handlers.comment_page(movie_id, movie_comments, validators, limit)
+
+
+@router.post("/comments/{comment_id}/comments", tags=["NESTED COMMENTS"])
+async def create_nested_comment(comment_id: int, reply: ReplyCreate, db: AsyncSession = Depends(get_async_db), user: UserSchema = Depends(current_user)):
+    db_comment = await get_comment_by_id(db, comment_id)
+    handlers.require_comment(db_comment, comment_id)
+    new_reply = await create_reply(db=db, reply_payload=reply, comment_id=comment_id, movie_id=db_comment.movie_id, user_id=user.id)
+    return handlers.reply_created(comment_id, new_reply)
+
+
+@router.get("/comments/{comment_id}/replies", tags=["NESTED COMMENTS"], response_model=List[ReplySchema])
+async def get_replies_of_a_comment(comment_id: int, db: AsyncSession = Depends(get_async_read_db), skip:int=0, limit:int=10, after:int|None=Depends(cursor_param)):
+    handlers.require_comment(await get_comment_by_id(db, comment_id), comment_id)
+    return handlers.reply_page(comment_id, await get_replies(db, comment_id, skip=skip, limit=limit, after=after), limit)
+
+
+@router.post("/movie/{movie_id}/create_rating", tags=["RATING"])
+async def create_movie_rating(movie_id: int, rating: RatingCreate, db: AsyncSession = Depends(get_async_db), user: UserSchema = Depends(current_user), buffer: RatingBuffer | None = Depends(get_rating_buffer), settings: Settings=Depends(get_app_settings)):
+    return await handlers.rate_movie(
+        movie_id, user.id, rating.rating, buffer, settings,
+        create=partial(create_rating, db, rating, movie_id, user.id, settings),
+        exists=partial(movie_exists, db, movie_id),
+    )
+
+
+@router.put("/movie/{movie_id}/rating", tags=["RATING"])
+async def update_movie_rating(movie_id: int, rating: RatingCreate, db: AsyncSession = Depends(get_async_db), user: UserSchema = Depends(current_user), settings: Settings=Depends(get_app_settings)):
+    return handlers.rating_updated(movie_id, await update_rating(db, rating, movie_id, user.id, settings))
+
+
+@router.get("/movie/rating/{movie_id}", tags=["RATING"], status_code=status.HTTP_200_OK)
+async def get_movie_rating(movie_id:int, db:AsyncSession=Depends(get_async_read_db)):
+    return handlers.movie_rating(movie_id, await get_ratings(db, movie_id))
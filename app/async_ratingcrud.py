@@ -0,0 +1,51 @@
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud import dialect_name, touch_movie
+from app.cache import invalidate_movie_detail
+from app.models import Movie as MovieModel
+from app.rankings import ranking_refresh
+from app.ratingcrud import RATING_KEY, rating_aggregate_update, rating_change_update, rating_insert, rating_upsert
+from app.schemas import RatingCreate
+from app.log import get_logger
+
+logger = get_logger("async_rating_crud")
+
+
+async def get_ratings(db:AsyncSession, movie_id:int):
+    average_rating = await db.scalar(select(MovieModel.average_rating).where(MovieModel.id == movie_id))
+    if average_rating is None:
+        logger.warning("Movie is not found")
+        raise HTTPException(status_code=404, detail="Movie not found")
+    return average_rating
+
+
+async def create_rating(db:AsyncSession, ratingPayload:RatingCreate, movie_id:int, user_id:int|None=None, settings=None) -> dict:
+    if (await db.execute(rating_aggregate_update(movie_id, ratingPayload.rating))).rowcount == 0:
+        await db.rollback()
+        logger.warning("Movie is not found")
+        raise HTTPException(status_code=404, detail="Movie not found")
+    statement = rating_insert(dialect_name(db), movie_id, user_id, ratingPayload.rating)
+    db_rating = (await db.execute(statement.on_conflict_do_nothing(index_elements=RATING_KEY))).mappings().first()
+    if db_rating is None:
+        await db.rollback()
+        logger.warning("This movie has already been rated")
+        raise HTTPException(status_code=400, detail="You have already rated this movie")
+    await db.execute(ranking_refresh(dialect_name(db), movie_id, settings=settings))
+    await db.commit()
+    invalidate_movie_detail(movie_id)
+    return dict(db_rating)
+
+
+async def update_rating(db:AsyncSession, ratingPayload:RatingCreate, movie_id:int, user_id:int|None=None, settings=None) -> dict:
+    if (await db.execute(touch_movie(movie_id))).rowcount == 0:
+        await db.rollback()
+        logger.warning("Movie is not found")
+        raise HTTPException(status_code=404, detail="Movie not found")
+    await db.execute(rating_change_update(movie_id, user_id, ratingPayload.rating))
+    db_rating = (await db.execute(rating_upsert(dialect_name(db), movie_id, user_id, ratingPayload.rating))).mappings().one()
+    await db.execute(ranking_refresh(dialect_name(db), movie_id, settings=settings))
+    await db.commit()
+    invalidate_movie_detail(movie_id)
+    return dict(db_rating)
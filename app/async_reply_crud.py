@@ -0,0 +1,30 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import invalidate_movie_detail
+from app.crud import touch_movie
+from app.models import Reply as ReplyModel
+from app.reply_crud import reply_listing_query
+from app.schemas import ReplyCreate
+from app.log import get_logger
+
+logger = get_logger("async_reply_crud")
+
+
+async def create_reply(db:AsyncSession, reply_payload:ReplyCreate, comment_id:int, movie_id:int|None=None, user_id:int|None=None):
+    db_reply = ReplyModel(
+        **reply_payload.model_dump(),
+        comment_id=comment_id,
+        user_id=user_id,
+    )
+    db.add(db_reply)
+    if movie_id is not None:
+        await db.execute(touch_movie(movie_id))
+    await db.commit()
+    if movie_id is not None:
+        invalidate_movie_detail(movie_id)
+    await db.refresh(db_reply)
+    return db_reply
+
+
+async def get_replies(db:AsyncSession, comment_id:int, skip:int=0, limit:int=10, after:int|None=None):
+    return (await db.scalars(reply_listing_query(comment_id, after).offset(skip).limit(limit))).all()
@@ -1,15 +1,24 @@
+import asyncio
+import hashlib
 import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event
 from sqlalchemy.orm import Session
-from jose import jwt, JWTError
-from passlib.context import CryptContext
 from dotenv import load_dotenv
 
-from app.schemas import User as UserSchema, UserCreate
+from app.schemas import CurrentUser, User as UserSchema, UserCreate
 from app.models import User as UserModel
+from app.cache import MISSING, LRUCache
+from app.config import get_settings
 from app.database import get_db
 from app.log import get_logger
 
@@ -18,7 +27,6 @@ load_dotenv()
 logger = get_logger("auth")
 
 
-pwd_context = CryptContext(schemes=["bcrypt"])
 oath2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
@@ -36,20 +44,64 @@ def get_user_by_username(username:str, db:Session):
     return db_user
 
 
-def authenticate_user(username:str, password:str, db:Session):
-    db_user = get_user_by_username(username, db)
-    if not db_user or not  pwd_context.verify(password, db_user.hashed_password):
-        logger.warning("Invalid username or password")
-        return False
-    return db_user
+@lru_cache
+def password_context(rounds:int):
+    """passlib/bcrypt are imported on the first signup or login, not at startup."""
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+
+
+def build_password_hasher(settings) -> ThreadPoolExecutor:
+    # bcrypt runs on its own small pool, sized apart from the request threadpool,
+    # so a burst of signups or logins queues here instead of starving other routes.
+    return ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="password-hash")
+
+
+# Rebuilt from the app's settings by ``configure_auth`` in the lifespan.
+bcrypt_rounds = get_settings().bcrypt_rounds
+password_hasher = build_password_hasher(get_settings())
+
+
+def get_password_context():
+    return password_context(bcrypt_rounds)
+
+
+async def hash_password_async(password:str) -> str:
+    return await asyncio.wrap_future(password_hasher.submit(get_password_context().hash, password))
+
 
+async def verify_password_async(password:str, hashed_password:str) -> tuple[bool, str | None]:
+    """Check ``password``; the second item is a replacement hash when the stored one is outdated."""
+    return await asyncio.wrap_future(password_hasher.submit(get_password_context().verify_and_update, password, hashed_password))
 
 
+def update_password_hash(db_user:UserModel, new_hash:str, db:Session):
+    db_user.hashed_password = new_hash
+    db.commit()
+    logger.info("Password hash for user %s upgraded", db_user.username)
+
 
+async def authenticate_user_async(username:str, password:str, db:Session):
+    """Look up ``username`` and check its password, for async handlers holding a blocking Session.
 
+    Queries run on the request threadpool and bcrypt on ``password_hasher``, so
+    no request thread is held while a hash is being checked.
+    """
+    db_user = await run_in_threadpool(get_user_by_username, username, db)
+    if not db_user:
+        logger.warning("Invalid username or password")
+        return False
+    valid, new_hash = await verify_password_async(password, db_user.hashed_password)
+    if not valid:
+        logger.warning("Invalid username or password")
+        return False
+    if new_hash:
+        await run_in_threadpool(update_password_hash, db_user, new_hash, db)
+    return db_user
 
-def create_user(user: UserCreate, db:Session):
-    hashed_password = pwd_context.hash(user.password)
+
+def save_user(user: UserCreate, hashed_password:str, db:Session):
     db_user = UserModel(username=user.username, email=user.email, hashed_password=hashed_password)
     db.add(db_user)
     db.commit()
@@ -57,9 +109,16 @@ def create_user(user: UserCreate, db:Session):
     return db_user
 
 
+async def create_user_async(user: UserCreate, db:Session):
+    hashed_password = await hash_password_async(user.password)
+    return await run_in_threadpool(save_user, user, hashed_password, db)
+
+
 
-def create_access_token(username:str, expire_delta:timedelta|None = None):
+def create_access_token(username:str, expire_delta:timedelta|None = None, user_id:int|None = None):
     to_encode = {"sub":username}
+    if user_id is not None:
+        to_encode["uid"] = user_id
     if expire_delta:
         logger.error("Token has expired")
         expire = datetime.utcnow() + timedelta(seconds=expire_delta)
@@ -67,28 +126,116 @@ def create_access_token(username:str, expire_delta:timedelta|None = None):
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)   
     to_encode.update({"exp": expire})
     logger.info("Token has been created")  
+    from jose import jwt
+
     return jwt.encode(to_encode, SECRET_KEY, ALGORITHM)
 
 
-def get_current_user(db:Session =Depends(get_db), token:str= Depends(oath2_scheme)):
-    credentials_exception = HTTPException(
+class TokenCache:
+    """Users resolved from verified access tokens.
+
+    Entries are keyed by a hash of the token and expire with the token's ``exp``
+    claim. Changing or deleting a user bumps that user's generation, which
+    invalidates every token cached for them without having to track the keys.
+    """
+
+    def __init__(self, maxsize:int):
+        self.resize(maxsize)
+        self._generations = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def resize(self, maxsize:int):
+        """Start over with room for ``maxsize`` tokens; the entries cached so far are dropped."""
+        self._entries = LRUCache(maxsize=maxsize, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+    @staticmethod
+    def key(token:str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token:str) -> CurrentUser | None:
+        entry = self._entries.get(self.key(token))
+        if entry is MISSING:
+            return None
+        user, generation = entry
+        if generation != self._generations[user.id]:
+            return None
+        return user
+
+    def set(self, token:str, db_user:UserModel, expires_at:float) -> CurrentUser:
+        user = CurrentUser.model_validate(db_user)
+        ttl = expires_at - time.time()
+        if ttl > 0:
+            with self._lock:
+                generation = self._generations[user.id]
+            self._entries.set(self.key(token), (user, generation), ttl=ttl)
+        return user
+
+    def invalidate_user(self, user_id:int):
+        with self._lock:
+            self._generations[user_id] += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return self._entries.stats()
+
+
+token_cache = TokenCache(maxsize=get_settings().token_cache_max_entries)
+
+
+def configure_auth(settings):
+    """Apply the app's bcrypt cost, hashing pool size and token cache size; run by the lifespan."""
+    global bcrypt_rounds, password_hasher
+    previous, password_hasher = password_hasher, build_password_hasher(settings)
+    previous.shutdown(wait=False)
+    bcrypt_rounds = settings.bcrypt_rounds
+    token_cache.resize(settings.token_cache_max_entries)
+
+
+@event.listens_for(UserModel, "after_update")
+@event.listens_for(UserModel, "after_delete")
+def invalidate_cached_tokens(mapper, connection, target):
+    token_cache.invalidate_user(target.id)
+
+
+def credentials_error():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    logger.info("Attempting to decode access token")
+
+
+def verify_access_token(token:str) -> dict:
+    logger.debug("Attempting to decode access token")
+    from jose import JWTError, jwt
+
     try:
-        logger.info("Access token has been decoded")  
         payload = jwt.decode(token,SECRET_KEY,ALGORITHM)
-        username:str = payload.get('sub')
-        if username is None:
-            logger.error("invalid credentials")
-            raise credentials_exception
     except JWTError:
         logger.exception("JWT Error")
-        raise credentials_exception
-    user = get_user_by_username(username, db)
-    if user is None:
+        raise credentials_error()
+    if payload.get('sub') is None:
+        logger.error("invalid credentials")
+        raise credentials_error()
+    return payload
+
+
+def user_matches_claims(db_user:UserModel|None, payload:dict) -> bool:
+    return db_user is not None and db_user.username == payload["sub"]
+
+
+def get_current_user(db:Session =Depends(get_db), token:str= Depends(oath2_scheme)):
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+    payload = verify_access_token(token)
+    if payload.get("uid") is not None:
+        db_user = db.get(UserModel, payload["uid"])
+    else:
+        db_user = get_user_by_username(payload["sub"], db)
+    if not user_matches_claims(db_user, payload):
         logger.error("User not found")
-        raise credentials_exception
-    return user
+        raise credentials_error()
+    return token_cache.set(token, db_user, payload["exp"])
@@ -0,0 +1,53 @@
+from fastapi import HTTPException, Query, status
+
+from app.cache import MISSING, get_cache_backend, movie_detail_key
+from app.fieldsets import split
+from app.schemas import MAX_BATCH_IDS, MovieBatchRequest
+
+
+def movie_batch_params(
+    ids: str = Query(..., description=f"Comma-separated movie ids, at most {MAX_BATCH_IDS}"),
+    comment_counts: bool = Query(False, description="Add a comment_count to each movie"),
+) -> MovieBatchRequest:
+    try:
+        movie_ids = [int(part) for part in split(ids)]
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ids must be comma-separated integers")
+    if not movie_ids or len(movie_ids) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Between 1 and {MAX_BATCH_IDS} ids may be requested at once",
+        )
+    return MovieBatchRequest(ids=movie_ids, comment_counts=comment_counts)
+
+
+def cached_movie_details(movie_ids:list[int]) -> tuple[dict, list[int]]:
+    """Detail payloads already in the cache, and the ids that still have to be loaded."""
+    cache = get_cache_backend()
+    found, uncached = {}, []
+    for movie_id in movie_ids:
+        cached = cache.get(movie_detail_key(movie_id))
+        if cached is MISSING:
+            uncached.append(movie_id)
+        else:
+            found[movie_id] = cached
+    return found, uncached
+
+
+def movie_batch(movie_ids:list[int], found:dict, comment_counts:bool=False) -> dict:
+    """The found movies in request order, and the ids that matched no movie.
+
+    Each item is the cached detail payload of ``GET /movie/{movie_id}`` plus
+    its ``id``, which the detail schema leaves to the URL; the cached dict
+    itself is copied, never modified.
+    """
+    data = []
+    for movie_id in movie_ids:
+        payload = found.get(movie_id)
+        if payload is None:
+            continue
+        item = {"id": movie_id, **payload}
+        if comment_counts:
+            item["comment_count"] = payload["comment_count"]
+        data.append(item)
+    return {"data": data, "missing": [movie_id for movie_id in movie_ids if movie_id not in found]}
@@ -0,0 +1,218 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models import Movie as MovieModel
+from app.search import bulk_index_statement
+from app.schemas import MovieCreate
+from app.log import get_logger
+
+logger = get_logger("bulk_import")
+
+
+MAX_REPORTED_ERRORS = 100
+MAX_CSV_RECORD_CHARS = 64 * 1024
+MAX_LINE_BYTES = 64 * 1024
+COPY_COLUMNS = ("title", "description", "duration", "user_id", "release_date", "updated_at")
+
+
+class ImportReport:
+    """Running totals for an import; only the first ``MAX_REPORTED_ERRORS`` failures are kept."""
+
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, row:int, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "errors": errors})
+
+    def as_dict(self) -> dict:
+        return {
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def decode_line(line) -> str|ValueError:
+    if len(line) > MAX_LINE_BYTES:
+        return ValueError(f"Line exceeds {MAX_LINE_BYTES} bytes")
+    return line.decode("utf-8", errors="replace").rstrip("\r")
+
+
+async def iter_lines(chunks):
+    """Yield decoded lines from an async iterator of byte chunks, holding at most one partial line.
+
+    A line longer than ``MAX_LINE_BYTES`` is yielded once as a ``ValueError``
+    and the rest of it is discarded up to the next newline, so the partial line
+    never grows past the cap.
+    """
+    pending = bytearray()
+    overflow = False
+    async for chunk in chunks:
+        *lines, tail = chunk.split(b"\n")
+        for line in lines:
+            if overflow:
+                overflow = False
+            else:
+                pending += line
+                yield decode_line(pending)
+            pending.clear()
+        if overflow:
+            continue
+        pending += tail
+        if len(pending) > MAX_LINE_BYTES:
+            yield decode_line(pending)
+            pending.clear()
+            overflow = True
+    if pending:
+        yield decode_line(pending)
+
+
+async def iter_ndjson_records(lines):
+    row = 0
+    async for line in lines:
+        if isinstance(line, Exception):
+            row += 1
+            yield row, line
+            continue
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            yield row, json.loads(line)
+        except ValueError as exc:
+            yield row, exc
+
+
+async def iter_csv_records(lines):
+    """Yield ``(row, dict)`` per CSV record, or ``(row, error)`` for a record that cannot be parsed.
+
+    A quoted field may span lines, so lines are joined until the quotes
+    balance; a record still open after ``MAX_CSV_RECORD_CHARS``, or at the end
+    of the stream, is reported as an error rather than buffered without bound
+    or dropped.
+    """
+    header = None
+    row = 0
+    buffered = ""
+    async for line in lines:
+        if isinstance(line, Exception):
+            buffered = ""
+            row += 1
+            yield row, line
+            continue
+        buffered = f"{buffered}\n{line}" if buffered else line
+        if buffered.count('"') % 2:
+            if len(buffered) > MAX_CSV_RECORD_CHARS:
+                buffered = ""
+                row += 1
+                yield row, ValueError(f"Unterminated quoted field; record exceeds {MAX_CSV_RECORD_CHARS} characters")
+            continue
+        record, buffered = buffered, ""
+        if not record.strip():
+            continue
+        values = next(csv.reader(io.StringIO(record)))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, ValueError(f"Expected {len(header)} columns, got {len(values)}")
+        else:
+            yield row, dict(zip(header, values))
+    if buffered:
+        row += 1
+        yield row, ValueError("Unterminated quoted field at end of input")
+
+
+def resolve_format(fmt:str|None, content_type:str|None) -> str:
+    if fmt:
+        return fmt
+    return "csv" if content_type and "csv" in content_type else "ndjson"
+
+
+def record_iterator(chunks, fmt:str):
+    lines = iter_lines(chunks)
+    return iter_csv_records(lines) if fmt == "csv" else iter_ndjson_records(lines)
+
+
+async def import_movies(chunks, fmt:str, insert_batch, batch_size:int, user_id:int|None=None) -> ImportReport:
+    """Validate streamed records against ``MovieCreate`` and hand them to ``insert_batch`` in batches.
+
+    Only the current batch is held in memory, so an upload of any size runs in
+    constant space.
+    """
+    report = ImportReport()
+    batch = []
+    async for row, record in record_iterator(chunks, fmt):
+        if isinstance(record, Exception):
+            report.add_error(row, [{"msg": str(record)}])
+            continue
+        try:
+            movie = MovieCreate.model_validate(record)
+        except ValidationError as exc:
+            report.add_error(row, exc.errors(include_url=False, include_context=False))
+            continue
+        batch.append({**movie.model_dump(), "user_id": user_id})
+        if len(batch) >= batch_size:
+            await insert_batch(batch)
+            report.inserted += len(batch)
+            batch = []
+    if batch:
+        await insert_batch(batch)
+        report.inserted += len(batch)
+    logger.info("Imported %s movies, %s rows rejected", report.inserted, report.failed)
+    return report
+
+
+def copy_movie_batch(db:Session, rows:list[dict]):
+    """Load a batch through Postgres ``COPY ... FROM STDIN``."""
+    now = datetime.utcnow()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row["title"], row["description"], row["duration"], row["user_id"], now, now])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY movies ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def returning_insert():
+    # Returning the indexed text alongside the id keeps the statement a single
+    # batched INSERT; asking for rows in parameter order would split it per row.
+    return insert(MovieModel).returning(MovieModel.id, MovieModel.title, MovieModel.description)
+
+
+def insert_movie_batch(db:Session, rows:list[dict]):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        copy_movie_batch(db, rows)
+    else:
+        inserted = db.execute(returning_insert(), rows).mappings().all()
+        index = bulk_index_statement(dialect, inserted)
+        if index is not None:
+            db.execute(*index)
+    db.commit()
+
+
+async def insert_movie_batch_async(db:AsyncSession, rows:list[dict]):
+    dialect = db.get_bind().dialect.name
+    inserted = (await db.execute(returning_insert(), rows)).mappings().all()
+    index = bulk_index_statement(dialect, inserted)
+    if index is not None:
+        await db.execute(*index)
+    await db.commit()
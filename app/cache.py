@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+
+from app.config import get_settings
+
+
+MISSING = object()
+
+
+class CacheBackend:
+    """Interface for movie cache storage.
+
+    ``get`` returns ``MISSING`` when a key is absent or expired, and ``set`` takes
+    an optional per-entry TTL overriding the backend default. Backends keep their
+    own hit/miss counters and report them through ``stats``.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl:float|None=None):
+        raise NotImplementedError
+
+    def delete(self, *keys):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """In-process cache bounded by entry count and per-entry TTL."""
+
+    def __init__(self, maxsize:int=1024, ttl:float=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl:float|None=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": type(self).__name__,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def build_cache_backend(settings) -> CacheBackend:
+    return LRUCache(maxsize=settings.cache_max_entries, ttl=settings.cache_ttl_seconds)
+
+
+movie_cache: CacheBackend = build_cache_backend(get_settings())
+
+
+def set_cache_backend(backend:CacheBackend):
+    global movie_cache
+    movie_cache = backend
+
+
+def get_cache_backend() -> CacheBackend:
+    return movie_cache
+
+
+def movie_detail_key(movie_id:int) -> str:
+    return f"movie:{movie_id}"
+
+
+def movie_exists_key(movie_id:int) -> str:
+    return f"movie-exists:{movie_id}"
+
+
+def invalidate_movie_detail(movie_id:int):
+    """Drop the cached payload after a write that changes what the movie renders (comments, replies, ratings)."""
+    movie_cache.delete(movie_detail_key(movie_id))
+
+
+def invalidate_movie(movie_id:int):
+    """Drop everything cached for a movie that was edited or deleted."""
+    movie_cache.delete(movie_detail_key(movie_id), movie_exists_key(movie_id))
@@ -1,10 +1,13 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.models import Comment as CommentModel
 from app.schemas import Comment as CommentSchema, CommentCreate, User as UserSchema
-from app.crud import get_movies_by_id
+from app.cache import invalidate_movie_detail
+from app.crud import movie_exists, touch_movie
+from app.threads import comment_threads, reply_preview_query
 from app.log import get_logger
 
 
@@ -14,8 +17,7 @@ logger = get_logger("comment_crud")
 
 
 def create_movie_comment(movie_id:int, db:Session, comment:CommentCreate, user_id:int|None=None):
-    db_movie = get_movies_by_id(db, movie_id)
-    if not db_movie:
+    if not movie_exists(db, movie_id):
         logger.warning("Movie is not found")
         raise HTTPException(status_code=404, detail="Movie not found")
     db_comment = CommentModel (
@@ -24,19 +26,29 @@ def create_movie_comment(movie_id:int, db:Session, comment:CommentCreate, user_i
         user_id=user_id
     )
     db.add(db_comment)
+    db.execute(touch_movie(movie_id))
     db.commit()
+    invalidate_movie_detail(movie_id)
     db.refresh(db_comment)
     return db_comment
 
 
-def get_comments(db:Session, movie_id:int, skip:int=0, limit:int=10):
-    db_movie = get_movies_by_id(db, movie_id)
-    if not db_movie:
+def get_comments(db:Session, movie_id:int, skip:int=0, limit:int=10, after:int|None=None, reply_limit:int=3):
+    if not movie_exists(db, movie_id):
         logger.warning("Movie is not found")
         raise HTTPException(status_code=404, detail="Movie not found")
-    db_comment = db.query(CommentModel).filter(CommentModel.movie_id == movie_id).offset(skip).limit(limit).all()
-    return db_comment
-
+    db_comments = db.scalars(comment_listing_query(movie_id, after).offset(skip).limit(limit)).all()
+    if not db_comments:
+        return []
+    preview = db.execute(reply_preview_query([c.id for c in db_comments], reply_limit)).all()
+    return comment_threads(db_comments, preview, reply_limit)
+
+
+def comment_listing_query(movie_id:int, after:int|None=None):
+    query = select(CommentModel).where(CommentModel.movie_id == movie_id)
+    if after is not None:
+        query = query.where(CommentModel.id > after)
+    return query.order_by(CommentModel.id)
 
 
 def get_comment_by_id(db:Session, comment_id:int):
@@ -0,0 +1,60 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response, status
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag over the values that determine a representation."""
+    digest = hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def version_validators(versions, *params):
+    """ETag and Last-Modified for a representation built from ``(id, updated_at)`` versions."""
+    versions = list(versions)
+    etag = make_etag(*params, *(f"{id}@{updated_at.isoformat()}" for id, updated_at in versions))
+    last_modified = max((updated_at for _, updated_at in versions), default=None)
+    return etag, last_modified
+
+
+def http_date(value:datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def is_not_modified(request:Request, etag:str, last_modified:datetime|None) -> bool:
+    """Evaluate If-None-Match, falling back to If-Modified-Since as RFC 9110 prescribes."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def set_validators(response:Response, etag:str, last_modified:datetime|None):
+    response.headers["ETag"] = etag
+    if last_modified is not None:
+        response.headers["Last-Modified"] = http_date(last_modified)
+
+
+def not_modified_response(request:Request, etag:str, last_modified:datetime|None) -> Response | None:
+    """Return a bodiless 304 when the client's copy is current, ``None`` otherwise."""
+    if not is_not_modified(request, etag, last_modified):
+        return None
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_validators(response, etag, last_modified)
+    return response
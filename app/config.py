@@ -0,0 +1,64 @@
+from functools import lru_cache
+from typing import Literal
+
+from fastapi import Request
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    db_url: str | None = None
+    async_db: bool = False
+    async_db_url: str | None = None
+    cache_max_entries: int = 1024
+    cache_ttl_seconds: float = 60.0
+    token_cache_max_entries: int = 4096
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 2
+    import_batch_size: int = 1000
+    export_batch_size: int = 1000
+    reply_preview_limit: int = 3
+    comment_preview_limit: int = 10
+    ranking_min_votes: int = 10
+    ranking_prior_mean: float = 5.0
+    rating_write_behind: bool = False
+    rating_durability: Literal["committed", "accepted"] = "committed"
+    rating_buffer_size: int = 10000
+    rating_flush_size: int = 500
+    rating_flush_interval: float = 0.25
+    rating_commit_timeout: float = 5.0
+    log_level: str = "INFO"
+    log_format: Literal["text", "json"] = "text"
+    log_file: str | None = "app.log"
+    log_queue_size: int = 10000
+    log_sample_rates: dict[str, float] = {}
+    metrics_enabled: bool = True
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 3.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = False
+    db_statement_timeout_ms: int | None = 10000
+    db_replica_urls: list[str] = []
+    replica_check_interval: float = 5.0
+    read_your_writes_seconds: float = 5.0
+    concurrency_limit_enabled: bool = True
+    concurrency_initial: dict[str, int] = {"read": 32, "write": 16, "auth": 4}
+    concurrency_max: dict[str, int] = {"read": 256, "write": 64, "auth": 16}
+    concurrency_min: int = 1
+    concurrency_queue_size: int = 64
+    concurrency_queue_timeout: float = 1.0
+    concurrency_latency_target: dict[str, float] = {"read": 0.25, "write": 0.5, "auth": 1.0}
+    rate_limit_per_second: float = 0.0
+    rate_limit_burst: int = 20
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+
+@lru_cache
+def get_settings() -> Settings:
+    return Settings()
+
+
+def get_app_settings(request:Request) -> Settings:
+    """Settings of the app serving the request, as passed to ``create_app``."""
+    return getattr(request.app.state, "settings", None) or get_settings()
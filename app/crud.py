@@ -1,7 +1,8 @@
+from datetime import datetime
 from typing import List
 
 from fastapi import Depends, HTTPException
-from fastapi.encoders import jsonable_encoder
+from sqlalchemy import func, select, update
 from sqlalchemy.orm import Session
 
 from app.schemas import(
@@ -11,55 +12,216 @@ from app.schemas import(
 from app.models import (
     Movie as MovieModel,
     Rating as RatingModel,
+    Comment as CommentModel,
 )
+from app.cache import (
+    MISSING,
+    get_cache_backend,
+    invalidate_movie,
+    movie_detail_key,
+    movie_exists_key,
+)
+from app.batch import cached_movie_details, movie_batch
+from app.config import get_settings
+from app.database import fills_cache
+from app.rankings import ranking_removal, top_movies_query
+from app.search import index_statements, search_query, unindex_statements
+from app.threads import NO_THREADS, comment_preview_query, movie_threads, previewed_comment_ids, reply_preview_query
 from app.log import get_logger
 
 
 logger = get_logger("crud")
 
-def get_movies(db:Session, skip:int=0, limit:int=10):
-    db_movies = db.query(MovieModel).offset(skip).limit(limit).all()
-    movies = []
-    for db_movie in db_movies:
-        ratings = db.query(RatingModel).filter(RatingModel.movie_id == db_movie.id).all()
-        average_rating = sum(rating.rating for rating in ratings) / len(ratings) if ratings else 0
-        logger.info(" Average rating for db_movies")
-        movie_data = {
-            **jsonable_encoder(db_movie),
-            "average_rating": average_rating,
-            "comments": db_movie.comments,
-        }
-        movies.append(movie_data)
-
-
-    return movies
-    
-    
-def get_movies_by_id( db:Session,movie_id:int):
-    db_movies = db.query(MovieModel).filter(MovieModel.id == movie_id).first()
+# Movie columns of the full representation; the comment fields come from the preview.
+MOVIE_COLUMNS = ("id", *(name for name in MovieSchema.model_fields if name not in NO_THREADS))
+
+
+def movie_listing_query(fieldset=None):
+    """Select movies in id order, narrowed to the columns of ``fieldset`` when given.
+
+    The average rating is read from the denormalized ``rating_count``/``rating_sum``
+    columns. Comments are not loaded here; see ``load_movie_threads``.
+    """
+    query = select(MovieModel).order_by(MovieModel.id)
+    if fieldset is not None:
+        return query.options(*fieldset.load_options())
+    return query
+
+
+def movie_page_query(skip:int=0, limit:int=10, after:int|None=None, fieldset=None):
+    query = movie_listing_query(fieldset)
+    if after is not None:
+        query = query.where(MovieModel.id > after)
+    return query.offset(skip).limit(limit)
+
+
+def load_movie_threads(db:Session, movie_ids:list[int], settings=None) -> dict[int, dict]:
+    """Comment previews of ``movie_ids`` in two windowed queries, however long their threads are.
+
+    Each movie embeds its first ``COMMENT_PREVIEW_LIMIT`` comments, and each of
+    those its first ``REPLY_PREVIEW_LIMIT`` replies, as on the comments endpoint.
+    """
+    settings = settings or get_settings()
+    if not movie_ids:
+        return {}
+    per_movie, per_comment = settings.comment_preview_limit, settings.reply_preview_limit
+    comment_rows = db.execute(comment_preview_query(movie_ids, per_movie)).all()
+    comment_ids = previewed_comment_ids(comment_rows, per_movie)
+    reply_rows = db.execute(reply_preview_query(comment_ids, per_comment)).all() if comment_ids else []
+    return movie_threads(comment_rows, reply_rows, per_movie, per_comment)
+
+
+def with_threads(db_movie:MovieModel, threads:dict, fields=MOVIE_COLUMNS) -> dict:
+    """A movie's ``fields`` plus its comment preview, ready for the ``Movie`` schema."""
+    return {**{name: getattr(db_movie, name) for name in fields}, **threads.get(db_movie.id, NO_THREADS)}
+
+
+def threaded_movies(db_movies, threads:dict, fieldset=None) -> list:
+    return [with_threads(db_movie, threads, fieldset.fields if fieldset else MOVIE_COLUMNS) for db_movie in db_movies]
+
+
+def embeds_comments(fieldset) -> bool:
+    return fieldset is None or fieldset.comments
+
+
+def get_movies(db:Session, skip:int=0, limit:int=10, after:int|None=None, fieldset=None, settings=None):
+    db_movies = db.scalars(movie_page_query(skip, limit, after, fieldset)).all()
+    logger.info(" Average rating for db_movies")
+    if not embeds_comments(fieldset):
+        return db_movies
+    return threaded_movies(db_movies, load_movie_threads(db, [m.id for m in db_movies], settings), fieldset)
+
+
+def movie_detail(db_movie:MovieModel, threads:dict) -> dict:
+    """Serialize a movie once into the plain payload that gets cached."""
+    return MovieSchema.model_validate(with_threads(db_movie, threads)).model_dump()
+
+
+def get_movies_by_id( db:Session,movie_id:int, settings=None):
+    cache = get_cache_backend()
+    cached = cache.get(movie_detail_key(movie_id))
+    if cached is not MISSING:
+        return cached
+    db_movies = db.scalars(movie_listing_query().where(MovieModel.id == movie_id)).first()
     if not db_movies:
         logger.warning("Movie is not found")
         raise HTTPException(status_code=404, detail="Movie not found")
-    ratings = db.query(RatingModel).filter(RatingModel.movie_id == movie_id).all()
-    average_rating = sum(rating.rating for rating in ratings) / len(ratings) if ratings else 0
-    movie_data = {
-            **jsonable_encoder(db_movies),
-            "average_rating": average_rating,
-            "comments": db_movies.comments,
-        }
-    return movie_data
+    payload = movie_detail(db_movies, load_movie_threads(db, [movie_id], settings))
+    if fills_cache(db):
+        cache.set(movie_detail_key(movie_id), payload)
+    return payload
+
+
+def movie_exists(db:Session, movie_id:int) -> bool:
+    cache = get_cache_backend()
+    if cache.get(movie_exists_key(movie_id)) is True:
+        return True
+    exists = db.scalar(select(MovieModel.id).where(MovieModel.id == movie_id)) is not None
+    if exists and fills_cache(db):
+        cache.set(movie_exists_key(movie_id), True)
+    return exists
 
     
+def movie_export_query():
+    """Flat catalog rows with rating aggregates and comment counts, in id order."""
+    comment_count = (
+        select(func.count(CommentModel.id))
+        .where(CommentModel.movie_id == MovieModel.id)
+        .scalar_subquery()
+    )
+    return select(
+        MovieModel.id,
+        MovieModel.title,
+        MovieModel.description,
+        MovieModel.duration,
+        MovieModel.release_date,
+        MovieModel.updated_at,
+        MovieModel.user_id,
+        MovieModel.average_rating.label("average_rating"),
+        MovieModel.rating_count,
+        comment_count.label("comment_count"),
+    ).order_by(MovieModel.id)
+
+
+def movie_versions_query(skip:int=0, limit:int=10, after:int|None=None):
+    query = select(MovieModel.id, MovieModel.updated_at).order_by(MovieModel.id)
+    if after is not None:
+        query = query.where(MovieModel.id > after)
+    return query.offset(skip).limit(limit)
+
+
+def get_movie_page_versions(db:Session, skip:int=0, limit:int=10, after:int|None=None):
+    return db.execute(movie_versions_query(skip, limit, after)).all()
+
+
+def get_movies_by_ids(db:Session, movie_ids:list[int], comment_counts:bool=False, settings=None) -> dict:
+    """Detail payloads of many movies, with the movie and comment-preview queries run once for all uncached ids."""
+    movie_ids = list(dict.fromkeys(movie_ids))
+    found, uncached = cached_movie_details(movie_ids)
+    if uncached:
+        cache = get_cache_backend()
+        db_movies = db.scalars(movie_listing_query().where(MovieModel.id.in_(uncached))).all()
+        threads = load_movie_threads(db, [db_movie.id for db_movie in db_movies], settings)
+        for db_movie in db_movies:
+            found[db_movie.id] = movie_detail(db_movie, threads)
+            if fills_cache(db):
+                cache.set(movie_detail_key(db_movie.id), found[db_movie.id])
+    return movie_batch(movie_ids, found, comment_counts)
+
+
+def get_movie_version(db:Session, movie_id:int) -> datetime:
+    """``updated_at`` of a movie, read from the cached payload when there is one."""
+    cached = get_cache_backend().get(movie_detail_key(movie_id))
+    if cached is not MISSING:
+        return cached["updated_at"]
+    updated_at = db.scalar(select(MovieModel.updated_at).where(MovieModel.id == movie_id))
+    if updated_at is None:
+        logger.warning("Movie is not found")
+        raise HTTPException(status_code=404, detail="Movie not found")
+    return updated_at
+
+
+def touch_movie(movie_id:int):
+    """UPDATE bumping a movie's ``updated_at`` after a comment or reply is added."""
+    return update(MovieModel).where(MovieModel.id == movie_id).values(updated_at=datetime.utcnow())
+
+
 def get_movies_by_id_and_user_id( db:Session, movie_id:int, user_id:int):
     return db.query(MovieModel).filter(MovieModel.id == movie_id, MovieModel.user_id == user_id).first()
 
 
+def dialect_name(db) -> str:
+    return db.get_bind().dialect.name
+
+
+def get_top_movies(db:Session, skip:int=0, limit:int=10):
+    return db.execute(top_movies_query(skip, limit)).all()
+
+
+def search_movies(db:Session, q:str, skip:int=0, limit:int=10, fieldset=None, settings=None):
+    statement = search_query(dialect_name(db), q, skip, limit)
+    movie_ids = db.scalars(statement).all() if statement is not None else []
+    if not movie_ids:
+        return []
+    db_movies = {
+        db_movie.id: db_movie
+        for db_movie in db.scalars(movie_listing_query(fieldset).where(MovieModel.id.in_(movie_ids)))
+    }
+    db_movies = [db_movies[movie_id] for movie_id in movie_ids if movie_id in db_movies]
+    if not embeds_comments(fieldset):
+        return db_movies
+    return threaded_movies(db_movies, load_movie_threads(db, [m.id for m in db_movies], settings), fieldset)
+
+
 def create_movies(db: Session, movie_paylaod:MovieCreate, user_id:int|None=None):
     db_movie = MovieModel (
         **movie_paylaod.model_dump(),
         user_id=user_id
     )
     db.add(db_movie)
+    db.flush()
+    for statement in index_statements(dialect_name(db), db_movie.id, db_movie.title, db_movie.description):
+        db.execute(statement)
     db.commit()
     db.refresh(db_movie)
     return db_movie
@@ -76,7 +238,10 @@ def edit_movie(db: Session, movie_id:int, movie_paylad:MovieUpate, user_id:int|N
         setattr(movie, k,v)
 
     db.add(movie)
+    for statement in index_statements(dialect_name(db), movie.id, movie.title, movie.description):
+        db.execute(statement)
     db.commit()
+    invalidate_movie(movie_id)
     db.refresh(movie)
     return movie
 
@@ -87,7 +252,11 @@ def delete_movie(db: Session, movie_id: int, user_id: int | None = None):
         logger.warning("Movie not found or User cannot fetch this movie")
         return None
     db.query(RatingModel).filter(RatingModel.movie_id == movie_id).delete(synchronize_session=False)
+    db.execute(ranking_removal(movie_id))
     db.delete(movie)
+    for statement in unindex_statements(dialect_name(db), movie_id):
+        db.execute(statement)
     db.commit()
+    invalidate_movie(movie_id)
 
  
\ No newline at end of file
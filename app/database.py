@@ -1,29 +1,200 @@
-import os 
+import time
 
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import Pool
 
+from app.config import get_settings
+from app.metrics import db_pool_timeouts, db_statement_timeouts, instrument_engine
 
 
-load_dotenv()
+STATEMENT_TIMEOUT_KEY = "statement_timeout_ms"
+STATEMENT_DEADLINE_KEY = "statement_deadline"
+RETRY_AFTER_SECONDS = "1"
+# Session.info flag of sessions bound to a read replica.
+REPLICA_SESSION = "replica"
 
 
-SQLALCHEMY_DATABASE_URL =  os.getenv("db_url")
+def pool_options(url:str, settings) -> dict:
+    """``create_engine`` pool arguments from the environment.
 
+    In-memory SQLite lives in a single connection, so it keeps SQLAlchemy's
+    default single-connection pool.
+    """
+    options = {"pool_pre_ping": settings.db_pool_pre_ping}
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return options
+    options.update(
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+    )
+    return options
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
 Base = declarative_base()
 
+engine = None
+# DB_STATEMENT_TIMEOUT_MS of the settings the engine was created from.
+statement_timeout_ms = None
+
+
+def init_engine(settings=None):
+    """Create the primary engine from ``settings`` and bind ``SessionLocal`` to it.
+
+    Called from the app's lifespan; creating an engine does not connect, the
+    pool opens connections on first checkout.
+    """
+    global engine, statement_timeout_ms
+    settings = settings or get_settings()
+    statement_timeout_ms = settings.db_statement_timeout_ms
+    engine = instrument_engine(create_engine(settings.db_url, **pool_options(settings.db_url, settings)))
+    SessionLocal.configure(bind=engine)
+    return engine
+
+
+def get_engine():
+    """The primary engine, created on first use outside the app (scripts, tests)."""
+    return engine if engine is not None else init_engine()
+
+
+def dispose_engine():
+    global engine
+    if engine is not None:
+        engine.dispose()
+        engine = None
+
+
+@event.listens_for(Session, "after_begin")
+def apply_statement_timeout(session, transaction, connection):
+    """Bound every statement of a request session by ``session.info["statement_timeout_ms"]``.
+
+    PostgreSQL gets ``SET LOCAL statement_timeout``, which ends with the
+    transaction. SQLite connections are marked instead, and each statement
+    they run gets a deadline that a progress handler checks; the mark and
+    deadline are removed on checkin.
+    """
+    timeout_ms = session.info.get(STATEMENT_TIMEOUT_KEY)
+    if not timeout_ms:
+        return
+    dialect = connection.dialect
+    if dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+    elif dialect.name == "sqlite" and (not dialect.is_async or STATEMENT_DEADLINE_KEY in connection.info):
+        connection.info[STATEMENT_TIMEOUT_KEY] = timeout_ms
+
+
+def install_statement_deadline(dbapi_connection, connection_record):
+    """Give an aiosqlite connection one progress handler reading a per-connection deadline.
+
+    aiosqlite runs SQLite on its own thread, so the handler cannot be swapped
+    per statement as on blocking connections; statements only move the
+    deadline it checks. Attached by ``init_async_engine``.
+    """
+    deadline = connection_record.info[STATEMENT_DEADLINE_KEY] = [None]
+    dbapi_connection.await_(dbapi_connection.driver_connection.set_progress_handler(
+        lambda: deadline[0] is not None and time.monotonic() > deadline[0], 1000,
+    ))
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_statement_deadline(conn, cursor, statement, parameters, context, executemany):
+    timeout_ms = conn.info.get(STATEMENT_TIMEOUT_KEY)
+    if timeout_ms:
+        deadline = time.monotonic() + timeout_ms / 1000
+        cell = conn.info.get(STATEMENT_DEADLINE_KEY)
+        if cell is not None:
+            cell[0] = deadline
+        else:
+            conn.connection.driver_connection.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+
+
+@event.listens_for(Pool, "checkin")
+def clear_statement_deadline(dbapi_connection, connection_record):
+    if not connection_record.info.pop(STATEMENT_TIMEOUT_KEY, None) or dbapi_connection is None:
+        return
+    cell = connection_record.info.get(STATEMENT_DEADLINE_KEY)
+    if cell is not None:
+        cell[0] = None
+    else:
+        dbapi_connection.set_progress_handler(None, 0)
+
+
+def dialect_insert(dialect:str):
+    """``insert`` of the given backend, for ``ON CONFLICT`` upserts."""
+    return postgresql.insert if dialect == "postgresql" else sqlite.insert
+
+
+def fills_cache(db:Session) -> bool:
+    """Only primary reads may fill the shared caches; a lagging replica would re-cache what a write just invalidated."""
+    return not db.info.get(REPLICA_SESSION, False)
+
+
+def with_statement_timeout(db:Session) -> Session:
+    timeout_ms = statement_timeout_ms if engine is not None else get_settings().db_statement_timeout_ms
+    if timeout_ms:
+        db.info[STATEMENT_TIMEOUT_KEY] = timeout_ms
+    return db
 
 
 def get_db():
-    db = SessionLocal()
+    get_engine()
+    db = with_statement_timeout(SessionLocal())
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def get_session_factory():
+    """Session factory for responses that outlive the request's ``get_db`` session, such as streams."""
+    get_engine()
+    return SessionLocal
+
+
+def pool_status(bind=None) -> dict:
+    pool = (bind or get_engine()).pool
+    stats = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            stats[name] = method()
+    timeout = getattr(pool, "_timeout", None)
+    if timeout is not None:
+        stats["timeout"] = timeout
+    return stats
+
+
+def is_statement_timeout(exc:OperationalError) -> bool:
+    """Whether ``exc`` is a statement cancelled by its timeout (PostgreSQL) or deadline (SQLite)."""
+    orig = exc.orig
+    return type(orig).__name__ in ("QueryCanceled", "QueryCanceledError") or str(orig) == "interrupted"
+
+
+def unavailable(detail:str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": detail},
+        headers={"Retry-After": RETRY_AFTER_SECONDS},
+    )
+
+
+async def pool_timeout_handler(request:Request, exc:PoolTimeoutError):
+    db_pool_timeouts.inc()
+    return unavailable("Database is busy, retry shortly")
+
+
+async def operational_error_handler(request:Request, exc:OperationalError):
+    if not is_statement_timeout(exc):
+        raise exc
+    db_statement_timeouts.inc()
+    return unavailable("Database statement timed out")
@@ -0,0 +1,60 @@
+import zlib
+
+import orjson
+
+from app.crud import movie_export_query
+from app.log import get_logger
+
+logger = get_logger("export")
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def encode_partition(rows) -> bytes:
+    return b"".join(orjson.dumps(row._asdict()) + b"\n" for row in rows)
+
+
+class Compressor:
+    """Incremental gzip framing for a chunked body; a no-op when compression is off."""
+
+    def __init__(self, enabled:bool):
+        self._zlib = zlib.compressobj(wbits=31) if enabled else None
+
+    def compress(self, chunk:bytes) -> bytes:
+        return self._zlib.compress(chunk) if self._zlib else chunk
+
+    def flush(self) -> bytes:
+        return self._zlib.flush() if self._zlib else b""
+
+
+def stream_movie_export(session_factory, batch_size:int, compress:bool=False):
+    """Yield the catalog as NDJSON, ``batch_size`` rows per server-side cursor fetch."""
+    compressor = Compressor(compress)
+    exported = 0
+    db = session_factory()
+    try:
+        result = db.execute(movie_export_query().execution_options(yield_per=batch_size))
+        for rows in result.partitions():
+            exported += len(rows)
+            chunk = compressor.compress(encode_partition(rows))
+            if chunk:
+                yield chunk
+        yield compressor.flush()
+    finally:
+        db.close()
+    logger.info("Exported %s movies", exported)
+
+
+async def stream_movie_export_async(session_factory, batch_size:int, compress:bool=False):
+    compressor = Compressor(compress)
+    exported = 0
+    async with session_factory() as db:
+        result = await db.stream(movie_export_query().execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            exported += len(rows)
+            chunk = compressor.compress(encode_partition(rows))
+            if chunk:
+                yield chunk
+        yield compressor.flush()
+    logger.info("Exported %s movies", exported)
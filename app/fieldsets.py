@@ -0,0 +1,87 @@
+from functools import lru_cache
+from typing import List, Literal, Optional
+
+from fastapi import HTTPException, Query, status
+from pydantic import ConfigDict, TypeAdapter, create_model
+from sqlalchemy.orm import load_only
+
+from app.models import Movie as MovieModel
+from app.schemas import Comment as CommentSchema, Movie as MovieSchema, MovieSummary
+
+
+# Public field name -> (annotation, columns that must be loaded for it).
+MOVIE_FIELDS = {
+    "id": (int, (MovieModel.id,)),
+    "title": (str, (MovieModel.title,)),
+    "description": (str, (MovieModel.description,)),
+    "duration": (int, (MovieModel.duration,)),
+    "user_id": (int, (MovieModel.user_id,)),
+    "release_date": (MovieSchema.model_fields["release_date"].annotation, (MovieModel.release_date,)),
+    "updated_at": (MovieSchema.model_fields["updated_at"].annotation, (MovieModel.updated_at,)),
+    "average_rating": (Optional[float], (MovieModel.rating_count, MovieModel.rating_sum)),
+    "rating_count": (int, (MovieModel.rating_count,)),
+}
+INCLUDES = ("comments",)
+
+
+class Fieldset:
+    """Which movie columns and relationships a list request asked for."""
+
+    def __init__(self, fields:tuple[str, ...], comments:bool=False):
+        self.fields = fields
+        self.comments = comments
+
+    def key(self) -> str:
+        return ",".join(self.fields) + ("+comments" if self.comments else "")
+
+    def load_options(self) -> list:
+        """Loader options that keep unrequested columns out of the SELECT; comments are previewed separately."""
+        columns = {column for name in self.fields for column in MOVIE_FIELDS[name][1]}
+        return [load_only(*sorted(columns, key=lambda c: c.key))]
+
+    def adapter(self) -> TypeAdapter:
+        return fieldset_adapter(self.fields, self.comments)
+
+
+SUMMARY = Fieldset(tuple(MovieSummary.model_fields))
+
+
+@lru_cache(maxsize=128)
+def fieldset_adapter(fields:tuple[str, ...], comments:bool) -> TypeAdapter:
+    if fields == SUMMARY.fields and not comments:
+        return TypeAdapter(List[MovieSummary])
+    definitions = {name: (MOVIE_FIELDS[name][0], ...) for name in fields}
+    if comments:
+        definitions["comments"] = (List[CommentSchema], [])
+        for name in ("comment_count", "has_more_comments", "next_comment_cursor"):
+            definitions[name] = (MovieSchema.model_fields[name].annotation, MovieSchema.model_fields[name].default)
+    model = create_model("MovieFieldset", __config__=ConfigDict(from_attributes=True), **definitions)
+    return TypeAdapter(List[model])
+
+
+def split(value:str|None) -> list[str]:
+    return [part.strip() for part in value.split(",") if part.strip()] if value else []
+
+
+def movie_fieldset(
+    fields: str | None = Query(None, description=f"Comma-separated subset of: {', '.join(MOVIE_FIELDS)}"),
+    include: str | None = Query(None, description="Comma-separated relationships to embed: comments"),
+    view: Literal["full", "summary"] = Query("full", description="`summary` returns id, title, average_rating and rating_count"),
+) -> Fieldset | None:
+    """Parse the projection of a movie listing; ``None`` means the full representation."""
+    names, includes = split(fields), split(include)
+    unknown = [name for name in names if name not in MOVIE_FIELDS] + [name for name in includes if name not in INCLUDES]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}",
+        )
+    if view == "summary" and not names:
+        return Fieldset(SUMMARY.fields, "comments" in includes)
+    if not names and not includes:
+        return None
+    # Keep the declared order and always carry the id, which cursors need.
+    selected = tuple(name for name in MOVIE_FIELDS if name in names or name == "id") if names else tuple(
+        name for name in MovieSchema.model_fields if name in MOVIE_FIELDS
+    )
+    return Fieldset(selected, "comments" in includes)
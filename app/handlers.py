@@ -0,0 +1,206 @@
+from fastapi import HTTPException, Request, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
+
+from app.auth import create_access_token
+from app.bulk_import import import_movies, resolve_format
+from app.conditional import not_modified_response, set_validators, version_validators
+from app.export import NDJSON_MEDIA_TYPE
+from app.pagination import set_next_cursor
+from app.serialization import comment_list_adapter, movie_list_adapter, render, reply_list_adapter
+from app.log import get_logger
+
+# Response logic shared by the threadpool router (app.main) and the AsyncSession
+# router (app.async_main). The routers only differ in how they reach the
+# database: each fetches through its own sessions and CRUD modules and hands the
+# results to these helpers.
+
+logger = get_logger("capstone_main")
+# The hottest INFO line gets its own logger, so LOG_SAMPLE_RATES can thin it alone.
+movie_list_logger = get_logger("capstone_main.movie_list")
+
+
+def envelope(message:str, **fields) -> dict:
+    return {"message": message, **fields}
+
+
+def token_response(db_user) -> dict:
+    access_token = create_access_token(db_user.username, user_id=db_user.id)
+    return {"access_token": access_token, "token_type": "bearer", "username": db_user.username}
+
+
+def reject_existing_user(db_user, username:str):
+    if db_user:
+        logger.warning("user %s already exists", username)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="User already exists")
+
+
+def signed_up(db_user) -> dict:
+    response = token_response(db_user)
+    logger.info("user and access token created successfully")
+    return response
+
+
+def logged_in(db_user) -> dict:
+    if not db_user:
+        logger.warning("Invalid credentials")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    response = token_response(db_user)
+    logger.info("User has been authenticated and authorized")
+    return response
+
+
+def movie_page_validators(request:Request, versions, skip:int, limit:int, after:int|None, fieldset):
+    """ETag of a ``/Movies/`` page, and the 304 to return when the client's copy is current."""
+    # Deleting a movie shifts the page without raising any updated_at on it, so a
+    # page is validated by its ETag, which covers the ids, and has no Last-Modified.
+    etag, _ = version_validators(versions, "movies", skip, limit, after, fieldset.key() if fieldset else None)
+    not_modified = not_modified_response(request, etag, None)
+    if not_modified is not None:
+        set_next_cursor(not_modified, versions, limit)
+    return etag, not_modified
+
+
+def movie_page(movies, etag:str, limit:int, fieldset):
+    movie_list_logger.info("Movies retrieved")
+    response = render(fieldset.adapter() if fieldset else movie_list_adapter, movies)
+    set_next_cursor(response, movies, limit)
+    set_validators(response, etag, None)
+    return response
+
+
+def movie_not_modified(request:Request, movie_id:int, updated_at):
+    return not_modified_response(request, *version_validators([(movie_id, updated_at)], "movie"))
+
+
+def movie_detail(movie_id:int, movie:dict):
+    # The cached payload is already validated; only encode it.
+    response = ORJSONResponse(movie)
+    set_validators(response, *version_validators([(movie_id, movie["updated_at"])], "movie"))
+    logger.info("Movie %s retriveed succesfully", movie_id)
+    return response
+
+
+def movie_created(movie) -> dict:
+    logger.info("Movie %s created successfully", movie.id)
+    return envelope("Movie created successfully", data=movie)
+
+
+async def import_catalog(request:Request, format:str|None, insert_batch, settings, user_id:int) -> dict:
+    report = await import_movies(
+        request.stream(),
+        resolve_format(format, request.headers.get("content-type")),
+        insert_batch,
+        settings.import_batch_size,
+        user_id,
+    )
+    logger.info("Movie catalog imported by user %s", user_id)
+    return envelope("Movies imported", data=report.as_dict())
+
+
+def export_response(stream, gzip:bool) -> StreamingResponse:
+    headers = {"Content-Encoding": "gzip"} if gzip else {}
+    return StreamingResponse(stream, media_type=NDJSON_MEDIA_TYPE, headers=headers)
+
+
+def search_results(movies, fieldset):
+    logger.info("Movie search returned %s results", len(movies))
+    return render(fieldset.adapter() if fieldset else movie_list_adapter, movies)
+
+
+def movie_batch(batch, movies:dict):
+    logger.info("Movie batch of %s ids returned %s movies", len(batch.ids), len(movies["data"]))
+    return ORJSONResponse(movies)
+
+
+def movie_updated(movie) -> dict:
+    logger.info("Movie is Updated successfully")
+    return envelope("Movie Updated successfully", data=movie)
+
+
+def require_owned_movie(db_movie):
+    if db_movie is None:
+        logger.warning("Movie is not found or user  access denied")
+        raise HTTPException(
+            status_code=404,
+            detail="Movie not found or User is not allowed to fetch this movie"
+        )
+
+
+def movie_deleted() -> dict:
+    logger.info("Movie  deleted successfully")
+    return envelope("Movie deleted successfully")
+
+
+def comment_created(movie_id:int, comment) -> dict:
+    logger.info("User added comment for a movie with id %s", movie_id)
+    return envelope("Comment created successfully", data=comment)
+
+
+def comment_page_validators(request:Request, movie_id:int, updated_at, skip:int, limit:int, after:int|None, reply_limit:int):
+    validators = version_validators([(movie_id, updated_at)], "comments", skip, limit, after, reply_limit)
+    return validators, not_modified_response(request, *validators)
+
+
+def comment_page(movie_id:int, comments, validators, limit:int):
+    response = render(comment_list_adapter, comments)
+    set_next_cursor(response, comments, limit)
+    set_validators(response, *validators)
+    logger.info("List of comments for movie %s retrieved successfully", movie_id)
+    return response
+
+
+def require_comment(db_comment, comment_id:int):
+    if db_comment is None:
+        logger.warning("Comment with id of  %s is  not found", comment_id)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Comment not found"
+        )
+
+
+def reply_created(comment_id:int, reply) -> dict:
+    logger.info("User added a reply to a comment with id %s", comment_id)
+    return envelope("Reply created successfully", data=reply)
+
+
+def reply_page(comment_id:int, replies, limit:int):
+    response = render(reply_list_adapter, replies)
+    set_next_cursor(response, replies, limit)
+    logger.info("List of replies for comment %s retrieved successfully", comment_id)
+    return response
+
+
+async def rate_movie(movie_id:int, user_id:int, rating:int, buffer, settings, create, exists):
+    """Body of ``POST /movie/{id}/create_rating``.
+
+    ``create`` and ``exists`` are coroutine functions running the direct write
+    and the movie lookup on the router's own session.
+    """
+    if buffer is None:
+        rate = await create()
+    elif settings.rating_durability == "accepted":
+        if not await exists():
+            logger.warning("Movie is not found")
+            raise HTTPException(status_code=404, detail="Movie not found")
+        buffer.submit(movie_id, user_id, rating)
+        logger.info("Rating of movie %s queued", movie_id)
+        return ORJSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=envelope("Rating accepted", data={"movie_id": movie_id, "user_id": user_id, "rating": rating}),
+        )
+    else:
+        # Awaited on the event loop, so no request thread waits for the flusher.
+        rate = await buffer.wait(buffer.submit(movie_id, user_id, rating))
+    logger.info("User rated movie %s successfully", movie_id)
+    return envelope("Rating created successfully", data=rate)
+
+
+def rating_updated(movie_id:int, rating) -> dict:
+    logger.info("User changed their rating of movie %s", movie_id)
+    return envelope("Rating updated successfully", data=rating)
+
+
+def movie_rating(movie_id:int, average) -> dict:
+    logger.info("Rating for movie %s retrieved successfully", movie_id)
+    return envelope("Average rating for movie retrieved successfully", data=average)
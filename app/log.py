@@ -1,25 +1,137 @@
-import os 
+import atexit
+import json
 import logging
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
 
-from logging.handlers import SysLogHandler
-from dotenv import load_dotenv
+from app.config import get_settings
 
 
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 
 
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record:logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fixed fraction of sub-WARNING records from selected loggers.
+
+    ``rates`` maps logger names to the fraction kept (``0.1`` keeps every tenth
+    record). Names match exactly, so sampling a child logger such as
+    ``capstone_main.movie_list`` leaves its parent's records alone. Sampling is
+    counter based, so the kept share is exact rather than random; warnings and
+    errors always pass.
+    """
+
+    def __init__(self, rates:dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._seen = {}
+        self._lock = threading.Lock()
+        self.sampled_out = 0
+
+    def filter(self, record:logging.LogRecord) -> bool:
+        rate = self.rates.get(record.name)
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            seen = self._seen.get(record.name, 0) + 1
+            self._seen[record.name] = seen
+            keep = int(seen * rate) > int((seen - 1) * rate)
+            if not keep:
+                self.sampled_out += 1
+        return keep
+
+
+class DroppingQueueHandler(QueueHandler):
+    """``QueueHandler`` that never blocks the caller: records are dropped and counted when the queue is full."""
+
+    def __init__(self, log_queue:queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record:logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def build_handlers(settings) -> list[logging.Handler]:
+    formatter = JsonFormatter() if settings.log_format == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if settings.log_file:
+        handlers.append(logging.FileHandler(settings.log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("app.log"),
-        logging.StreamHandler(),
-  
-    ]
-)
-def get_logger(name):
-    logger = logging.getLogger(name)
-    return logger
 
+queue_handler = None
+listener = None
 
 
+def configure_logging(settings=None) -> DroppingQueueHandler:
+    """Route every record through a bounded queue drained by a background writer thread.
+
+    Request threads only format the message and enqueue it; stream and file
+    I/O happen on the listener thread.
+    """
+    global queue_handler, listener
+    settings = settings or get_settings()
+    if listener is not None:
+        listener.stop()
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=settings.log_queue_size))
+    queue_handler.addFilter(SamplingFilter(settings.log_sample_rates))
+    listener = QueueListener(queue_handler.queue, *build_handlers(settings), respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(settings.log_level.upper())
+    listener.start()
+    return queue_handler
+
+
+def shutdown_logging():
+    """Flush whatever is still queued and detach the queue; safe to call more than once."""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+        logging.getLogger().removeHandler(queue_handler)
+
+
+def logging_stats() -> dict:
+    if queue_handler is None:
+        return {}
+    return {
+        "queued": queue_handler.queue.qsize(),
+        "capacity": queue_handler.queue.maxsize,
+        "dropped": queue_handler.dropped,
+        "sampled_out": sum(f.sampled_out for f in queue_handler.filters if isinstance(f, SamplingFilter)),
+    }
+
+
+atexit.register(shutdown_logging)
+
+
+def get_logger(name):
+    logger = logging.getLogger(name)
+    return logger
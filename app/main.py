@@ -1,32 +1,54 @@
-from typing import List
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import List, Literal
 
-from fastapi import FastAPI, Depends, status, HTTPException
+from fastapi import APIRouter, FastAPI, Depends, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import Session
 
 from app.auth import (
+    configure_auth,
     get_current_user,
-    authenticate_user,
-    create_access_token,
-    create_user,
+    authenticate_user_async,
+    create_user_async,
     oath2_scheme,
     get_user_by_username
 )
+from app.admission import ConcurrencyLimitMiddleware, build_limiters, build_user_buckets, rate_limited, set_limiters
+from app import handlers
+from app.export import stream_movie_export
+from app.bulk_import import insert_movie_batch
 from app.comment_crud import create_movie_comment, get_comments, get_comment_by_id
 from app.crud import (
     create_movies,
     get_movies,
     get_movies_by_id,
+    get_movies_by_ids,
     edit_movie,
     get_movies_by_id_and_user_id,
+    get_movie_page_versions,
+    get_movie_version,
+    get_top_movies,
+    movie_exists,
+    search_movies,
     delete_movie
 )
 
 
 
-from app.database import get_db, Base, engine
+from app.config import Settings, get_app_settings, get_settings
+from app.cache import build_cache_backend, set_cache_backend
+from app.database import dispose_engine, get_db, init_engine, operational_error_handler, pool_timeout_handler
 from app.models import User as UserModel, Movie as MoviesModel
-from app.ratingcrud import create_rating, get_ratings
+from app.metrics import MetricsMiddleware
+from app.monitoring import router as monitoring_router
+from app.rating_buffer import RatingBuffer, build_rating_buffer, get_rating_buffer
+from app import replicas
+from app.replicas import ReadYourWritesMiddleware, build_replica_set, get_read_db, get_read_session_factory
+from app.ratingcrud import create_rating, get_ratings, update_rating
 from app.reply_crud import create_reply, get_replies
 from app.schemas import (
     MovieUpate,
@@ -34,164 +56,221 @@ from app.schemas import (
     UserCreate,
     Movie as MovieSchema,
     MovieCreate,
+    MovieBatchRequest,
     CommentCreate,
     Comment as CommentSchema,
     ReplyCreate,
+    Reply as ReplySchema,
     RatingCreate,
-    Rating as RatingSchema
+    Rating as RatingSchema,
+    RankedMovie,
 )
 
 from app.models import Rating as RatingModel
 
 
+from app.batch import movie_batch_params
+from app.fieldsets import Fieldset, movie_fieldset
+from app.serialization import ranked_movie_list_adapter, render
+from app.pagination import MAX_REPLY_PREVIEW, cursor_param
 from app.utils import credentials_exception, not_found
 
-from app.log import get_logger
+from app.log import configure_logging, get_logger, shutdown_logging
 
 logger = get_logger("capstone_main")
 
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI()
-
-@app.post("/signup", status_code=status.HTTP_201_CREATED, tags=["USER"])
-def signup(user:UserCreate, db:Session=Depends(get_db)):
-    db_user = get_user_by_username(user.username, db)
-    if db_user:
-        logger.exception("user {user.username} already exists")
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, 
-                            detail="User already exists")
-    db_user = create_user(user, db)
-
-    access_token = create_access_token(db_user.username)
-    logger.info("user and access token created successfully")
-    return {"access_token": access_token, "token_type": "bearer", "username":db_user.username}
-
-
-@app.post("/login", tags=["USER"] )
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db:Session=Depends(get_db)):
-   db_user = authenticate_user(form_data.username, form_data.password, db)
-   if  not db_user:
-       logger.exception("Invalid credentials")
-       raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
-   access_token = create_access_token(db_user.username)
-   logger.info("User has been authenticated and authorized")
-   return {"access_token": access_token, "token_type": "bearer", "username": db_user.username}
-    
-    
-@app.get("/Movies/", tags=["MOVIE"], response_model=List[MovieSchema])
-def get_all_movies(db:Session=Depends(get_db), skip:int=0, limit:int=10):
-    logger.info("Movies retrieved")
-    return get_movies(db=db, skip=skip, limit=limit)
-
-
-@app.get("/movie/{movie_id}", tags=["MOVIE"], response_model=MovieSchema)
-def get_movie_by_id(movie_id: int, db: Session=Depends(get_db)):
-    id_movie =  get_movies_by_id(db, movie_id)
-    logger.info("Movie %s retriveed succesfully", id_movie)
-    return id_movie
-    
-    
-@app.post('/movies/create', status_code=status.HTTP_201_CREATED, tags=["MOVIE"])
-def create_movie (moviePayload:MovieCreate, db: Session=Depends(get_db), user : UserSchema=Depends(get_current_user)):
-    new_movies =  create_movies(db, moviePayload, user.id)
-    logger.info("Movie %s created successfully", new_movies)
-    return{
-        "message": "Movie created successfully",
-        "data": new_movies
-    }
-
-
-@app.put('/movies/{movie_id}', status_code=status.HTTP_200_OK, tags=["MOVIE"])
-def update_movie (movie_id:int, moviePayload:MovieUpate, db: Session=Depends(get_db), user : UserSchema=Depends(get_current_user)):
-    db_movie = get_movies_by_id_and_user_id(db, movie_id, user.id)
-    if db_movie is None:
-        logger.warning("Movie is not found")
-        raise HTTPException(
-            status_code=404,
-            detail="Movie not found or User is not allowed to fetch this movie"
-        )
-    edited = edit_movie(db, movie_id, moviePayload, user.id)
-    logger.info("Movie is Updated successfully")
-    return {
-        "message": "Movie Updated successfully",
-        "data": edited
-    }
-
-@app.delete('/movies/{movie_id}', status_code=status.HTTP_200_OK, tags=["MOVIE"])
-def delete__movie (movie_id:int, db: Session=Depends(get_db), user : UserSchema=Depends(get_current_user)):
-    db_movie = get_movies_by_id_and_user_id(db, movie_id, user.id)
-    if db_movie is None:
-        logger.warning("Movie is not found or user  access denied")
-        raise HTTPException(
-            status_code=404,
-            detail="Movie not found or User is not allowed to fetch this movie"
-        )
-    logger.info("Movie  deleted successfully")
-    deleted_movie = delete_movie(db, movie_id, user.id)
-    return{
-        "message": "Movie deleted successfully",
-    }
-
-
-@app.post("/movies/{movie_id}/create_comment", tags=["COMMENT"])
-def create_comment(movie_id: int, comment: CommentCreate, db: Session = Depends(get_db), user: UserSchema = Depends(get_current_user)):
-    new_comment = create_movie_comment(movie_id, db, comment, user.id)
-    logger.info("User added comment for a movie with id %s", movie_id)
-    return {
-        "message": "Comment created successfully",
-        "data": new_comment
-    }
-
-
-@app.get("/movies/{movie_id}/comments", tags=["COMMENT"], response_model=List[CommentSchema])
-def get_comments_of_a_movie(movie_id: int, db: Session = Depends(get_db)):
-    movie_comments = get_comments(db, movie_id)
-    logger.info("List of comments for movie %s retrieved successfully", movie_id)
-    return movie_comments
-
-
-@app.post("/comments/{comment_id}/comments", tags=["NESTED COMMENTS"])
-def create_nested_comment(comment_id: int, reply: ReplyCreate, db: Session = Depends(get_db), user: UserSchema = Depends(get_current_user)):
-    db_comment = get_comment_by_id(db, comment_id)
-    if db_comment is None:
-        logger.warning("Comment with id of  %s is  not found", comment_id)
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Comment not found"
-        )
-    logger.info("User added a reply to a comment with id %s", comment_id)
-    new_reply = create_reply(db=db, reply_payload=reply, comment_id=comment_id, movie_id=db_comment.movie_id, user_id=user.id)
+router = APIRouter()
+
+# Authenticated endpoints depend on this, so every user is held to RATE_LIMIT_PER_SECOND.
+current_user = rate_limited(get_current_user)
+
+@router.post("/signup", status_code=status.HTTP_201_CREATED, tags=["USER"])
+async def signup(user:UserCreate, db:Session=Depends(get_db)):
+    handlers.reject_existing_user(await run_in_threadpool(get_user_by_username, user.username, db), user.username)
+    return handlers.signed_up(await create_user_async(user, db))
+
+
+@router.post("/login", tags=["USER"] )
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db:Session=Depends(get_db)):
+    return handlers.logged_in(await authenticate_user_async(form_data.username, form_data.password, db))
+
+
+@router.get("/Movies/", tags=["MOVIE"], response_model=List[MovieSchema])
+def get_all_movies(request: Request, db:Session=Depends(get_read_db), skip:int=0, limit:int=10, after:int|None=Depends(cursor_param), fieldset:Fieldset|None=Depends(movie_fieldset), settings: Settings=Depends(get_app_settings)):
+    versions = get_movie_page_versions(db, skip=skip, limit=limit, after=after)
+    etag, not_modified = handlers.movie_page_validators(request, versions, skip, limit, after, fieldset)
+    if not_modified is not None:
+        return not_modified
+    movies = get_movies(db=db, skip=skip, limit=limit, after=after, fieldset=fieldset, settings=settings)
+    return handlers.movie_page(movies, etag, limit, fieldset)
+
+
+@router.get("/movie/{movie_id}", tags=["MOVIE"], response_model=MovieSchema)
+def get_movie_by_id(movie_id: int, request: Request, db: Session=Depends(get_read_db), settings: Settings=Depends(get_app_settings)):
+    not_modified = handlers.movie_not_modified(request, movie_id, get_movie_version(db, movie_id))
+    if not_modified is not None:
+        return not_modified
+    return handlers.movie_detail(movie_id, get_movies_by_id(db, movie_id, settings))
+
+
+@router.post('/movies/create', status_code=status.HTTP_201_CREATED, tags=["MOVIE"])
+def create_movie (moviePayload:MovieCreate, db: Session=Depends(get_db), user : UserSchema=Depends(current_user)):
+    return handlers.movie_created(create_movies(db, moviePayload, user.id))
 
-    return{
-        "message": "Reply created successfully",
-        "data": new_reply
-    }
 
+@router.post('/movies/import', tags=["MOVIE"])
+async def import_movie_catalog(request: Request, format: Literal["ndjson", "csv"] | None = None, db: Session=Depends(get_db), user : UserSchema=Depends(current_user), settings: Settings=Depends(get_app_settings)):
+    async def insert_batch(rows):
+        await run_in_threadpool(insert_movie_batch, db, rows)
 
-@app.post("/movie/{movie_id}/create_rating", tags=["RATING"])
-def create_movie_rating(movie_id: int, rating: RatingCreate, db: Session = Depends(get_db), user: UserSchema = Depends(get_current_user)):
-    rate = create_rating(db, rating, movie_id, user.id)
-    logger.info("User rated movie %s successfully", movie_id)
-    return {
-        "message": "Rating created successfully",
-        "data": rate
-    }
+    return await handlers.import_catalog(request, format, insert_batch, settings, user.id)
 
 
-@app.get("/movie/rating/{movie_id}", tags=["RATING"], status_code=status.HTTP_200_OK)
-def get_movie_rating( movie_id:int,  db:Session=Depends(get_db)):
-   average_ratting = get_ratings(db, movie_id)
-   logger.info("Rating for movie %s retrieved successfully", movie_id)
-   return {
-       "message": "Average rating for movie retrieved successfully",
-       "data": average_ratting
-   }
+@router.get('/movies/export', tags=["MOVIE"])
+def export_movie_catalog(gzip: bool = False, session_factory=Depends(get_read_session_factory), settings: Settings=Depends(get_app_settings)):
+    return handlers.export_response(stream_movie_export(session_factory, settings.export_batch_size, gzip), gzip)
 
 
+@router.get('/movies/search', tags=["MOVIE"], response_model=List[MovieSchema])
+def search_movie_catalog(q: str = Query(..., min_length=1, max_length=200), db: Session=Depends(get_read_db), skip:int=0, limit:int=10, fieldset:Fieldset|None=Depends(movie_fieldset), settings: Settings=Depends(get_app_settings)):
+    return handlers.search_results(search_movies(db, q, skip=skip, limit=limit, fieldset=fieldset, settings=settings), fieldset)
 
 
+@router.get('/movies/top', tags=["MOVIE"], response_model=List[RankedMovie])
+def get_top_rated_movies(db: Session=Depends(get_read_db), skip:int=0, limit:int=10):
+    return render(ranked_movie_list_adapter, get_top_movies(db, skip=skip, limit=limit))
 
 
+@router.get('/movies/batch', tags=["MOVIE"])
+def get_movie_batch(batch: MovieBatchRequest=Depends(movie_batch_params), db: Session=Depends(get_read_db), settings: Settings=Depends(get_app_settings)):
+    return handlers.movie_batch(batch, get_movies_by_ids(db, batch.ids, batch.comment_counts, settings))
 
 
+@router.post('/movies/batch', tags=["MOVIE"])
+def post_movie_batch(batch: MovieBatchRequest, db: Session=Depends(get_read_db), settings: Settings=Depends(get_app_settings)):
+    """Same as ``GET /movies/batch``, for id lists too long for a query string."""
+    return handlers.movie_batch(batch, get_movies_by_ids(db, batch.ids, batch.comment_counts, settings))
+
+
+@router.put('/movies/{movie_id}', status_code=status.HTTP_200_OK, tags=["MOVIE"])
+def update_movie (movie_id:int, moviePayload:MovieUpate, db: Session=Depends(get_db), user : UserSchema=Depends(current_user)):
+    return handlers.movie_updated(edit_movie(db, movie_id, moviePayload, user.id))
+
+
+@router.delete('/movies/{movie_id}', status_code=status.HTTP_200_OK, tags=["MOVIE"])
+def delete__movie (movie_id:int, db: Session=Depends(get_db), user : UserSchema=Depends(current_user)):
+    handlers.require_owned_movie(get_movies_by_id_and_user_id(db, movie_id, user.id))
+    delete_movie(db, movie_id, user.id)
+    return handlers.movie_deleted()
+
+
+@router.post("/movies/{movie_id}/create_comment", tags=["COMMENT"])
+def create_comment(movie_id: int, comment: CommentCreate, db: Session = Depends(get_db), user: UserSchema = Depends(current_user)):
+    return handlers.comment_created(movie_id, create_movie_comment(movie_id, db, comment, user.id))
+
+
+@router.get("/movies/{movie_id}/comments", tags=["COMMENT"], response_model=List[CommentSchema])
+def get_comments_of_a_movie(movie_id: int, request: Request, db: Session = Depends(get_read_db), skip:int=0, limit:int=10, after:int|None=Depends(cursor_param), reply_limit:int|None=Query(None, ge=0, le=MAX_REPLY_PREVIEW), settings: Settings=Depends(get_app_settings)):
+    if reply_limit is None:
+        reply_limit = settings.reply_preview_limit
+    validators, not_modified = handlers.comment_page_validators(request, movie_id, get_movie_version(db, movie_id), skip, limit, after, reply_limit)
+    if not_modified is not None:
+        return not_modified
+    movie_comments = get_comments(db, movie_id, skip=skip, limit=limit, after=after, reply_limit=reply_limit)
+    return handlers.comment_page(movie_id, movie_comments, validators, limit)
+
+
+@router.post("/comments/{comment_id}/comments", tags=["NESTED COMMENTS"])
+def create_nested_comment(comment_id: int, reply: ReplyCreate, db: Session = Depends(get_db), user: UserSchema = Depends(current_user)):
+    db_comment = get_comment_by_id(db, comment_id)
+    handlers.require_comment(db_comment, comment_id)
+    new_reply = create_reply(db=db, reply_payload=reply, comment_id=comment_id, movie_id=db_comment.movie_id, user_id=user.id)
+    return handlers.reply_created(comment_id, new_reply)
+
+
+@router.get("/comments/{comment_id}/replies", tags=["NESTED COMMENTS"], response_model=List[ReplySchema])
+def get_replies_of_a_comment(comment_id: int, db: Session = Depends(get_read_db), skip:int=0, limit:int=10, after:int|None=Depends(cursor_param)):
+    handlers.require_comment(get_comment_by_id(db, comment_id), comment_id)
+    return handlers.reply_page(comment_id, get_replies(db, comment_id, skip=skip, limit=limit, after=after), limit)
+
+
+@router.post("/movie/{movie_id}/create_rating", tags=["RATING"])
+async def create_movie_rating(movie_id: int, rating: RatingCreate, db: Session = Depends(get_db), user: UserSchema = Depends(current_user), buffer: RatingBuffer | None = Depends(get_rating_buffer), settings: Settings=Depends(get_app_settings)):
+    return await handlers.rate_movie(
+        movie_id, user.id, rating.rating, buffer, settings,
+        create=partial(run_in_threadpool, create_rating, db, rating, movie_id, user.id, settings),
+        exists=partial(run_in_threadpool, movie_exists, db, movie_id),
+    )
+
+
+@router.put("/movie/{movie_id}/rating", tags=["RATING"])
+def update_movie_rating(movie_id: int, rating: RatingCreate, db: Session = Depends(get_db), user: UserSchema = Depends(current_user), settings: Settings=Depends(get_app_settings)):
+    return handlers.rating_updated(movie_id, update_rating(db, rating, movie_id, user.id, settings))
+
+
+@router.get("/movie/rating/{movie_id}", tags=["RATING"], status_code=status.HTTP_200_OK)
+def get_movie_rating( movie_id:int,  db:Session=Depends(get_read_db)):
+    return handlers.movie_rating(movie_id, get_ratings(db, movie_id))
+
+
+def select_router(settings):
+    """Serve the AsyncSession endpoints when ``ASYNC_DB`` is enabled, the threadpool ones otherwise."""
+    if settings.async_db:
+        from app.async_main import router as async_router
+        return async_router
+    return router
+
+
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+    """Set up logging, the engine, the cache, the replicas, auth and the rating buffer per worker, and tear them down in reverse.
+
+    The schema is managed by Alembic (``alembic upgrade head``); startup never
+    creates or reflects tables.
+    """
+    settings = app.state.settings
+    configure_logging(settings)
+    init_engine(settings)
+    replicas.set_replica_set(build_replica_set(settings).start())
+    if settings.async_db:
+        from app.async_database import init_async_engine
+        init_async_engine(settings, replicas.replica_set)
+    set_cache_backend(build_cache_backend(settings))
+    set_limiters(app.state.limiters)
+    configure_auth(settings)
+    app.state.rating_buffer = build_rating_buffer(settings)
+    logger.info("Application started")
+    try:
+        yield
+    finally:
+        app.state.rating_buffer.stop()
+        replicas.replica_set.dispose()
+        if settings.async_db:
+            from app.async_database import dispose_async_engine
+            await dispose_async_engine()
+        dispose_engine()
+        shutdown_logging()
+
+
+def create_app(settings=None) -> FastAPI:
+    """Build the application without touching the database or the filesystem; see ``lifespan``."""
+    settings = settings or get_settings()
+    app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+    app.state.settings = settings
+    app.include_router(select_router(settings))
+    app.include_router(monitoring_router)
+    app.add_exception_handler(PoolTimeoutError, pool_timeout_handler)
+    app.add_exception_handler(OperationalError, operational_error_handler)
+    app.state.user_buckets = build_user_buckets(settings)
+    app.state.limiters = build_limiters(settings) if settings.concurrency_limit_enabled else {}
+    if app.state.limiters:
+        # Monitoring stays reachable while the app is shedding load.
+        exempt = frozenset(route.path for route in monitoring_router.routes)
+        app.add_middleware(ConcurrencyLimitMiddleware, limiters=app.state.limiters, exempt=exempt)
+    app.add_middleware(ReadYourWritesMiddleware, window=settings.read_your_writes_seconds)
+    if settings.metrics_enabled:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+app = create_app()
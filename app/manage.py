@@ -0,0 +1,47 @@
+import argparse
+
+from app.database import SessionLocal, init_engine
+from app.rankings import rebuild_rankings
+from app.ratingcrud import recompute_rating_aggregates
+from app.log import configure_logging, get_logger
+
+logger = get_logger("manage")
+
+
+def recompute_ratings(args):
+    db = SessionLocal()
+    try:
+        updated = recompute_rating_aggregates(db, args.movie_id)
+    finally:
+        db.close()
+    print(f"Recomputed rating aggregates for {updated} movies")
+
+
+def rank_movies(args):
+    db = SessionLocal()
+    try:
+        ranked = rebuild_rankings(db)
+    finally:
+        db.close()
+    print(f"Rebuilt the leaderboard for {ranked} movies")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.manage", description="Maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    recompute = commands.add_parser("recompute-ratings", help="Rebuild Movie.rating_count/rating_sum from the ratings table")
+    recompute.add_argument("--movie-id", type=int, default=None, help="Only repair this movie")
+    recompute.set_defaults(handler=recompute_ratings)
+
+    rank = commands.add_parser("rebuild-rankings", help="Recompute every leaderboard score, e.g. after changing the ranking prior")
+    rank.set_defaults(handler=rank_movies)
+
+    args = parser.parse_args(argv)
+    configure_logging()
+    init_engine()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import time
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from starlette.routing import Match
+
+from app.cache import get_cache_backend
+
+
+registry = CollectorRegistry()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100, 250)
+
+http_requests = Counter(
+    "http_requests_total", "Requests served", ["method", "route", "status"], registry=registry,
+)
+http_latency = Histogram(
+    "http_request_duration_seconds", "Time to the last response byte", ["method", "route"],
+    buckets=LATENCY_BUCKETS, registry=registry,
+)
+http_in_flight = Gauge(
+    "http_requests_in_progress", "Requests currently being served", ["method", "route"], registry=registry,
+)
+request_queries = Histogram(
+    "db_queries_per_request", "SQL statements issued while serving one request", ["method", "route"],
+    buckets=QUERY_COUNT_BUCKETS, registry=registry,
+)
+request_db_time = Histogram(
+    "db_time_per_request_seconds", "Time spent executing SQL while serving one request", ["method", "route"],
+    buckets=LATENCY_BUCKETS, registry=registry,
+)
+db_queries = Counter("db_queries_total", "SQL statements executed", registry=registry)
+db_query_latency = Histogram(
+    "db_query_duration_seconds", "Execution time of single SQL statements", buckets=LATENCY_BUCKETS, registry=registry,
+)
+pool_checkout_wait = Histogram(
+    "db_pool_checkout_seconds", "Time spent waiting for a pooled connection (including connecting)",
+    buckets=LATENCY_BUCKETS, registry=registry,
+)
+db_pool_timeouts = Counter(
+    "db_pool_timeouts", "Requests refused with 503 because no pooled connection freed up in time", registry=registry,
+)
+db_statement_timeouts = Counter(
+    "db_statement_timeouts", "Requests refused with 503 because a statement hit the per-request timeout", registry=registry,
+)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Set by the middleware; the threadpool copies the context, so sync endpoints
+# and their dependencies update the same object.
+current_request = ContextVar("current_request", default=None)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append((context, time.perf_counter()))
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _, started = conn.info["query_started"].pop()
+    elapsed = time.perf_counter() - started
+    db_queries.inc()
+    db_query_latency.observe(elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def handle_error(context):
+    # A statement that fails in execute never reaches after_cursor_execute; drop its
+    # start time so the pooled connection doesn't pair it with a later statement.
+    # Errors while fetching rows come after the pop and leave the stack alone.
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started and started[-1][0] is context.execution_context:
+        started.pop()
+
+
+def instrument_engine(engine):
+    """Attach query timing and pool checkout timing to a (sync) ``Engine``; repeat calls are no-ops."""
+    if engine.__dict__.get("_metrics_instrumented"):
+        return engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+    # The pool has no "checkout requested" event, so time the call every
+    # Connection goes through. Patching the engine survives pool recreation.
+    raw_connection = engine.raw_connection
+
+    def timed_raw_connection():
+        started = time.perf_counter()
+        try:
+            return raw_connection()
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - started)
+
+    engine.raw_connection = timed_raw_connection
+    engine._metrics_instrumented = True
+    return engine
+
+
+class CacheCollector:
+    """Hit/miss counters of the movie and token caches, read at scrape time."""
+
+    def collect(self):
+        from app.auth import token_cache
+
+        hits = CounterMetricFamily("cache_hits", "Cache lookups that found an entry", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache lookups that found nothing", labels=["cache"])
+        evictions = CounterMetricFamily("cache_evictions", "Entries evicted to respect the size bound", labels=["cache"])
+        ratio = GaugeMetricFamily("cache_hit_ratio", "Hits over lookups since start", labels=["cache"])
+        size = GaugeMetricFamily("cache_entries", "Entries currently cached", labels=["cache"])
+        for name, cache in (("movie", get_cache_backend()), ("token", token_cache)):
+            stats = cache.stats()
+            hits.add_metric([name], stats.get("hits", 0))
+            misses.add_metric([name], stats.get("misses", 0))
+            evictions.add_metric([name], stats.get("evictions", 0))
+            ratio.add_metric([name], stats.get("hit_ratio", 0.0))
+            size.add_metric([name], stats.get("size", 0))
+        yield from (hits, misses, evictions, ratio, size)
+
+
+registry.register(CacheCollector())
+
+
+class PoolCollector:
+    """Occupancy of the primary engine's connection pool, read at scrape time."""
+
+    def collect(self):
+        from app.database import pool_status
+
+        stats = pool_status()
+        for name, help_text in (
+            ("size", "Configured number of pooled connections"),
+            ("checkedout", "Connections currently lent to requests"),
+            ("checkedin", "Idle connections in the pool"),
+            ("overflow", "Connections opened beyond the pool size"),
+        ):
+            if name in stats:
+                gauge = GaugeMetricFamily(f"db_pool_{name}", help_text)
+                gauge.add_metric([], stats[name])
+                yield gauge
+
+
+registry.register(PoolCollector())
+
+
+class AdmissionCollector:
+    """Adaptive concurrency limits and load shedding per route class, read at scrape time."""
+
+    def collect(self):
+        from app.admission import limiters
+
+        limit = GaugeMetricFamily("admission_limit", "Current adaptive concurrency limit", labels=["route_class"])
+        in_flight = GaugeMetricFamily("admission_in_flight", "Requests holding a slot", labels=["route_class"])
+        queued = GaugeMetricFamily("admission_queued", "Requests waiting for a slot", labels=["route_class"])
+        shed = CounterMetricFamily("admission_shed", "Requests refused with 503", labels=["route_class"])
+        for name, limiter in limiters.items():
+            stats = limiter.stats()
+            limit.add_metric([name], stats["limit"])
+            in_flight.add_metric([name], stats["in_flight"])
+            queued.add_metric([name], stats["queued"])
+            shed.add_metric([name], stats["shed"])
+        yield from (limit, in_flight, queued, shed)
+
+
+registry.register(AdmissionCollector())
+
+
+def route_template(app, scope) -> str:
+    """The path template of the matching route, so ``/movie/1`` and ``/movie/2`` share one series."""
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware; a request ends with its last body chunk, so streamed responses are timed in full."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        route = route_template(scope["app"], scope)
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+        in_flight = http_in_flight.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            http_latency.labels(method, route).observe(time.perf_counter() - started)
+            http_requests.labels(method, route, str(status)).inc()
+            request_queries.labels(method, route).observe(stats.queries)
+            request_db_time.labels(method, route).observe(stats.db_seconds)
+            current_request.reset(token)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    return generate_latest(registry), CONTENT_TYPE_LATEST
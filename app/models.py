@@ -1,6 +1,7 @@
 from datetime import datetime
 
-from sqlalchemy import Column, String, Integer, DateTime,Text, ForeignKey, Float
+from sqlalchemy import Column, String, Integer, DateTime,Text, ForeignKey, Float, Index, UniqueConstraint, case, func
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 
 from app.database import Base
@@ -31,23 +32,53 @@ class Movie(Base):
     description = Column(Text)
     duration = Column(Integer)
     user_id  = Column(Integer, ForeignKey("users.id"))
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_sum = Column(Float, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=func.now())
     
     user = relationship("User", back_populates="movies")
     ratings = relationship("Rating", back_populates="movie", uselist=False, cascade="all, delete-orphan")
     comments = relationship("Comment", back_populates="movie")
+
+    @hybrid_property
+    def average_rating(self):
+        return self.rating_sum / self.rating_count if self.rating_count else 0
+
+    @average_rating.expression
+    def average_rating(cls):
+        return case((cls.rating_count > 0, cls.rating_sum / cls.rating_count), else_=0)
    
 
 
+class MovieRanking(Base):
+    """Precomputed leaderboard row; one per rated movie, refreshed with each rating."""
+    __tablename__ = 'movie_rankings'
+
+    movie_id = Column(Integer, ForeignKey("movies.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Float, nullable=False)
+    rating_count = Column(Integer, nullable=False)
+
+    movie = relationship("Movie")
+
+    __table_args__ = (
+        Index("ix_movie_rankings_score", score.desc(), movie_id),
+    )
+
+
 class Rating(Base):
     __tablename__ = 'ratings'
     id = Column(Integer, primary_key=True, index=True)
     rating = Column(Float)
-    movie_id = Column(Integer, ForeignKey("movies.id"),)
+    movie_id = Column(Integer, ForeignKey("movies.id"), index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
 
     movie = relationship("Movie", back_populates="ratings")
     user = relationship("User", back_populates="ratings")
 
+    __table_args__ = (
+        UniqueConstraint("movie_id", "user_id", name="uq_ratings_movie_user"),
+    )
+
 
 class Comment(Base):
     __tablename__ = 'comments'
@@ -56,7 +87,7 @@ class Comment(Base):
     content = Column(Text)
     created_at = Column(DateTime, default=datetime.now())
 
-    movie_id = Column(Integer, ForeignKey("movies.id"))
+    movie_id = Column(Integer, ForeignKey("movies.id"), index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
 
     movie = relationship("Movie", back_populates="comments")
@@ -72,7 +103,7 @@ class Reply(Base):
     content = Column(Text)
     created_at = Column(DateTime, default=datetime.now())
 
-    comment_id = Column(Integer, ForeignKey("comments.id"))
+    comment_id = Column(Integer, ForeignKey("comments.id"), index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     comment = relationship("Comment", back_populates="replies")
     user = relationship("User", back_populates="replies")
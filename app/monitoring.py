@@ -0,0 +1,52 @@
+from fastapi import APIRouter, Request, Response
+
+from app.cache import get_cache_backend
+from app.database import pool_status
+from app.log import logging_stats
+from app.metrics import render_metrics
+
+
+router = APIRouter(tags=["MONITORING"])
+
+
+@router.get("/cache/stats")
+def cache_stats():
+    return get_cache_backend().stats()
+
+
+@router.get("/logging/stats")
+def log_pipeline_stats():
+    return logging_stats()
+
+
+@router.get("/db/pool/stats")
+def db_pool_stats():
+    return pool_status()
+
+
+@router.get("/db/replicas")
+def db_replica_status():
+    from app.replicas import replica_set
+
+    return replica_set.status()
+
+
+@router.get("/ratings/buffer/stats")
+def rating_buffer_stats(request:Request):
+    buffer = getattr(request.app.state, "rating_buffer", None)
+    return buffer.stats() if buffer is not None else {"enabled": False}
+
+
+@router.get("/concurrency/stats")
+def concurrency_stats(request:Request):
+    user_buckets = request.app.state.user_buckets
+    return {
+        "limiters": {name: limiter.stats() for name, limiter in request.app.state.limiters.items()},
+        "rate_limited": user_buckets.limited if user_buckets is not None else 0,
+    }
+
+
+@router.get("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
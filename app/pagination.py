@@ -0,0 +1,44 @@
+import base64
+import binascii
+import json
+
+from fastapi import HTTPException, Query, Response, status
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_REPLY_PREVIEW = 50
+
+
+def encode_cursor(last_id:int) -> str:
+    raw = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor:str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded))["id"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        last_id = None
+    if not isinstance(last_id, int):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return last_id
+
+
+def cursor_param(after: str | None = Query(None, description="Opaque cursor returned in the X-Next-Cursor header of the previous page")) -> int | None:
+    return decode_cursor(after) if after else None
+
+
+def set_next_cursor(response:Response, items:list, limit:int):
+    """Expose the cursor of the following page, if the current page is full.
+
+    Items are ordered by ``id``, so the last one on the page is where the next
+    page starts. Dicts and ORM objects are both accepted.
+    """
+    if limit <= 0 or len(items) < limit:
+        return None
+    last = items[-1]
+    last_id = last["id"] if isinstance(last, dict) else last.id
+    cursor = encode_cursor(last_id)
+    response.headers[NEXT_CURSOR_HEADER] = cursor
+    return cursor
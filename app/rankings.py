@@ -0,0 +1,81 @@
+from sqlalchemy import delete, insert, literal, select
+
+from app.config import get_settings
+from app.database import dialect_insert
+from app.models import Movie as MovieModel, MovieRanking
+from app.log import get_logger
+
+logger = get_logger("rankings")
+
+
+def bayesian_score(settings=None):
+    """Weighted rating ``(v*R + m*C) / (v + m)`` as a SQL expression over the movie aggregates.
+
+    ``m`` is the minimum-vote prior and ``C`` the prior mean. Both are fixed
+    settings, so a movie's score depends only on its own ``rating_count`` and
+    ``rating_sum`` and can be refreshed one row at a time.
+    """
+    settings = settings or get_settings()
+    m, c = settings.ranking_min_votes, settings.ranking_prior_mean
+    return (MovieModel.rating_sum + literal(m * c)) / (MovieModel.rating_count + literal(m))
+
+
+def ranking_rows(settings=None):
+    return select(MovieModel.id, bayesian_score(settings), MovieModel.rating_count).where(MovieModel.rating_count > 0)
+
+
+def ranking_refresh(dialect:str, *movie_ids:int, settings=None):
+    """Upsert the given movies' leaderboard rows from their aggregates; run it in the rating's transaction."""
+    statement = dialect_insert(dialect)(MovieRanking).from_select(
+        ["movie_id", "score", "rating_count"],
+        ranking_rows(settings).where(MovieModel.id.in_(movie_ids)),
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[MovieRanking.movie_id],
+        set_={"score": statement.excluded.score, "rating_count": statement.excluded.rating_count},
+    )
+
+
+def ranking_removal(movie_id:int|None=None):
+    statement = delete(MovieRanking)
+    if movie_id is not None:
+        statement = statement.where(MovieRanking.movie_id == movie_id)
+    return statement
+
+
+def ranking_rebuild(movie_id:int|None=None, settings=None):
+    """Statements replacing the leaderboard rows of one movie, or of the whole catalog, from the aggregates."""
+    rows = ranking_rows(settings)
+    if movie_id is not None:
+        rows = rows.where(MovieModel.id == movie_id)
+    return [
+        ranking_removal(movie_id),
+        insert(MovieRanking).from_select(["movie_id", "score", "rating_count"], rows),
+    ]
+
+
+def rebuild_rankings(db, settings=None) -> int:
+    """Recompute the whole leaderboard, e.g. after changing the prior. Returns the number of ranked movies."""
+    for statement in ranking_rebuild(settings=settings):
+        result = db.execute(statement)
+    db.commit()
+    logger.info("Rebuilt rankings for %s movies", result.rowcount)
+    return result.rowcount
+
+
+def top_movies_query(skip:int=0, limit:int=10):
+    """Best first; walks ``ix_movie_rankings_score`` and joins each row to its movie by primary key."""
+    return (
+        select(
+            MovieModel.id,
+            MovieModel.title,
+            MovieRanking.score,
+            MovieModel.average_rating,
+            MovieRanking.rating_count,
+        )
+        .join(MovieModel, MovieModel.id == MovieRanking.movie_id)
+        .order_by(MovieRanking.score.desc(), MovieRanking.movie_id)
+        .offset(skip)
+        .limit(limit)
+    )
+
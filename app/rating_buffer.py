@@ -0,0 +1,192 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from fastapi import Depends, HTTPException, Request, status
+
+from app.cache import invalidate_movie_detail
+from app.database import get_session_factory
+from app.ratingcrud import insert_rating_batch
+from app.log import get_logger
+
+logger = get_logger("rating_buffer")
+
+
+RETRY_AFTER_SECONDS = "1"
+_STOP = object()
+
+
+class PendingRating:
+    __slots__ = ("values", "future")
+
+    def __init__(self, movie_id:int, user_id:int|None, rating:float):
+        self.values = {"movie_id": movie_id, "user_id": user_id, "rating": rating}
+        self.future = Future()
+        # A running future cannot be cancelled, so a caller that stops waiting
+        # cannot leave the flusher setting the result of a cancelled future.
+        self.future.set_running_or_notify_cancel()
+
+
+class RatingBuffer:
+    """Write-behind queue for new ratings, flushed by one background thread.
+
+    Ratings wait until ``flush_size`` are queued or the oldest has waited
+    ``flush_interval`` seconds, then go in with one multi-row insert and one
+    aggregate update per movie, in a single commit. ``submit`` refuses with
+    ``429`` once ``capacity`` ratings are waiting, so a rating storm cannot
+    grow the queue without bound.
+    """
+
+    def __init__(self, capacity:int, flush_size:int, flush_interval:float, settings=None, commit_timeout:float=5.0):
+        self.queue = queue.Queue(maxsize=capacity)
+        self.settings = settings
+        self.commit_timeout = commit_timeout
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.session_factory = None
+        self.thread = None
+        self._lock = threading.Lock()
+        self.flushed = 0
+        self.batches = 0
+        self.skipped = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def start(self, session_factory) -> "RatingBuffer":
+        with self._lock:
+            if self.thread is None:
+                self.session_factory = session_factory
+                self.thread = threading.Thread(target=self.run, name="rating-buffer", daemon=True)
+                self.thread.start()
+        return self
+
+    def submit(self, movie_id:int, user_id:int|None, rating:float) -> Future:
+        pending = PendingRating(movie_id, user_id, rating)
+        try:
+            self.queue.put_nowait(pending)
+        except queue.Full:
+            self.rejected += 1
+            logger.warning("Rating buffer is full, rejecting rating of movie %s", movie_id)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many ratings, retry shortly",
+                headers={"Retry-After": RETRY_AFTER_SECONDS},
+            )
+        return pending.future
+
+    async def wait(self, future:Future) -> dict:
+        """Await a submitted rating's commit for at most ``commit_timeout`` seconds, else ``503``.
+
+        The rating stays queued after a timeout and is usually committed later,
+        so a retry may get ``400``.
+        """
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.commit_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            logger.warning("Buffered rating not committed within %ss", self.commit_timeout)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Rating not confirmed yet, retry shortly",
+                headers={"Retry-After": RETRY_AFTER_SECONDS},
+            )
+
+    def collect(self) -> tuple[list[PendingRating], bool]:
+        """Block for the next batch; the flag is set once ``stop`` was requested."""
+        first = self.queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_size:
+            try:
+                pending = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if pending is _STOP:
+                return batch, True
+            batch.append(pending)
+        return batch, False
+
+    def flush(self, batch:list[PendingRating]):
+        db = self.session_factory()
+        try:
+            inserted, existing = insert_rating_batch(db, [pending.values for pending in batch], self.settings)
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            self.failed += len(batch)
+            logger.exception("Failed to flush %s buffered ratings", len(batch))
+            for pending in batch:
+                pending.future.set_exception(exc)
+            return
+        finally:
+            db.close()
+
+        self.flushed += len(inserted)
+        self.skipped += len(batch) - len(inserted)
+        self.batches += 1
+        by_key = {(row["movie_id"], row["user_id"]): row for row in inserted}
+        for movie_id in {row["movie_id"] for row in inserted}:
+            invalidate_movie_detail(movie_id)
+        for pending in batch:
+            row = by_key.pop((pending.values["movie_id"], pending.values["user_id"]), None)
+            if row is not None:
+                pending.future.set_result(row)
+            elif pending.values["movie_id"] not in existing:
+                pending.future.set_exception(HTTPException(status_code=404, detail="Movie not found"))
+            else:
+                pending.future.set_exception(HTTPException(status_code=400, detail="You have already rated this movie"))
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self.collect()
+            if batch:
+                self.flush(batch)
+
+    def stop(self, timeout:float=30.0):
+        """Flush everything still queued and end the thread; safe to call more than once."""
+        with self._lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.queue.put(_STOP)
+            thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.thread is not None,
+            "queued": self.queue.qsize(),
+            "capacity": self.queue.maxsize,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+def build_rating_buffer(settings) -> RatingBuffer:
+    return RatingBuffer(
+        settings.rating_buffer_size,
+        settings.rating_flush_size,
+        settings.rating_flush_interval,
+        settings,
+        settings.rating_commit_timeout,
+    )
+
+
+def get_rating_buffer(request:Request, session_factory=Depends(get_session_factory)) -> RatingBuffer | None:
+    """The app's buffer when ``RATING_WRITE_BEHIND`` is on, else ``None`` for direct writes.
+
+    The lifespan builds the buffer from the app's settings and drains it at
+    shutdown; its flush thread starts with the first buffered rating.
+    """
+    buffer = getattr(request.app.state, "rating_buffer", None)
+    if buffer is None or not buffer.settings.rating_write_behind:
+        return None
+    return buffer.start(session_factory)
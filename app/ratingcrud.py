@@ -1,46 +1,194 @@
 from fastapi import Depends, FastAPI, HTTPException
+from sqlalchemy import bindparam, case, exists, func, select, update
 from sqlalchemy.orm import Session
 
 
-from app.crud import get_movies_by_id
-from app.models import Rating as RatingModel
+from app.cache import get_cache_backend, invalidate_movie_detail
+from app.crud import dialect_name, touch_movie
+from app.database import dialect_insert
+from app.models import Movie as MovieModel, Rating as RatingModel
+from app.rankings import ranking_rebuild, ranking_refresh
 from app.schemas import Rating as RatingSchema, RatingCreate
 from app.utils import average_rating
 from app.log  import get_logger
 
 logger = get_logger("rating_crud")
 
+# Columns of the ``uq_ratings_movie_user`` constraint, the upserts' conflict target.
+RATING_KEY = [RatingModel.movie_id, RatingModel.user_id]
+
 
 def get_ratings(db:Session, movie_id:int):
-    db_movies = get_movies_by_id(db, movie_id)
-    if not db_movies:
+    average_rating = db.scalar(select(MovieModel.average_rating).where(MovieModel.id == movie_id))
+    if average_rating is None:
         logger.warning("Movie is not found")
         raise HTTPException(status_code=404, detail="Movie not found")
-    db_ratings = db.query(RatingModel).filter(RatingModel.movie_id == movie_id).all()
-    average_rating = sum(rating.rating for rating in db_ratings)/len(db_ratings) if db_ratings else 0
     return average_rating
 
 
 
-def create_rating(db:Session, ratingPayload:RatingCreate, movie_id:int, user_id:int| None = None) -> float: 
-    db_movies = get_movies_by_id(db, movie_id)
-    if not db_movies:
+def create_rating(db:Session, ratingPayload:RatingCreate, movie_id:int, user_id:int| None = None, settings=None) -> dict:
+    """Record the user's first rating of a movie in one batch, without reading anything first.
+
+    The aggregate UPDATE doubles as the existence check and takes the movie's
+    row lock; ``INSERT ... ON CONFLICT DO NOTHING`` then rejects a second
+    rating atomically, where a SELECT-then-INSERT would let two concurrent
+    requests both through.
+    """
+    if db.execute(rating_aggregate_update(movie_id, ratingPayload.rating)).rowcount == 0:
+        db.rollback()
         logger.warning("Movie is not found")
         raise HTTPException(status_code=404, detail="Movie not found")
-    db_rating = db.query(RatingModel).filter(RatingModel.movie_id == movie_id, RatingModel.user_id == user_id).first()
-    
-    if db_rating:
+    statement = rating_insert(dialect_name(db), movie_id, user_id, ratingPayload.rating)
+    db_rating = db.execute(statement.on_conflict_do_nothing(index_elements=RATING_KEY)).mappings().first()
+    if db_rating is None:
+        db.rollback()
         logger.warning("This movie has already been rated")
         raise HTTPException(status_code=400, detail="You have already rated this movie")
-    db_rating = RatingModel(
-        **ratingPayload.model_dump(),
-        movie_id=movie_id,
-        user_id=user_id,
+    db.execute(ranking_refresh(dialect_name(db), movie_id, settings=settings))
+    db.commit()
+    invalidate_movie_detail(movie_id)
+    return dict(db_rating)
+
+
+def update_rating(db:Session, ratingPayload:RatingCreate, movie_id:int, user_id:int|None=None, settings=None) -> dict:
+    """Set the user's rating of a movie, creating it if needed, with one upsert and no reads.
+
+    ``touch_movie`` is the existence check and takes the movie's row lock in a
+    statement of its own. The aggregate UPDATE that follows then gets a fresh
+    snapshot under READ COMMITTED, which sees any rating a competing request
+    committed while we waited for the lock; folded into one statement, two
+    concurrent first ratings by the same user would both count as new.
+    """
+    if db.execute(touch_movie(movie_id)).rowcount == 0:
+        db.rollback()
+        logger.warning("Movie is not found")
+        raise HTTPException(status_code=404, detail="Movie not found")
+    db.execute(rating_change_update(movie_id, user_id, ratingPayload.rating))
+    db_rating = db.execute(rating_upsert(dialect_name(db), movie_id, user_id, ratingPayload.rating)).mappings().one()
+    db.execute(ranking_refresh(dialect_name(db), movie_id, settings=settings))
+    db.commit()
+    invalidate_movie_detail(movie_id)
+    return dict(db_rating)
+
+
+def rating_insert(dialect:str, movie_id:int, user_id:int|None, rating:float):
+    return (
+        dialect_insert(dialect)(RatingModel)
+        .values(movie_id=movie_id, user_id=user_id, rating=rating)
+        .returning(RatingModel.id, RatingModel.rating, RatingModel.movie_id, RatingModel.user_id)
+    )
+
+
+def rating_upsert(dialect:str, movie_id:int, user_id:int|None, rating:float):
+    statement = rating_insert(dialect, movie_id, user_id, rating)
+    return statement.on_conflict_do_update(index_elements=RATING_KEY, set_={"rating": statement.excluded.rating})
+
+
+def rating_aggregate_update(movie_id:int, rating:float):
+    """UPDATE adding one ``rating`` to the movie's denormalized aggregates."""
+    return (
+        update(MovieModel)
+        .where(MovieModel.id == movie_id)
+        .values(
+            rating_count=MovieModel.rating_count + 1,
+            rating_sum=MovieModel.rating_sum + rating,
+        )
+    )
+
+
+def rating_batch_aggregate_update():
+    """Executemany UPDATE adding ``added`` ratings totalling ``total`` to movie ``movie_key``."""
+    return (
+        update(MovieModel)
+        .where(MovieModel.id == bindparam("movie_key"))
+        .values(
+            rating_count=MovieModel.rating_count + bindparam("added"),
+            rating_sum=MovieModel.rating_sum + bindparam("total"),
+        )
     )
-    db.add(db_rating)
+
+
+def insert_rating_batch(db:Session, ratings:list[dict], settings=None) -> tuple[list[dict], set[int]]:
+    """Insert buffered ``{movie_id, user_id, rating}`` rows with one multi-row upsert.
+
+    Ratings of missing movies are skipped and repeated ``(movie_id, user_id)``
+    pairs are dropped by ``ON CONFLICT DO NOTHING``. Each touched movie's
+    aggregates and leaderboard row are updated once. Returns the inserted rows
+    and the ids of the movies that exist; the caller commits.
+    """
+    movie_ids = {rating["movie_id"] for rating in ratings}
+    existing = set(db.scalars(select(MovieModel.id).where(MovieModel.id.in_(movie_ids))))
+    rows = [rating for rating in ratings if rating["movie_id"] in existing]
+    if not rows:
+        return [], existing
+    dialect = dialect_name(db)
+    statement = (
+        dialect_insert(dialect)(RatingModel)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=RATING_KEY)
+        .returning(RatingModel.id, RatingModel.rating, RatingModel.movie_id, RatingModel.user_id)
+    )
+    inserted = [dict(row) for row in db.execute(statement).mappings()]
+    if not inserted:
+        return [], existing
+
+    totals = {}
+    for row in inserted:
+        added, total = totals.get(row["movie_id"], (0, 0.0))
+        totals[row["movie_id"]] = (added + 1, total + row["rating"])
+    # Core executemany on the session's connection; the ORM would treat a
+    # parameter list as a bulk update by primary key.
+    db.connection().execute(
+        rating_batch_aggregate_update(),
+        [{"movie_key": movie_id, "added": added, "total": total} for movie_id, (added, total) in totals.items()],
+    )
+    db.execute(ranking_refresh(dialect, *totals, settings=settings))
+    return inserted, existing
+
+
+def rating_change_update(movie_id:int, user_id:int|None, rating:float):
+    """UPDATE moving the movie's aggregates from the user's current rating, if any, to ``rating``.
+
+    Must run before the upsert, while the subqueries still see the old rating,
+    and after the movie's row lock is held (see ``update_rating``).
+    """
+    own_rating = (RatingModel.movie_id == movie_id, RatingModel.user_id == user_id)
+    previous = select(RatingModel.rating).where(*own_rating).scalar_subquery()
+    return (
+        update(MovieModel)
+        .where(MovieModel.id == movie_id)
+        .values(
+            rating_count=MovieModel.rating_count + case((exists().where(*own_rating), 0), else_=1),
+            rating_sum=MovieModel.rating_sum + rating - func.coalesce(previous, 0),
+        )
+    )
+
+
+def rating_aggregate_recompute(movie_id:int|None=None):
+    """UPDATE setting ``rating_count``/``rating_sum`` from the ratings table."""
+    count = select(func.count(RatingModel.id)).where(RatingModel.movie_id == MovieModel.id).scalar_subquery()
+    total = select(func.coalesce(func.sum(RatingModel.rating), 0)).where(RatingModel.movie_id == MovieModel.id).scalar_subquery()
+    statement = update(MovieModel).values(rating_count=count, rating_sum=total)
+    if movie_id is not None:
+        statement = statement.where(MovieModel.id == movie_id)
+    return statement.execution_options(synchronize_session=False)
+
+
+def recompute_rating_aggregates(db:Session, movie_id:int|None=None, settings=None) -> int:
+    """Rebuild ``rating_count``/``rating_sum`` from the ratings table.
+
+    Repairs drift in the denormalized aggregates, for one movie or for the whole
+    catalog, and rebuilds the matching leaderboard rows. Returns the number of
+    movies updated.
+    """
+    result = db.execute(rating_aggregate_recompute(movie_id))
+    for ranking_statement in ranking_rebuild(movie_id, settings):
+        db.execute(ranking_statement)
     db.commit()
-    db.refresh(db_rating)
-    return db_rating
+    get_cache_backend().clear()
+    logger.info("Rating aggregates recomputed for %s movies", result.rowcount)
+    return result.rowcount
 
 
 
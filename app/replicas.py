@@ -0,0 +1,183 @@
+import itertools
+import threading
+import time
+from functools import partial
+from http.cookies import SimpleCookie
+
+from fastapi import Depends, Request
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.database import REPLICA_SESSION, SessionLocal, get_db, get_session_factory, pool_options, with_statement_timeout
+from app.metrics import instrument_engine
+from app.log import get_logger
+
+logger = get_logger("replicas")
+
+
+READ_PRIMARY_COOKIE = "read_primary_until"
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+# POST routes that only read, for query payloads too long for a URL.
+READ_ONLY_POSTS = frozenset({"/movies/batch"})
+
+
+def is_read(method:str, path:str) -> bool:
+    return method in SAFE_METHODS or (method == "POST" and path in READ_ONLY_POSTS)
+
+
+class ReplicaSet:
+    """Round-robin over the read replicas that passed their last health check.
+
+    Replicas are probed with ``SELECT 1`` every ``check_interval`` seconds by a
+    background thread (``start``), never inside a request, so an unreachable
+    replica cannot stall reads while its connect attempt times out. A replica
+    counts as unhealthy until its first probe succeeds; ``pick`` returns
+    ``None`` when no replica is healthy so callers fall back to the primary.
+    """
+
+    def __init__(self, engines:list, check_interval:float=5.0):
+        self.engines = engines
+        self.check_interval = check_interval
+        self._healthy = {}
+        self._lock = threading.Lock()
+        self._order = itertools.cycle(range(len(engines))) if engines else None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def probe(self, engine) -> bool:
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            logger.warning("Read replica %s failed its health check", engine.url.render_as_string(hide_password=True))
+            return False
+
+    def check(self):
+        """Probe every replica once and record the outcome."""
+        for engine in self.engines:
+            ok = self.probe(engine)
+            with self._lock:
+                self._healthy[engine] = ok
+
+    def run(self):
+        while True:
+            self.check()
+            if self._stopped.wait(self.check_interval):
+                return
+
+    def start(self) -> "ReplicaSet":
+        if self.engines and self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="replica-health", daemon=True)
+            self._thread.start()
+        return self
+
+    def healthy(self, engine) -> bool:
+        with self._lock:
+            return self._healthy.get(engine, False)
+
+    def pick(self):
+        for _ in range(len(self.engines)):
+            with self._lock:
+                engine = self.engines[next(self._order)]
+            if self.healthy(engine):
+                return engine
+        return None
+
+    def dispose(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(self.check_interval)
+            self._thread = None
+        for engine in self.engines:
+            engine.dispose()
+
+    def status(self) -> list[dict]:
+        with self._lock:
+            return [
+                {
+                    "url": engine.url.render_as_string(hide_password=True),
+                    "healthy": self._healthy.get(engine),
+                }
+                for engine in self.engines
+            ]
+
+
+def build_replica_set(settings) -> ReplicaSet:
+    engines = [instrument_engine(create_engine(url, **pool_options(url, settings))) for url in settings.db_replica_urls]
+    return ReplicaSet(engines, settings.replica_check_interval)
+
+
+# Filled in from DB_REPLICA_URLS by the app's lifespan.
+replica_set = ReplicaSet([])
+
+
+def set_replica_set(replicas:ReplicaSet):
+    global replica_set
+    replica_set = replicas
+
+
+def reads_from_primary(request:Request) -> bool:
+    """Whether this client wrote recently enough that a lagging replica could hide its write."""
+    until = request.cookies.get(READ_PRIMARY_COOKIE)
+    try:
+        return until is not None and float(until) > time.time()
+    except ValueError:
+        return False
+
+
+def read_engine(request:Request):
+    if not replica_set.engines or reads_from_primary(request):
+        return None
+    return replica_set.pick()
+
+
+def get_read_db(request:Request, primary:Session=Depends(get_db)):
+    """Session for read-only endpoints: a healthy replica, or the primary session.
+
+    The primary session is only a fallback; it opens no connection unless used.
+    """
+    engine = read_engine(request)
+    if engine is None:
+        yield primary
+        return
+    db = with_statement_timeout(SessionLocal(bind=engine, info={REPLICA_SESSION: True}))
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_session_factory(request:Request, primary=Depends(get_session_factory)):
+    engine = read_engine(request)
+    return primary if engine is None else partial(SessionLocal, bind=engine, info={REPLICA_SESSION: True})
+
+
+class ReadYourWritesMiddleware:
+    """Pin a client to the primary for a short window after any successful write.
+
+    The window is carried in a cookie, so it follows the client across
+    workers and needs no server-side state.
+    """
+
+    def __init__(self, app, window:float):
+        self.app = app
+        self.window = window
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or is_read(scope["method"], scope["path"]) or self.window <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = SimpleCookie()
+                cookie[READ_PRIMARY_COOKIE] = f"{time.time() + self.window:.3f}"
+                cookie[READ_PRIMARY_COOKIE]["max-age"] = int(self.window) + 1
+                cookie[READ_PRIMARY_COOKIE]["path"] = "/"
+                cookie[READ_PRIMARY_COOKIE]["httponly"] = True
+                header = cookie.output(header="").strip().encode("latin-1")
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", header)]}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
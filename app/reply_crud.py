@@ -1,10 +1,13 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.schemas import ReplyCreate
 from app.models import Reply as ReplyModel
+from app.cache import invalidate_movie_detail
 from app.comment_crud import get_comment_by_id
+from app.crud import touch_movie
 from app.log import get_logger
 
 logger = get_logger("reply_crud")
@@ -18,14 +21,25 @@ def create_reply(db:Session, reply_payload:ReplyCreate, comment_id:int, movie_id
     )
     
     db.add(db_reply)
+    if movie_id is not None:
+        db.execute(touch_movie(movie_id))
     db.commit()
+    if movie_id is not None:
+        invalidate_movie_detail(movie_id)
     db.refresh(db_reply)
     return db_reply
 
 
-def get_replies(db:Session, comment_id:int, skip:int=0, limit:int=10):
-    db_replies = db.query(ReplyModel).filter(ReplyModel.comment_id == comment_id).offset(skip).limit(limit).all()
+def get_replies(db:Session, comment_id:int, skip:int=0, limit:int=10, after:int|None=None):
+    db_replies = db.scalars(reply_listing_query(comment_id, after).offset(skip).limit(limit)).all()
     if db_replies is None:
         logger.warning("No replies found for comment_id %s", comment_id)
         raise HTTPException(status_code=404, detail="No replies found for this comment")
-    return db_replies
\ No newline at end of file
+    return db_replies
+
+
+def reply_listing_query(comment_id:int, after:int|None=None):
+    query = select(ReplyModel).where(ReplyModel.comment_id == comment_id)
+    if after is not None:
+        query = query.where(ReplyModel.id > after)
+    return query.order_by(ReplyModel.id)
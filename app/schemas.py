@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import List, Optional
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 
 
@@ -22,6 +22,10 @@ class User(UserBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class CurrentUser(User):
+    id: int
+
+
 
 class RatingBase(BaseModel):
     rating: float = Field(None, title="Movie Rating", ge=0, le=10, description="The rating of the movie from 0 to 10")
@@ -55,14 +59,45 @@ class MovieUpate(MovieBase):
 class Movie(MovieBase):
     user_id: int 
     release_date: datetime = datetime.now()
+    updated_at: Optional[datetime] = None
     average_rating :  Optional[float] = None
     comments :List["Comment"] = []
+    comment_count: int = 0
+    has_more_comments: bool = False
+    next_comment_cursor: Optional[str] = None
 
    
     model_config = ConfigDict(from_attributes=True)
 
 
 
+class MovieSummary(BaseModel):
+    id: int
+    title: str
+    average_rating: Optional[float] = None
+    rating_count: int = 0
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+MAX_BATCH_IDS = 100
+
+
+class MovieBatchRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=MAX_BATCH_IDS, description="Movie ids, answered in this order")
+    comment_counts: bool = False
+
+
+class RankedMovie(BaseModel):
+    id: int
+    title: str
+    score: float
+    average_rating: Optional[float] = None
+    rating_count: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 class CommentBase(BaseModel):
     content: str
 
@@ -77,9 +112,19 @@ class Comment(CommentBase):
     user_id: int 
     created_at: datetime = datetime.now()
     replies: List["Reply"] = []
+    reply_count: Optional[int] = None
+    has_more_replies: bool = False
+    next_reply_cursor: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
 
+    @model_validator(mode="after")
+    def count_loaded_replies(self):
+        # Threaded listings report the real total; a fully loaded tree counts itself.
+        if self.reply_count is None:
+            self.reply_count = len(self.replies)
+        return self
+
 
 
 
@@ -0,0 +1,92 @@
+import re
+
+from sqlalchemy import DDL, event, text
+
+from app.models import Movie as MovieModel
+from app.log import get_logger
+
+logger = get_logger("search")
+
+
+# Postgres keeps the document in a generated tsvector column, so the index
+# maintains itself. SQLite has no such column; its FTS5 table is kept in step
+# by the hooks below, keyed by rowid = movies.id.
+POSTGRES_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+)
+
+event.listen(
+    MovieModel.__table__,
+    "after_create",
+    DDL("CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(title, description)").execute_if(dialect="sqlite"),
+)
+event.listen(
+    MovieModel.__table__,
+    "after_drop",
+    DDL("DROP TABLE IF EXISTS movies_fts").execute_if(dialect="sqlite"),
+)
+event.listen(
+    MovieModel.__table__,
+    "after_create",
+    DDL(
+        f"ALTER TABLE movies ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({POSTGRES_SEARCH_VECTOR}) STORED"
+    ).execute_if(dialect="postgresql"),
+)
+event.listen(
+    MovieModel.__table__,
+    "after_create",
+    DDL("CREATE INDEX ix_movies_search_vector ON movies USING GIN (search_vector)").execute_if(dialect="postgresql"),
+)
+
+
+def index_statements(dialect:str, movie_id:int, title:str|None, description:str|None) -> list:
+    """Statements that (re)index one movie; empty where the database maintains the index itself."""
+    if dialect != "sqlite":
+        return []
+    return [
+        text("DELETE FROM movies_fts WHERE rowid = :id").bindparams(id=movie_id),
+        text("INSERT INTO movies_fts (rowid, title, description) VALUES (:id, :title, :description)")
+        .bindparams(id=movie_id, title=title or "", description=description or ""),
+    ]
+
+
+def unindex_statements(dialect:str, movie_id:int) -> list:
+    if dialect != "sqlite":
+        return []
+    return [text("DELETE FROM movies_fts WHERE rowid = :id").bindparams(id=movie_id)]
+
+
+def bulk_index_statement(dialect:str, rows:list[dict]):
+    """One executemany INSERT indexing freshly inserted ``rows`` (each carrying its ``id``)."""
+    if dialect != "sqlite" or not rows:
+        return None
+    return (
+        text("INSERT INTO movies_fts (rowid, title, description) VALUES (:id, :title, :description)"),
+        [{"id": row["id"], "title": row["title"], "description": row["description"]} for row in rows],
+    )
+
+
+def fts5_query(q:str) -> str:
+    """Quote every term so user input is matched literally instead of parsed as FTS5 syntax."""
+    terms = re.findall(r"\w+", q)
+    return " ".join(f'"{term}"' for term in terms)
+
+
+def search_query(dialect:str, q:str, skip:int, limit:int):
+    """Ranked page of matching movie ids, best match first; ``None`` when ``q`` has no searchable terms."""
+    if dialect == "postgresql":
+        return text(
+            "SELECT id FROM movies, websearch_to_tsquery('english', :q) AS query "
+            "WHERE search_vector @@ query "
+            "ORDER BY ts_rank_cd(search_vector, query) DESC, id "
+            "LIMIT :limit OFFSET :skip"
+        ).bindparams(q=q, limit=limit, skip=skip)
+    match = fts5_query(q)
+    if not match:
+        return None
+    return text(
+        "SELECT rowid AS id FROM movies_fts WHERE movies_fts MATCH :match "
+        "ORDER BY bm25(movies_fts, 10.0, 1.0), rowid "
+        "LIMIT :limit OFFSET :skip"
+    ).bindparams(match=match, limit=limit, skip=skip)
@@ -0,0 +1,29 @@
+from typing import List
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from app.schemas import Comment as CommentSchema, Movie as MovieSchema, RankedMovie, Reply as ReplySchema
+
+
+# Built once at import, so each request reuses the compiled validators and
+# serializers instead of FastAPI rebuilding them per response.
+movie_list_adapter = TypeAdapter(List[MovieSchema])
+comment_list_adapter = TypeAdapter(List[CommentSchema])
+reply_list_adapter = TypeAdapter(List[ReplySchema])
+ranked_movie_list_adapter = TypeAdapter(List[RankedMovie])
+
+
+class RenderedJSONResponse(Response):
+    """Response whose body is already JSON bytes."""
+
+    media_type = "application/json"
+
+
+def render(adapter:TypeAdapter, items) -> RenderedJSONResponse:
+    """Validate ORM rows straight into the schema and emit JSON in one step.
+
+    Replaces ``jsonable_encoder`` + ``response_model`` re-validation + ``json.dumps``:
+    attributes are read once, and ``dump_json`` writes bytes from pydantic-core.
+    """
+    return RenderedJSONResponse(adapter.dump_json(adapter.validate_python(items, from_attributes=True)))
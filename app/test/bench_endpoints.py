@@ -0,0 +1,332 @@
+"""Endpoint and CRUD micro-benchmarks at growing data sizes.
+
+Reuses the in-memory database and dependency overrides of
+``test_all_endpoints``, seeds ``size`` ratings and comments (plus
+``size / 10`` replies piled onto a few hot threads), then times every route
+and CRUD function, counting the SQL statements each call issues.
+
+    python -m app.test.bench_endpoints --sizes 1000 10000 100000 1000000 --output bench.json
+    python -m app.test.bench_endpoints --sizes 1000 10000 --compare bench.json
+
+``--cold-start-runs`` also times fresh interpreters importing ``app.main``
+and serving their first request through the lifespan.
+
+Not collected by pytest; the module name does not start with ``test_``.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert
+
+from app.auth import create_access_token, get_password_context, token_cache
+from app.bulk_import import insert_movie_batch
+from app.cache import get_cache_backend
+from app.comment_crud import create_movie_comment, get_comments
+from app.crud import edit_movie, get_movie_page_versions, get_movies, get_movies_by_id, get_movies_by_ids, movie_exists, search_movies
+from app.database import Base
+from app.models import Comment as CommentModel, Rating as RatingModel, Reply as ReplyModel, User as UserModel
+from app.ratingcrud import create_rating, get_ratings, recompute_rating_aggregates
+from app.reply_crud import get_replies
+from app.schemas import CommentCreate, MovieUpate, RatingCreate
+from app.test.test_all_endpoints import TestSessionLocal, app, engine
+
+
+PERCENTILES = (50, 95, 99)
+SEED_BATCH = 10000
+SEARCH_WORDS = ("nebula", "harbour", "voyage", "comet", "drift", "quiet", "storm", "garden")
+WATCHLIST_SIZE = 50
+
+
+def percentile(samples:list[float], pct:int) -> float:
+    """Nearest-rank percentile of ``samples``."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine, "before_cursor_execute", self)
+
+
+class Dataset:
+    """Ids and credentials of a seeded database."""
+
+    def __init__(self, size:int, iterations:int):
+        self.size = size
+        self.movie_count = max(20, size // 100)
+        self.rater_count = math.ceil(size / self.movie_count)
+        self.reply_count = size // 10
+        self.hot_comments = max(1, size // 1000)
+        # Fresh users that have rated nothing yet, one per rating write.
+        self.spare_raters = range(self.rater_count + 2, self.rater_count + 2 + 2 * iterations)
+        self.owner_id = 1
+
+
+def seed(size:int, iterations:int) -> Dataset:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    get_cache_backend().clear()
+    token_cache.clear()
+    data = Dataset(size, iterations)
+    hashed = get_password_context().hash("password")
+
+    def batched(rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= SEED_BATCH:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    user_total = data.spare_raters.stop
+    with engine.begin() as conn:
+        for batch in batched({"id": n, "username": f"bench{n}", "email": f"bench{n}@example.com", "hashed_password": hashed} for n in range(1, user_total)):
+            conn.execute(insert(UserModel), batch)
+    with TestSessionLocal() as db:
+        for batch in batched(
+            {
+                "title": f"{SEARCH_WORDS[n % len(SEARCH_WORDS)].title()} {n}",
+                "description": f"A {SEARCH_WORDS[(n * 3) % len(SEARCH_WORDS)]} story number {n}",
+                "duration": 90 + n % 60,
+                "user_id": data.owner_id,
+            }
+            for n in range(data.movie_count)
+        ):
+            insert_movie_batch(db, batch)
+    with engine.begin() as conn:
+        for batch in batched({"rating": 1 + n % 10, "movie_id": 1 + n % data.movie_count, "user_id": 2 + n // data.movie_count} for n in range(size)):
+            conn.execute(insert(RatingModel), batch)
+        for batch in batched({"content": f"comment {n}", "movie_id": 1 + n % data.movie_count, "user_id": 1 + n % user_total} for n in range(size)):
+            conn.execute(insert(CommentModel), batch)
+        for batch in batched({"content": f"reply {n}", "comment_id": 1 + n % data.hot_comments, "user_id": 1 + n % user_total} for n in range(data.reply_count)):
+            conn.execute(insert(ReplyModel), batch)
+    with TestSessionLocal() as db:
+        recompute_rating_aggregates(db)
+    return data
+
+
+def measure(call, iterations:int) -> dict:
+    timings, cpu, statements = [], [], []
+    for n in range(iterations):
+        with StatementCounter() as counter:
+            started, cpu_started = time.perf_counter(), time.process_time()
+            call(n)
+            timings.append((time.perf_counter() - started) * 1000)
+            cpu.append((time.process_time() - cpu_started) * 1000)
+        statements.append(counter.count)
+    result = {f"p{pct}_ms": round(percentile(timings, pct), 3) for pct in PERCENTILES}
+    result["mean_ms"] = round(sum(timings) / len(timings), 3)
+    # In-process client and in-memory database: CPU time is the whole request's cost.
+    result["cpu_mean_ms"] = round(sum(cpu) / len(cpu), 3)
+    result["queries"] = percentile(statements, 50)
+    result["max_queries"] = max(statements)
+    return result
+
+
+COLD_START_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app) as client:
+    client.get("/cache/stats")
+    served = time.perf_counter()
+print(json.dumps({
+    "import app.main": (imported - started) * 1000,
+    "first response": (served - started) * 1000,
+    "heavy_imports": sorted(m for m in ("passlib", "jose", "bcrypt") if m in sys.modules),
+}))
+"""
+
+
+def cold_start(runs:int) -> dict:
+    """Import time and time to first response of fresh interpreters, against an empty database file."""
+    samples = {"import app.main": [], "first response": [], "process": []}
+    heavy_imports = []
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {**os.environ, "db_url": f"sqlite:///{os.path.join(workdir, 'cold.db')}", "PYTHONPATH": os.getcwd(), "LOG_FILE": ""}
+        for _ in range(runs):
+            started = time.perf_counter()
+            output = subprocess.run([sys.executable, "-c", COLD_START_PROBE], cwd=workdir, env=env, capture_output=True, text=True, check=True)
+            samples["process"].append((time.perf_counter() - started) * 1000)
+            probe = json.loads(output.stdout.strip().splitlines()[-1])
+            heavy_imports = probe.pop("heavy_imports")
+            for name, elapsed in probe.items():
+                samples[name].append(elapsed)
+    results = {}
+    for name, timings in samples.items():
+        results[name] = {f"p{pct}_ms": round(percentile(timings, pct), 3) for pct in PERCENTILES}
+        results[name]["mean_ms"] = round(sum(timings) / len(timings), 3)
+        results[name]["queries"] = 0
+    results["import app.main"]["heavy_imports"] = heavy_imports
+    return results
+
+
+def route_cases(client:TestClient, data:Dataset) -> dict:
+    headers = {"Authorization": f"Bearer {create_access_token('bench1', user_id=data.owner_id)}"}
+
+    def rater_headers(n):
+        user_id = data.spare_raters[n]
+        return {"Authorization": f"Bearer {create_access_token(f'bench{user_id}', user_id=user_id)}"}
+
+    def movie(n):
+        return 1 + n % data.movie_count
+
+    def ok(response, expected=200):
+        assert response.status_code == expected, (response.status_code, response.text[:200])
+
+    def delete_new_movie(n):
+        movie_id = client.post("/movies/create", json={"title": "Short lived", "description": "d", "duration": 1}, headers=headers).json()["data"]["id"]
+        ok(client.delete(f"/movies/{movie_id}", headers=headers))
+
+    import_body = "\n".join(json.dumps({"title": f"Imported {n}", "description": "d", "duration": 90}) for n in range(100)).encode()
+    return {
+        "POST /signup": lambda n: ok(client.post("/signup", json={"username": f"new{data.size}-{n}", "password": "password", "email": f"new{data.size}-{n}@example.com"}), 201),
+        "POST /login": lambda n: ok(client.post("/login", data={"username": "bench1", "password": "password"})),
+        "GET /Movies/": lambda n: ok(client.get("/Movies/", params={"limit": 10, "skip": n})),
+        "GET /Movies/ limit=100": lambda n: ok(client.get("/Movies/", params={"limit": 100})),
+        "GET /Movies/ limit=100 view=summary": lambda n: ok(client.get("/Movies/", params={"limit": 100, "view": "summary"})),
+        "GET /movie/{id}": lambda n: ok(client.get(f"/movie/{movie(n)}")),
+        "GET /movies/search": lambda n: ok(client.get("/movies/search", params={"q": SEARCH_WORDS[n % len(SEARCH_WORDS)]})),
+        "GET /movies/top": lambda n: ok(client.get("/movies/top", params={"limit": 10, "skip": n})),
+        "GET /movies/batch": lambda n: ok(client.get("/movies/batch", params={"ids": ",".join(str(movie(n * WATCHLIST_SIZE + k)) for k in range(WATCHLIST_SIZE))})),
+        "GET /movies/export": lambda n: ok(client.get("/movies/export")),
+        "POST /movies/create": lambda n: ok(client.post("/movies/create", json={"title": "Bench", "description": "d", "duration": 90}, headers=headers), 201),
+        "POST /movies/import": lambda n: ok(client.post("/movies/import", content=import_body, headers={**headers, "Content-Type": "application/x-ndjson"})),
+        "PUT /movies/{id}": lambda n: ok(client.put(f"/movies/{movie(n)}", json={"title": f"Edited {n}", "description": "d", "duration": 90}, headers=headers)),
+        "POST+DELETE /movies/{id}": delete_new_movie,
+        "POST /movies/{id}/create_comment": lambda n: ok(client.post(f"/movies/{movie(n)}/create_comment", json={"content": "bench"}, headers=headers)),
+        "GET /movies/{id}/comments": lambda n: ok(client.get(f"/movies/{movie(n)}/comments")),
+        "POST /comments/{id}/comments": lambda n: ok(client.post(f"/comments/{1 + n % data.hot_comments}/comments", json={"content": "bench"}, headers=headers)),
+        "GET /comments/{id}/replies": lambda n: ok(client.get(f"/comments/{1 + n % data.hot_comments}/replies", params={"limit": 50})),
+        "POST /movie/{id}/create_rating": lambda n: ok(client.post(f"/movie/{movie(n)}/create_rating", json={"rating": 7}, headers=rater_headers(n))),
+        "PUT /movie/{id}/rating": lambda n: ok(client.put(f"/movie/{movie(n)}/rating", json={"rating": 1 + n % 10}, headers=headers)),
+        "GET /movie/rating/{id}": lambda n: ok(client.get(f"/movie/rating/{movie(n)}")),
+    }
+
+
+def crud_cases(db, data:Dataset, iterations:int) -> dict:
+    def movie(n):
+        return 1 + n % data.movie_count
+
+    def cold_movie(n):
+        get_cache_backend().clear()
+        get_movies_by_id(db, movie(n))
+
+    def watchlist(n):
+        get_cache_backend().clear()
+        return [movie(n * WATCHLIST_SIZE + k) for k in range(WATCHLIST_SIZE)]
+
+    return {
+        "crud.get_movies": lambda n: get_movies(db, skip=n, limit=10),
+        "crud.get_movies_by_id (cold)": cold_movie,
+        "crud.get_movies_by_id x50 (cold)": lambda n: [get_movies_by_id(db, movie_id) for movie_id in watchlist(n)],
+        "crud.get_movies_by_ids x50 (cold)": lambda n: get_movies_by_ids(db, watchlist(n)),
+        "crud.get_movies_by_id (warm)": lambda n: get_movies_by_id(db, 1),
+        "crud.movie_exists": lambda n: movie_exists(db, movie(n)),
+        "crud.get_movie_page_versions": lambda n: get_movie_page_versions(db, skip=n, limit=10),
+        "crud.search_movies": lambda n: search_movies(db, SEARCH_WORDS[n % len(SEARCH_WORDS)]),
+        "crud.edit_movie": lambda n: edit_movie(db, movie(n), MovieUpate(title=f"Crud {n}", description="d", duration=90), data.owner_id),
+        "comment_crud.get_comments": lambda n: get_comments(db, movie(n)),
+        "comment_crud.create_movie_comment": lambda n: create_movie_comment(movie(n), db, CommentCreate(content="crud"), data.owner_id),
+        "reply_crud.get_replies": lambda n: get_replies(db, 1 + n % data.hot_comments, limit=50),
+        "ratingcrud.get_ratings": lambda n: get_ratings(db, movie(n)),
+        "ratingcrud.create_rating": lambda n: create_rating(db, RatingCreate(rating=4), movie(n), data.spare_raters[iterations + n]),
+    }
+
+
+def run(sizes:list[int], iterations:int, slow_iterations:int, only:str|None=None, cold_start_runs:int=0) -> dict:
+    client = TestClient(app)
+    results = {}
+    if cold_start_runs:
+        results["cold_start"] = cold_start(cold_start_runs)
+        print(f"  cold start: {results['cold_start']}", file=sys.stderr)
+    for size in sizes:
+        started = time.perf_counter()
+        data = seed(size, iterations)
+        print(f"seeded size={size} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        results[str(size)] = {}
+        with TestSessionLocal() as db:
+            cases = {**route_cases(client, data), **crud_cases(db, data, iterations)}
+            for name, call in cases.items():
+                if only and only not in name:
+                    continue
+                slow = name in ("POST /signup", "POST /login")
+                results[str(size)][name] = measure(call, slow_iterations if slow else iterations)
+                print(f"  {name}: {results[str(size)][name]}", file=sys.stderr)
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": iterations,
+        },
+        "results": results,
+    }
+
+
+def compare(current:dict, baseline:dict, threshold:float, metric:str="p95_ms") -> list[str]:
+    """Regressions of ``current`` against ``baseline``: slower than ``threshold`` allows, or more queries."""
+    regressions = []
+    for size, cases in current["results"].items():
+        for name, result in cases.items():
+            before = baseline["results"].get(size, {}).get(name)
+            if before is None:
+                continue
+            if result[metric] > before[metric] * (1 + threshold):
+                regressions.append(f"size={size} {name}: {metric} {before[metric]} -> {result[metric]}")
+            if result["queries"] > before["queries"]:
+                regressions.append(f"size={size} {name}: queries {before['queries']} -> {result['queries']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--slow-iterations", type=int, default=5, help="iterations for bcrypt-bound routes")
+    parser.add_argument("--only", help="run only cases whose name contains this text")
+    parser.add_argument("--output", help="write results as a JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to check the results against")
+    parser.add_argument("--cold-start-runs", type=int, default=5, help="fresh interpreters to time; 0 skips the cold-start check")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before flagging, as a fraction")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.iterations, args.slow_iterations, args.only, args.cold_start_runs)
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2)
+    print(json.dumps(results["results"], indent=2))
+    if args.compare:
+        with open(args.compare) as fh:
+            regressions = compare(results, json.load(fh), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
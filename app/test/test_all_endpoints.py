@@ -6,10 +6,14 @@ import warnings
 
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session, sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.pool import StaticPool
 from app.main import app
-from app.database import Base, get_db
+from app.cache import MISSING, LRUCache, get_cache_backend
+from app.auth import create_access_token, token_cache
+from app.database import Base, get_db, get_session_factory
+from app.metrics import instrument_engine
+from app.models import User as UserModel
 from app.schemas import MovieCreate, CommentCreate, ReplyCreate, RatingCreate
 
 
@@ -17,7 +21,7 @@ from app.schemas import MovieCreate, CommentCreate, ReplyCreate, RatingCreate
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+engine = instrument_engine(create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool))
 TestSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base.metadata.create_all(bind=engine)
@@ -31,6 +35,7 @@ def override_get_db():
         db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_session_factory] = lambda: TestSessionLocal
 
 movie_data = {
     "title": "Test Movie",
@@ -62,14 +67,19 @@ rating_data = {
 
 @pytest.fixture(scope="module")
 def test_client():
-    return TestClient(app)
+    with TestClient(app) as client:
+        yield client
 
 
 @pytest.fixture(scope="module")
 def setup_database():
     Base.metadata.create_all(bind=engine)
+    get_cache_backend().clear()
+    token_cache.clear()
     yield
     Base.metadata.drop_all(bind=engine)
+    get_cache_backend().clear()
+    token_cache.clear()
 
 
 #USER TESTS
@@ -286,3 +296,1034 @@ def test_get_movie_rating(test_client: TestClient, setup_database: None, usernam
     rating_data_response = response.json()
     assert rating_data_response["message"] ==  "Average rating for movie retrieved successfully"
  
+
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_get_movies_query_count_is_constant(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password']):
+    response = test_client.post("/login", data={"username": username, "password": password})
+    assert response.status_code == 200
+    token = response.json()["access_token"]
+
+    for _ in range(6):
+        response = test_client.post("/movies/create", json=movie_data, headers={"Authorization": f"Bearer {token}"})
+        movie_id = response.json()['data'].get("id")
+        test_client.post(f"/movie/{movie_id}/create_rating", json=rating_data, headers={"Authorization": f"Bearer {token}"})
+        response = test_client.post(f"/movies/{movie_id}/create_comment", json=comment_data, headers={"Authorization": f"Bearer {token}"})
+        comment_id = response.json()["data"].get("id")
+        test_client.post(f"/comments/{comment_id}/comments", json=reply_data, headers={"Authorization": f"Bearer {token}"})
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        counts = []
+        for limit in (10, 50):
+            statements.clear()
+            response = test_client.get("/Movies/", params={"limit": limit})
+            assert response.status_code == 200
+            counts.append(len(statements))
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+
+    assert len(response.json()) > 10
+    assert counts[0] == counts[1]
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_rating_aggregates_are_maintained(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password']):
+    response = test_client.post("/login", data={"username": username, "password": password})
+    assert response.status_code == 200
+    token = response.json()["access_token"]
+
+    response = test_client.post("/movies/create", json=movie_data, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 201
+    movie_id = response.json()['data'].get("id")
+
+    response = test_client.post(f"/movie/{movie_id}/create_rating", json={"rating": 7}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+    response = test_client.get(f"/movie/rating/{movie_id}")
+    assert response.status_code == 200
+    assert response.json()["data"] == 7
+
+    response = test_client.get(f"/movie/{movie_id}")
+    assert response.json()["average_rating"] == 7
+
+    response = test_client.get("/movie/rating/999999")
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_rating_upsert_changes_a_rating_without_reads(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password']):
+    response = test_client.post("/login", data={"username": username, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    movie_id = test_client.post("/movies/create", json=movie_data, headers=headers).json()["data"]["id"]
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        response = test_client.put(f"/movie/{movie_id}/rating", json={"rating": 3}, headers=headers)
+        assert response.status_code == 200
+        created = response.json()["data"]
+        statements.clear()
+        response = test_client.put(f"/movie/{movie_id}/rating", json={"rating": 9}, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+
+    assert response.json()["data"] == {**created, "rating": 9}
+    assert not [statement for statement in statements if statement.lstrip().upper().startswith("SELECT")]
+    # The movie row lock is taken before the aggregates read the previous rating.
+    writes = [" ".join(statement.split()) for statement in statements]
+    assert writes[0].startswith("UPDATE movies SET updated_at=") and "rating_count" not in writes[0]
+    assert writes[1].startswith("UPDATE movies SET rating_count=")
+    assert test_client.post(f"/movie/{movie_id}/create_rating", json={"rating": 1}, headers=headers).status_code == 400
+    movie = test_client.get(f"/movie/{movie_id}").json()
+    assert movie["average_rating"] == 9
+    assert [m for m in test_client.get("/Movies/", params={"view": "summary", "limit": 1000}).json() if m["id"] == movie_id][0]["rating_count"] == 1
+
+    assert test_client.put("/movie/999999/rating", json={"rating": 5}, headers=headers).status_code == 404
+    assert test_client.post("/movie/999999/create_rating", json={"rating": 5}, headers=headers).status_code == 404
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_write_behind_ratings_flush_in_batches(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password'], monkeypatch: pytest.MonkeyPatch):
+    from fastapi import HTTPException
+    from app.config import get_settings
+    from app.rating_buffer import RatingBuffer, get_rating_buffer
+
+    response = test_client.post("/login", data={"username": username, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    movie_ids = [test_client.post("/movies/create", json=movie_data, headers=headers).json()["data"]["id"] for _ in range(2)]
+
+    buffer = RatingBuffer(capacity=100, flush_size=50, flush_interval=0.2).start(TestSessionLocal)
+    app.dependency_overrides[get_rating_buffer] = lambda: buffer
+    try:
+        response = test_client.post(f"/movie/{movie_ids[0]}/create_rating", json={"rating": 4}, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["data"]["rating"] == 4
+        assert test_client.post(f"/movie/{movie_ids[0]}/create_rating", json={"rating": 4}, headers=headers).status_code == 400
+        assert test_client.post("/movie/999999/create_rating", json={"rating": 4}, headers=headers).status_code == 404
+
+        batches = buffer.batches
+        futures = [buffer.submit(movie_ids[n % 2], 1000 + n, 1 + n % 10) for n in range(20)]
+        for future in futures:
+            future.result(timeout=5)
+        assert buffer.batches - batches <= 2
+        first, second = (test_client.get(f"/movie/{movie_id}").json() for movie_id in movie_ids)
+        assert first["average_rating"] == pytest.approx((4 + sum(1 + n % 10 for n in range(0, 20, 2))) / 11)
+        assert second["average_rating"] == pytest.approx(sum(1 + n % 10 for n in range(1, 20, 2)) / 10)
+        assert movie_ids[0] in [movie["id"] for movie in test_client.get("/movies/top", params={"limit": 1000}).json()]
+
+        monkeypatch.setattr(get_settings(), "rating_durability", "accepted")
+        response = test_client.post(f"/movie/{movie_ids[1]}/create_rating", json={"rating": 10}, headers=headers)
+        assert response.status_code == 202
+        assert test_client.post("/movie/999999/create_rating", json={"rating": 4}, headers=headers).status_code == 404
+        buffer.stop()
+        assert buffer.stats()["queued"] == 0
+        assert test_client.get(f"/movie/rating/{movie_ids[1]}").json()["data"] == pytest.approx((sum(1 + n % 10 for n in range(1, 20, 2)) + 10) / 11)
+    finally:
+        buffer.stop()
+        del app.dependency_overrides[get_rating_buffer]
+
+    full = RatingBuffer(capacity=1, flush_size=1, flush_interval=0)
+    full.submit(movie_ids[0], 2000, 5)
+    with pytest.raises(HTTPException) as rejected:
+        full.submit(movie_ids[0], 2001, 5)
+    assert rejected.value.status_code == 429
+    assert full.stats()["rejected"] == 1
+
+    # A flusher that never commits costs the client a 503, not a request thread.
+    monkeypatch.setattr(get_settings(), "rating_durability", "committed")
+    stalled = RatingBuffer(capacity=10, flush_size=1, flush_interval=0, commit_timeout=0.05)
+    app.dependency_overrides[get_rating_buffer] = lambda: stalled
+    try:
+        response = test_client.post(f"/movie/{movie_ids[0]}/create_rating", json={"rating": 4}, headers=headers)
+    finally:
+        del app.dependency_overrides[get_rating_buffer]
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert stalled.stats()["timed_out"] == 1
+    pending = stalled.queue.get_nowait()
+    assert not pending.future.cancel()
+
+
+def test_movies_cursor_pagination(test_client: TestClient, setup_database: None):
+    from sqlalchemy import select
+    from app.models import Movie as MovieModel
+
+    response = test_client.get("/Movies/", params={"limit": 3})
+    assert response.status_code == 200
+    first_page = response.json()
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = test_client.get("/Movies/", params={"limit": 3, "after": cursor})
+    assert response.status_code == 200
+    second_page = response.json()
+    assert second_page
+
+    response = test_client.get("/Movies/", params={"skip": 3, "limit": 3})
+    assert response.json() == second_page
+    assert first_page + second_page == test_client.get("/Movies/", params={"limit": 6}).json()
+
+    # The full representation has no id; page through ids to check the order itself.
+    with TestSessionLocal() as db:
+        expected = db.scalars(select(MovieModel.id).order_by(MovieModel.id).limit(6)).all()
+    response = test_client.get("/Movies/", params={"limit": 3, "fields": "id"})
+    first_ids = [m["id"] for m in response.json()]
+    response = test_client.get("/Movies/", params={"limit": 3, "fields": "id", "after": response.headers["X-Next-Cursor"]})
+    second_ids = [m["id"] for m in response.json()]
+    assert first_ids + second_ids == expected
+    assert not set(first_ids) & set(second_ids)
+
+    response = test_client.get("/Movies/", params={"after": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_comment_and_reply_cursor_pagination(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password']):
+    response = test_client.post("/login", data={"username": username, "password": password})
+    token = response.json()["access_token"]
+
+    response = test_client.post("/movies/create", json=movie_data, headers={"Authorization": f"Bearer {token}"})
+    movie_id = response.json()['data'].get("id")
+    for n in range(3):
+        response = test_client.post(f"/movies/{movie_id}/create_comment", json={"content": f"comment {n}"}, headers={"Authorization": f"Bearer {token}"})
+    comment_id = response.json()["data"].get("id")
+    for n in range(3):
+        test_client.post(f"/comments/{comment_id}/comments", json={"content": f"reply {n}"}, headers={"Authorization": f"Bearer {token}"})
+
+    response = test_client.get(f"/movies/{movie_id}/comments", params={"limit": 2})
+    assert [c["content"] for c in response.json()] == ["comment 0", "comment 1"]
+    response = test_client.get(f"/movies/{movie_id}/comments", params={"limit": 2, "after": response.headers["X-Next-Cursor"]})
+    assert [c["content"] for c in response.json()] == ["comment 2"]
+    assert "X-Next-Cursor" not in response.headers
+
+    response = test_client.get(f"/comments/{comment_id}/replies", params={"limit": 2})
+    assert response.status_code == 200
+    assert [r["content"] for r in response.json()] == ["reply 0", "reply 1"]
+    response = test_client.get(f"/comments/{comment_id}/replies", params={"limit": 2, "after": response.headers["X-Next-Cursor"]})
+    assert [r["content"] for r in response.json()] == ["reply 2"]
+
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_comment_threads_are_bounded(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password']):
+    response = test_client.post("/login", data={"username": username, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    movie_id = test_client.post("/movies/create", json=movie_data, headers=headers).json()['data'].get("id")
+    comment_ids = [test_client.post(f"/movies/{movie_id}/create_comment", json={"content": f"comment {n}"}, headers=headers).json()["data"]["id"] for n in range(4)]
+    for n, comment_id in enumerate(comment_ids):
+        for m in range(n * 2):
+            test_client.post(f"/comments/{comment_id}/comments", json={"content": f"reply {n}.{m}"}, headers=headers)
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        counts = []
+        for limit in (1, 4):
+            statements.clear()
+            response = test_client.get(f"/movies/{movie_id}/comments", params={"limit": limit, "reply_limit": 3})
+            counts.append(len(statements))
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+    assert counts[0] == counts[1]
+
+    threads = response.json()
+    assert [len(c["replies"]) for c in threads] == [0, 2, 3, 3]
+    assert [c["reply_count"] for c in threads] == [0, 2, 4, 6]
+    assert [c["has_more_replies"] for c in threads] == [False, False, True, True]
+    assert threads[1]["next_reply_cursor"] is None
+    assert [r["content"] for r in threads[3]["replies"]] == ["reply 3.0", "reply 3.1", "reply 3.2"]
+    rest = test_client.get(f"/comments/{comment_ids[3]}/replies", params={"after": threads[3]["next_reply_cursor"]}).json()
+    assert [r["content"] for r in rest] == ["reply 3.3", "reply 3.4", "reply 3.5"]
+
+    threads = test_client.get(f"/movies/{movie_id}/comments", params={"reply_limit": 0}).json()
+    assert [c["replies"] for c in threads] == [[], [], [], []]
+    assert [c["reply_count"] for c in threads] == [0, 2, 4, 6]
+    assert threads[3]["has_more_replies"] and threads[3]["next_reply_cursor"] is None
+
+
+def test_lru_cache_evicts_by_size_and_ttl():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+    expired = LRUCache(maxsize=2, ttl=-1)
+    expired.set("a", 1)
+    assert expired.get("a") is MISSING
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_movie_cache_is_invalidated_by_writes(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password']):
+    response = test_client.post("/login", data={"username": username, "password": password})
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = test_client.post("/movies/create", json=movie_data, headers=headers)
+    movie_id = response.json()['data'].get("id")
+
+    hits = test_client.get("/cache/stats").json()["hits"]
+    assert test_client.get(f"/movie/{movie_id}").json()["comments"] == []
+    assert test_client.get(f"/movie/{movie_id}").json()["comments"] == []
+    assert test_client.get("/cache/stats").json()["hits"] > hits
+
+    response = test_client.post(f"/movies/{movie_id}/create_comment", json=comment_data, headers=headers)
+    comment_id = response.json()["data"].get("id")
+    assert test_client.get(f"/movie/{movie_id}").json()["comments"][0]["replies"] == []
+
+    test_client.post(f"/comments/{comment_id}/comments", json=reply_data, headers=headers)
+    assert test_client.get(f"/movie/{movie_id}").json()["comments"][0]["replies"][0]["content"] == "I agree!"
+
+    test_client.post(f"/movie/{movie_id}/create_rating", json={"rating": 4}, headers=headers)
+    assert test_client.get(f"/movie/{movie_id}").json()["average_rating"] == 4
+
+    test_client.put(f"/movies/{movie_id}", json={"title": "Cached Movie"}, headers=headers)
+    assert test_client.get(f"/movie/{movie_id}").json()["title"] == "Cached Movie"
+
+    test_client.delete(f"/movies/{movie_id}", headers=headers)
+    assert test_client.get(f"/movie/{movie_id}").status_code == 404
+    response = test_client.post(f"/movies/{movie_id}/create_comment", json=comment_data, headers=headers)
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_conditional_get_returns_not_modified(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password']):
+    response = test_client.post("/login", data={"username": username, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    response = test_client.post("/movies/create", json=movie_data, headers=headers)
+    movie_id = response.json()['data'].get("id")
+
+    for url in (f"/movie/{movie_id}", f"/movies/{movie_id}/comments", "/Movies/?limit=100"):
+        response = test_client.get(url)
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        last_modified = response.headers.get("Last-Modified")
+
+        response = test_client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+        if url.startswith("/Movies/"):
+            assert last_modified is None
+            continue
+        response = test_client.get(url, headers={"If-Modified-Since": last_modified})
+        assert response.status_code == 304
+
+    # Deleting a movie changes the page without touching the remaining rows.
+    doomed = test_client.post("/movies/create", json=movie_data, headers=headers).json()["data"]["id"]
+    page = test_client.get("/Movies/?limit=1000")
+    assert test_client.delete(f"/movies/{doomed}", headers=headers).status_code == 200
+    response = test_client.get("/Movies/?limit=1000", headers={"If-None-Match": page.headers["ETag"], "If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+    assert response.status_code == 200
+
+    response = test_client.get(f"/movie/{movie_id}")
+    etag = response.headers["ETag"]
+    for write in (
+        lambda: test_client.post(f"/movies/{movie_id}/create_comment", json=comment_data, headers=headers),
+        lambda: test_client.post(f"/movie/{movie_id}/create_rating", json=rating_data, headers=headers),
+        lambda: test_client.put(f"/movies/{movie_id}", json={"title": "Versioned"}, headers=headers),
+    ):
+        assert write().status_code == 200
+        response = test_client.get(f"/movie/{movie_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        etag = response.headers["ETag"]
+
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_verified_tokens_are_cached_until_user_changes(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password']):
+    response = test_client.post("/login", data={"username": username, "password": password})
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    response = test_client.post("/movies/create", json=movie_data, headers=headers)
+    assert response.status_code == 201
+
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record_statement)
+    try:
+        response = test_client.post("/movies/create", json=movie_data, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", record_statement)
+    assert response.status_code == 201
+    assert not any("FROM users" in statement for statement in statements)
+
+    db = TestSessionLocal()
+    try:
+        db_user = db.query(UserModel).filter(UserModel.username == username).first()
+        db_user.email = "changed@example.com"
+        db.commit()
+        user_id = db_user.id
+    finally:
+        db.close()
+    assert token_cache.get(token) is None
+    response = test_client.post("/movies/create", json=movie_data, headers=headers)
+    assert response.status_code == 201
+    assert token_cache.get(token).email == "changed@example.com"
+
+    legacy_token = create_access_token(username)
+    response = test_client.post("/movies/create", json=movie_data, headers={"Authorization": f"Bearer {legacy_token}"})
+    assert response.status_code == 201
+
+    expired_token = create_access_token(username, expire_delta=-60, user_id=user_id)
+    response = test_client.post("/movies/create", json=movie_data, headers={"Authorization": f"Bearer {expired_token}"})
+    assert response.status_code == 401
+
+
+def test_login_upgrades_outdated_password_hash(test_client: TestClient, setup_database: None):
+    from passlib.context import CryptContext
+    from app.auth import get_password_context
+
+    pwd_context = get_password_context()
+
+    db = TestSessionLocal()
+    try:
+        legacy_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("password")
+        db.add(UserModel(username="legacy", email="legacy@example.com", hashed_password=legacy_hash))
+        db.commit()
+    finally:
+        db.close()
+    assert pwd_context.needs_update(legacy_hash)
+
+    response = test_client.post("/login", data={"username": "legacy", "password": "password"})
+    assert response.status_code == 200
+
+    db = TestSessionLocal()
+    try:
+        upgraded_hash = db.query(UserModel).filter(UserModel.username == "legacy").first().hashed_password
+    finally:
+        db.close()
+    assert upgraded_hash != legacy_hash
+    assert not pwd_context.needs_update(upgraded_hash)
+    assert test_client.post("/login", data={"username": "legacy", "password": "password"}).status_code == 200
+    assert test_client.post("/login", data={"username": "legacy", "password": "wrong"}).status_code == 401
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_bulk_import_streams_ndjson_and_csv(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password'], monkeypatch: pytest.MonkeyPatch):
+    from app.config import get_settings
+
+    monkeypatch.setattr(get_settings(), "import_batch_size", 2)
+    response = test_client.post("/login", data={"username": username, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    def ndjson_body():
+        yield b'{"title": "Imported 1", "description": "d", "duration": 90}\n{"title": "Imp'
+        yield b'orted 2", "description": "d", "duration": 91}\n\n'
+        yield b'{"title": "Bad", "description": "d", "duration": -1}\nnot json\n'
+        yield b'{"title": "Imported 3", "description": "d", "duration": 92}'
+
+    response = test_client.post("/movies/import", content=ndjson_body(), headers={**headers, "Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    report = response.json()["data"]
+    assert report["inserted"] == 3
+    assert report["failed"] == 2
+    assert [error["row"] for error in report["errors"]] == [3, 4]
+    assert report["errors"][0]["errors"][0]["loc"] == ["duration"]
+
+    csv_body = 'title,description,duration\n"Imported, CSV","spans\ntwo lines",100\nMissing duration,d\n'
+    response = test_client.post("/movies/import", content=csv_body.encode(), headers={**headers, "Content-Type": "text/csv"})
+    report = response.json()["data"]
+    assert report["inserted"] == 1
+    assert report["errors"][0]["row"] == 2
+
+    # An unbalanced quote is reported, at end of input or once the record grows too long.
+    csv_body = 'title,description,duration\n"ok",d,5\n"bad,oops,5\nNext,d,6\nLast,d,7\n'
+    report = test_client.post("/movies/import", content=csv_body.encode(), headers={**headers, "Content-Type": "text/csv"}).json()["data"]
+    assert (report["inserted"], report["failed"]) == (1, 1)
+    assert report["errors"][0]["row"] == 2
+    monkeypatch.setattr("app.bulk_import.MAX_CSV_RECORD_CHARS", 20)
+    csv_body = 'title,description,duration\n"bad,oops,5\nSwallowed,d,6\nResumed,d,7\n"Recovered",d,8\n'
+    report = test_client.post("/movies/import", content=csv_body.encode(), headers={**headers, "Content-Type": "text/csv"}).json()["data"]
+    assert (report["inserted"], report["failed"]) == (2, 1)
+    assert "Unterminated" in report["errors"][0]["errors"][0]["msg"]
+
+    # A line past MAX_LINE_BYTES is reported once and skipped to the next newline, even with no newline at all.
+    monkeypatch.setattr("app.bulk_import.MAX_LINE_BYTES", 64)
+
+    def long_lines_body():
+        yield b'{"title": "' + b"x" * 50
+        yield b"x" * 50
+        yield b'x", "description": "d", "duration": 1}\n{"title": "After long", "description": "d", "duration": 93}\n'
+        for _ in range(100):
+            yield b"y" * 50
+
+    report = test_client.post("/movies/import", content=long_lines_body(), headers={**headers, "Content-Type": "application/x-ndjson"}).json()["data"]
+    assert (report["inserted"], report["failed"]) == (1, 2)
+    assert [error["row"] for error in report["errors"]] == [1, 3]
+    assert "exceeds 64 bytes" in report["errors"][1]["errors"][0]["msg"]
+
+    titles = [movie["title"] for movie in test_client.get("/Movies/", params={"limit": 1000}).json()]
+    assert {"Imported 1", "Imported 2", "Imported 3", "Imported, CSV", "After long"} <= set(titles)
+    assert "Bad" not in titles
+
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_export_streams_ndjson_catalog(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password'], monkeypatch: pytest.MonkeyPatch):
+    import gzip
+    import json
+    from app.config import get_settings
+
+    monkeypatch.setattr(get_settings(), "export_batch_size", 3)
+    response = test_client.post("/login", data={"username": username, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = test_client.post("/movies/create", json=movie_data, headers=headers)
+    movie_id = response.json()['data'].get("id")
+    test_client.post(f"/movies/{movie_id}/create_comment", json=comment_data, headers=headers)
+    test_client.post(f"/movie/{movie_id}/create_rating", json={"rating": 6}, headers=headers)
+
+    response = test_client.get("/movies/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+    assert len(rows) == len(test_client.get("/Movies/", params={"limit": 10000}).json())
+    exported = next(row for row in rows if row["id"] == movie_id)
+    assert exported["comment_count"] == 1
+    assert exported["rating_count"] == 1
+    assert exported["average_rating"] == 6
+
+    with test_client.stream("GET", "/movies/export", params={"gzip": True}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        compressed = b"".join(response.iter_raw())
+    assert gzip.decompress(compressed).decode().splitlines() == [json.dumps(row, separators=(",", ":")) for row in rows]
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_search_ranks_and_tracks_movie_writes(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password']):
+    response = test_client.post("/login", data={"username": username, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    in_title = test_client.post("/movies/create", json={"title": "Nebula Drift", "description": "A quiet voyage", "duration": 100}, headers=headers).json()["data"]["id"]
+    in_description = test_client.post("/movies/create", json={"title": "Quiet Harbour", "description": "Sailors chase a nebula", "duration": 100}, headers=headers).json()["data"]["id"]
+    test_client.post("/movies/import", content=b'{"title": "Nebula Bulk", "description": "d", "duration": 90}\n', headers={**headers, "Content-Type": "application/x-ndjson"})
+
+    results = test_client.get("/movies/search", params={"q": "nebula"}).json()
+    assert [movie["title"] for movie in results][-1] == "Quiet Harbour"
+    assert {movie["title"] for movie in results} == {"Nebula Drift", "Quiet Harbour", "Nebula Bulk"}
+    assert test_client.get("/movies/search", params={"q": "nebula", "limit": 1, "skip": 2}).json()[0]["title"] == "Quiet Harbour"
+
+    test_client.put(f"/movies/{in_title}", json={"title": "Comet Drift", "description": "A quiet voyage", "duration": 100}, headers=headers)
+    test_client.delete(f"/movies/{in_description}", headers=headers)
+    assert [movie["title"] for movie in test_client.get("/movies/search", params={"q": "nebula"}).json()] == ["Nebula Bulk"]
+    assert [movie["title"] for movie in test_client.get("/movies/search", params={"q": "comet"}).json()] == ["Comet Drift"]
+
+    assert test_client.get("/movies/search", params={"q": "\"*:("}).json() == []
+    assert test_client.get("/movies/search", params={"q": ""}).status_code == 422
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_top_movies_rank_by_weighted_rating(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password']):
+    from app.config import get_settings
+    from app.rankings import rebuild_rankings
+
+    response = test_client.post("/login", data={"username": username, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    loved = test_client.post("/movies/create", json={"title": "Loved", "description": "d", "duration": 90}, headers=headers).json()["data"]["id"]
+    panned = test_client.post("/movies/create", json={"title": "Panned", "description": "d", "duration": 90}, headers=headers).json()["data"]["id"]
+    test_client.post(f"/movie/{loved}/create_rating", json={"rating": 10}, headers=headers)
+    test_client.post(f"/movie/{panned}/create_rating", json={"rating": 1}, headers=headers)
+
+    settings = get_settings()
+    top = test_client.get("/movies/top", params={"limit": 1000}).json()
+    assert next(movie for movie in top if movie["id"] == loved) == {
+        "id": loved,
+        "title": "Loved",
+        "score": pytest.approx((10 + settings.ranking_min_votes * settings.ranking_prior_mean) / (1 + settings.ranking_min_votes)),
+        "average_rating": 10,
+        "rating_count": 1,
+    }
+    assert top[-1]["id"] == panned
+    assert [movie["score"] for movie in top] == sorted((movie["score"] for movie in top), reverse=True)
+    assert test_client.get("/movies/top", params={"limit": 1, "skip": 1}).json()[0] == top[1]
+
+    db = TestSessionLocal()
+    try:
+        assert rebuild_rankings(db) == len(top)
+    finally:
+        db.close()
+    assert test_client.get("/movies/top", params={"limit": 1000}).json() == top
+
+    test_client.delete(f"/movies/{loved}", headers=headers)
+    assert loved not in [movie["id"] for movie in test_client.get("/movies/top", params={"limit": 1000}).json()]
+
+
+def test_logging_pipeline_samples_and_drops_without_blocking():
+    import json
+    import logging
+    import queue
+    from app.log import DroppingQueueHandler, JsonFormatter, SamplingFilter
+
+    handler = DroppingQueueHandler(queue.Queue(maxsize=3))
+    sampler = SamplingFilter({"sampled": 0.25})
+    handler.addFilter(sampler)
+    logger = logging.Logger("sampled")
+    logger.addHandler(handler)
+
+    for n in range(8):
+        logger.info("Movies retrieved %s", n)
+    logger.warning("always kept")
+    assert sampler.sampled_out == 6
+    assert handler.queue.qsize() == 3
+    assert handler.dropped == 0
+    logger.error("queue is full")
+    assert handler.dropped == 1
+
+    record = handler.queue.get_nowait()
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Movies retrieved 3"
+    assert entry["logger"] == "sampled"
+    assert entry["level"] == "INFO"
+
+    # Sampling the movie-list logger leaves the rest of capstone_main untouched.
+    from app.handlers import movie_list_logger
+    sampler = SamplingFilter({movie_list_logger.name: 0})
+    records = [
+        logging.LogRecord(name, level, __file__, 0, message, None, None)
+        for name, level, message in (
+            (movie_list_logger.name, logging.INFO, "Movies retrieved"),
+            ("capstone_main", logging.INFO, "Movie 1 retriveed succesfully"),
+            (movie_list_logger.name, logging.WARNING, "slow listing"),
+        )
+    ]
+    assert [sampler.filter(record) for record in records] == [False, True, True]
+
+
+def test_logging_stats_endpoint(test_client: TestClient):
+    stats = test_client.get("/logging/stats").json()
+    assert {"queued", "capacity", "dropped", "sampled_out"} <= set(stats)
+
+
+def test_failed_statement_leaves_no_query_timer():
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+
+    with engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM no_such_table"))
+        assert conn.info["query_started"] == []
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+        assert conn.info["query_started"] == []
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_metrics_report_routes_queries_and_caches(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password']):
+    from prometheus_client.parser import text_string_to_metric_families
+
+    def scrape():
+        samples = {}
+        for family in text_string_to_metric_families(test_client.get("/metrics").text):
+            for sample in family.samples:
+                samples[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+        return samples
+
+    response = test_client.post("/login", data={"username": username, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    movie_id = test_client.post("/movies/create", json=movie_data, headers=headers).json()["data"]["id"]
+    before = scrape()
+    route = (("method", "GET"), ("route", "/movie/{movie_id}"))
+    for _ in range(2):
+        assert test_client.get(f"/movie/{movie_id}").status_code == 200
+    test_client.get("/movie/999999")
+    after = scrape()
+
+    def delta(name, labels):
+        return after.get((name, labels), 0) - before.get((name, labels), 0)
+
+    assert delta("http_requests_total", route + (("status", "200"),)) == 2
+    assert delta("http_requests_total", route + (("status", "404"),)) == 1
+    assert delta("http_request_duration_seconds_count", route) == 3
+    assert delta("db_queries_per_request_count", route) == 3
+    assert delta("db_queries_per_request_sum", route) >= 3
+    assert delta("db_pool_checkout_seconds_count", ()) >= 1
+    assert after[("http_requests_in_progress", route)] == 0
+    assert delta("cache_hits_total", (("cache", "movie"),)) >= 1
+    assert ("cache_hit_ratio", (("cache", "token"),)) in after
+
+
+def test_exhausted_pool_and_slow_statements_fail_fast_with_503(test_client: TestClient, tmp_path):
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from app.database import STATEMENT_TIMEOUT_KEY, pool_status
+
+    small_engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", pool_size=1, max_overflow=0, pool_timeout=0.05)
+    Base.metadata.create_all(bind=small_engine)
+    SmallSession = sessionmaker(bind=small_engine)
+
+    def small_db():
+        with SmallSession() as db:
+            db.info[STATEMENT_TIMEOUT_KEY] = 50
+            yield db
+
+    slow_query = text("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 50000000) SELECT count(*) FROM c")
+    with SmallSession() as db:
+        db.info[STATEMENT_TIMEOUT_KEY] = 50
+        with pytest.raises(OperationalError, match="interrupted"):
+            db.execute(slow_query)
+    with small_engine.connect() as conn:
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+
+    app.dependency_overrides[get_db] = small_db
+    try:
+        held = small_engine.connect()
+        assert pool_status(small_engine)["checkedout"] == 1
+        response = test_client.get("/movie/rating/1")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        held.close()
+        assert test_client.get("/movie/rating/1").status_code == 404
+    finally:
+        app.dependency_overrides[get_db] = override_get_db
+        small_engine.dispose()
+    assert set(test_client.get("/db/pool/stats").json()) >= {"pool"}
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_reads_go_to_healthy_replicas_until_the_client_writes(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password'], tmp_path):
+    from app import replicas
+    from app.models import Movie as MovieModel
+
+    replica_engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    Base.metadata.create_all(bind=replica_engine)
+    with sessionmaker(bind=replica_engine)() as db:
+        db.add(MovieModel(title="Replica copy", description="d", duration=1, user_id=1))
+        db.commit()
+    broken_engine = create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+
+    client = TestClient(app)
+    response = client.post("/login", data={"username": username, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    movie_id = client.post("/movies/create", json=movie_data, headers=headers).json()["data"]["id"]
+    client.cookies.clear()
+
+    original = replicas.replica_set
+    replica_set = replicas.ReplicaSet([broken_engine, replica_engine], check_interval=60)
+    replicas.set_replica_set(replica_set)
+    try:
+        assert [r["healthy"] for r in client.get("/db/replicas").json()] == [None, None]
+        assert "Test Movie" in [m["title"] for m in client.get("/Movies/").json()]
+        replica_set.check()
+        assert [m["title"] for m in client.get("/Movies/").json()] == ["Replica copy"]
+        assert [m["title"] for m in client.get("/Movies/").json()] == ["Replica copy"]
+        assert [r["healthy"] for r in client.get("/db/replicas").json()] == [False, True]
+
+        get_cache_backend().clear()
+        assert client.get("/movie/1").json()["title"] == "Replica copy"
+        assert client.get("/movies/batch", params={"ids": "1"}).json()["data"][0]["title"] == "Replica copy"
+        assert get_cache_backend().stats()["size"] == 0
+
+        response = client.post(f"/movies/{movie_id}/create_comment", json=comment_data, headers=headers)
+        assert replicas.READ_PRIMARY_COOKIE in response.cookies
+        assert "Test Movie" in [m["title"] for m in client.get("/Movies/").json()]
+        assert len(client.get(f"/movies/{movie_id}/comments").json()) == 1
+
+        client.cookies.clear()
+        replica_set = replicas.ReplicaSet([broken_engine], check_interval=60).start()
+        replicas.set_replica_set(replica_set)
+        assert "Test Movie" in [m["title"] for m in client.get("/Movies/").json()]
+    finally:
+        replicas.set_replica_set(original)
+        replica_set.dispose()
+        replica_engine.dispose()
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_list_and_detail_render_the_same_movie_json(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password']):
+    response = test_client.post("/login", data={"username": username, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    movie_id = test_client.post("/movies/create", json=movie_data, headers=headers).json()["data"]["id"]
+    comment_id = test_client.post(f"/movies/{movie_id}/create_comment", json=comment_data, headers=headers).json()["data"]["id"]
+    test_client.post(f"/comments/{comment_id}/comments", json=reply_data, headers=headers)
+    test_client.post(f"/movie/{movie_id}/create_rating", json={"rating": 4}, headers=headers)
+
+    listed = test_client.get("/Movies/", params={"limit": 1000})
+    assert listed.headers["content-type"] == "application/json"
+    detail = test_client.get(f"/movie/{movie_id}")
+    assert detail.headers["content-type"] == "application/json"
+    movie = detail.json()
+    assert movie in listed.json()
+    assert movie["average_rating"] == 4.0
+    assert movie["comments"][0]["replies"][0]["content"] == reply_data["content"]
+    assert movie["comments"][0]["reply_count"] == 1
+    assert set(movie) == {
+        "title", "description", "duration", "user_id", "release_date", "updated_at", "average_rating",
+        "comments", "comment_count", "has_more_comments", "next_comment_cursor",
+    }
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_movie_payloads_embed_bounded_comment_previews(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password'], monkeypatch: pytest.MonkeyPatch):
+    from app.config import get_settings
+
+    monkeypatch.setattr(get_settings(), "comment_preview_limit", 2)
+    monkeypatch.setattr(get_settings(), "reply_preview_limit", 1)
+    response = test_client.post("/login", data={"username": username, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    movie_id = test_client.post("/movies/create", json={**movie_data, "title": "Viral"}, headers=headers).json()["data"]["id"]
+    comment_ids = [
+        test_client.post(f"/movies/{movie_id}/create_comment", json={"content": f"Comment {n}"}, headers=headers).json()["data"]["id"]
+        for n in range(3)
+    ]
+    for n in range(4):
+        test_client.post(f"/comments/{comment_ids[0]}/comments", json={"content": f"Reply {n}"}, headers=headers)
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    get_cache_backend().clear()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        movie = test_client.get(f"/movie/{movie_id}").json()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert [comment["content"] for comment in movie["comments"]] == ["Comment 0", "Comment 1"]
+    assert (movie["comment_count"], movie["has_more_comments"]) == (3, True)
+    assert [reply["content"] for reply in movie["comments"][0]["replies"]] == ["Reply 0"]
+    assert (movie["comments"][0]["reply_count"], movie["comments"][0]["has_more_replies"]) == (4, True)
+    rest = test_client.get(f"/movies/{movie_id}/comments", params={"after": movie["next_comment_cursor"]}).json()
+    assert [comment["content"] for comment in rest] == ["Comment 2"]
+    # Version check, movie, comment preview and reply preview, however long the threads are.
+    assert len([sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]) == 4
+
+    listed = test_client.get("/Movies/", params={"limit": 1000}).json()
+    assert movie in listed
+    batch = test_client.get("/movies/batch", params={"ids": str(movie_id)}).json()
+    assert batch["data"] == [{"id": movie_id, **movie}]
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_movie_list_fieldsets_are_pushed_into_sql(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password']):
+    response = test_client.post("/login", data={"username": username, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    movie_id = test_client.post("/movies/create", json={**movie_data, "title": "Sparse"}, headers=headers).json()["data"]["id"]
+    test_client.post(f"/movies/{movie_id}/create_comment", json=comment_data, headers=headers)
+    test_client.post(f"/movie/{movie_id}/create_rating", json={"rating": 8}, headers=headers)
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        summary = test_client.get("/Movies/", params={"view": "summary", "limit": 1000}).json()
+        summary_sql = list(statements)
+        statements.clear()
+        sparse = test_client.get("/Movies/", params={"fields": "title,average_rating", "include": "comments", "limit": 1000}).json()
+        sparse_sql = list(statements)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert {"id": movie_id, "title": "Sparse", "average_rating": 8.0, "rating_count": 1} in summary
+    assert not any("description" in sql or "comments" in sql for sql in summary_sql)
+    movie = next(m for m in sparse if m["id"] == movie_id)
+    assert set(movie) == {"id", "title", "average_rating", "comments", "comment_count", "has_more_comments", "next_comment_cursor"}
+    assert movie["comments"][0]["content"] == comment_data["content"]
+    assert not any("movies.description" in sql for sql in sparse_sql)
+
+    searched = test_client.get("/movies/search", params={"q": "sparse", "fields": "title"}).json()
+    assert searched == [{"id": movie_id, "title": "Sparse"}]
+    full = test_client.get("/Movies/", params={"limit": 1000}).json()
+    assert "description" in full[0] and "comments" in full[0]
+    assert test_client.get("/Movies/", params={"fields": "title,password"}).status_code == 400
+
+
+def test_create_app_defers_engine_and_logging_to_lifespan(tmp_path):
+    import os
+    import subprocess
+    import sys
+    from app import database, log
+    from app.config import Settings
+    from app.main import create_app
+    from app.metrics import MetricsMiddleware
+
+    db_path = tmp_path / "app.db"
+    log_path = tmp_path / "app.log"
+    probe = "import sys, app.main; print(sorted(m for m in ('passlib', 'jose') if m in sys.modules))"
+    env = {**os.environ, "db_url": f"sqlite:///{db_path}", "PYTHONPATH": os.getcwd()}
+    result = subprocess.run([sys.executable, "-c", probe], cwd=tmp_path, env=env, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+    assert list(tmp_path.iterdir()) == []
+
+    settings = Settings(db_url=f"sqlite:///{db_path}", log_file=str(log_path), metrics_enabled=False, cache_max_entries=7)
+    created = create_app(settings)
+    assert MetricsMiddleware not in [middleware.cls for middleware in created.user_middleware]
+    assert not log_path.exists()
+
+    with TestClient(created) as client:
+        assert database.engine.url.database == str(db_path)
+        assert get_cache_backend().maxsize == 7
+        assert client.get("/logging/stats").json()["capacity"] == settings.log_queue_size
+    assert database.engine is None
+    assert log.listener is None
+    assert log_path.exists()
+    assert not db_path.exists()
+
+
+def test_adaptive_limiter_sheds_and_adapts_to_latency():
+    import asyncio
+    from app.admission import AdaptiveLimiter
+
+    async def scenario():
+        limiter = AdaptiveLimiter("read", initial=2, min_limit=1, max_limit=4, max_queue=1, queue_timeout=0.05, target_latency=0.1)
+        assert await limiter.acquire() and await limiter.acquire()
+        queued = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not await limiter.acquire()
+        limiter.release(0.01, failed=False)
+        assert await queued
+        assert not await limiter.acquire()
+        assert limiter.stats() == {"limit": 2.5, "in_flight": 2, "queued": 0, "admitted": 3, "shed": 2}
+
+        limiter.release(0.5, failed=False)
+        limiter.release(0.5, failed=False)
+        assert limiter.limit == pytest.approx(2.25)
+        for _ in range(50):
+            assert await limiter.acquire()
+            limiter.release(0.01, failed=False)
+        assert limiter.limit == 4
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_requests_over_the_limits_get_503_and_429(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password']):
+    from app.admission import TokenBuckets
+
+    response = test_client.post("/login", data={"username": username, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    read = app.state.limiters["read"]
+    saved = read.limit, read.max_queue
+    read.limit, read.max_queue = 0, 0
+    try:
+        response = test_client.get("/movies/top")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        assert test_client.get("/concurrency/stats").json()["limiters"]["read"]["shed"] >= 1
+        assert test_client.post("/movies/create", json=movie_data, headers=headers).status_code == 201
+    finally:
+        read.limit, read.max_queue = saved
+
+    app.state.user_buckets = TokenBuckets(rate=0.5, burst=2)
+    try:
+        statuses = [test_client.post("/movies/create", json=movie_data, headers=headers).status_code for _ in range(3)]
+        assert statuses == [201, 201, 429]
+        response = test_client.post("/movies/create", json=movie_data, headers=headers)
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "2"
+        assert test_client.get("/movies/top").status_code == 200
+        assert test_client.get("/concurrency/stats").json()["rate_limited"] == 2
+    finally:
+        app.state.user_buckets = None
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_movie_batch_keeps_order_and_query_count(test_client: TestClient, setup_database: None, username: Literal['username'], password: Literal['password']):
+    response = test_client.post("/login", data={"username": username, "password": password})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    movie_ids = [test_client.post("/movies/create", json=movie_data, headers=headers).json()["data"]["id"] for _ in range(6)]
+    test_client.post(f"/movies/{movie_ids[1]}/create_comment", json=comment_data, headers=headers)
+    test_client.post(f"/movies/{movie_ids[1]}/create_comment", json=comment_data, headers=headers)
+    test_client.post(f"/movie/{movie_ids[2]}/create_rating", json={"rating": 7}, headers=headers)
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        counts = []
+        for ids in (movie_ids[:2], movie_ids):
+            get_cache_backend().clear()
+            statements.clear()
+            assert test_client.get("/movies/batch", params={"ids": ",".join(map(str, ids))}).status_code == 200
+            counts.append(len(statements))
+        statements.clear()
+        test_client.get("/movies/batch", params={"ids": ",".join(map(str, movie_ids))})
+        cached = len(statements)
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+    assert counts[0] == counts[1]
+    assert cached == 0
+
+    requested = [movie_ids[2], 999999, movie_ids[1], movie_ids[2], movie_ids[0]]
+    batch = test_client.get("/movies/batch", params={"ids": ",".join(map(str, requested)), "comment_counts": "true"}).json()
+    assert [movie["id"] for movie in batch["data"]] == [movie_ids[2], movie_ids[1], movie_ids[0]]
+    assert batch["missing"] == [999999]
+    assert [movie["comment_count"] for movie in batch["data"]] == [0, 2, 0]
+    assert batch["data"][0]["average_rating"] == 7
+    detail = test_client.get(f"/movie/{movie_ids[1]}").json()
+    assert batch["data"][1] == {"id": movie_ids[1], **detail}
+    assert detail["comment_count"] == 2
+
+    posted = test_client.post("/movies/batch", json={"ids": requested, "comment_counts": True})
+    assert posted.json() == batch
+    assert "set-cookie" not in posted.headers
+    assert test_client.get("/movies/batch", params={"ids": "1,x"}).status_code == 400
+    assert test_client.get("/movies/batch", params={"ids": ",".join(["1"] * 101)}).status_code == 400
+    assert test_client.post("/movies/batch", json={"ids": []}).status_code == 422
+
+
+@pytest.mark.parametrize("username, password", [("username", "password")])
+def test_create_app_settings_reach_handlers_and_workers(setup_database: None, username: Literal['username'], password: Literal['password'], tmp_path):
+    from app import auth, database
+    from app.config import Settings
+    from app.main import create_app
+
+    settings = Settings(
+        db_url=f"sqlite:///{tmp_path / 'app.db'}",
+        log_file=str(tmp_path / "app.log"),
+        db_statement_timeout_ms=None,
+        password_hash_workers=1,
+        reply_preview_limit=1,
+        rating_write_behind=True,
+        rating_flush_interval=0,
+        ranking_min_votes=1,
+        ranking_prior_mean=0.0,
+    )
+    created = create_app(settings)
+    created.dependency_overrides[get_db] = override_get_db
+    created.dependency_overrides[get_session_factory] = lambda: TestSessionLocal
+    with TestClient(created) as client:
+        assert database.statement_timeout_ms is None
+        assert auth.password_hasher._max_workers == 1
+        response = client.post("/login", data={"username": username, "password": password})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        movie_id = client.post("/movies/create", json=movie_data, headers=headers).json()["data"]["id"]
+        comment_id = client.post(f"/movies/{movie_id}/create_comment", json=comment_data, headers=headers).json()["data"]["id"]
+        for _ in range(2):
+            client.post(f"/comments/{comment_id}/comments", json=reply_data, headers=headers)
+        assert len(client.get(f"/movies/{movie_id}/comments").json()[0]["replies"]) == 1
+
+        assert client.post(f"/movie/{movie_id}/create_rating", json={"rating": 8}, headers=headers).status_code == 200
+        assert client.get("/ratings/buffer/stats").json()["flushed"] == 1
+        top = {movie["id"]: movie for movie in client.get("/movies/top", params={"limit": 1000}).json()}
+        assert top[movie_id]["score"] == pytest.approx(4.0)
+    assert client.app.state.rating_buffer.stats()["enabled"] is False
@@ -0,0 +1,146 @@
+import pytest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.async_database import get_async_db, get_async_session_factory, to_async_url
+from app.async_main import router
+from app.cache import get_cache_backend
+from app.database import Base
+
+
+@pytest.fixture(scope="module")
+def test_client(tmp_path_factory):
+    database_url = f"sqlite:///{tmp_path_factory.mktemp('async') / 'test.db'}"
+    Base.metadata.create_all(bind=create_engine(database_url))
+
+    engine = create_async_engine(to_async_url(database_url))
+    TestAsyncSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with TestAsyncSessionLocal() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_async_session_factory] = lambda: TestAsyncSessionLocal
+    get_cache_backend().clear()
+    with TestClient(app) as client:
+        yield client
+    get_cache_backend().clear()
+
+
+def test_to_async_url():
+    assert to_async_url("postgresql://user:pw@db/movies") == "postgresql+asyncpg://user:pw@db/movies"
+    assert to_async_url("postgresql+psycopg2://user:pw@db/movies") == "postgresql+asyncpg://user:pw@db/movies"
+    assert to_async_url("sqlite:///./app.db") == "sqlite+aiosqlite:///./app.db"
+
+
+def test_async_movie_comment_and_rating_flow(test_client: TestClient):
+    response = test_client.post("/signup", json={"username": "async", "password": "password", "email": "async@example.com"})
+    assert response.status_code == 201
+    response = test_client.post("/login", data={"username": "async", "password": "password"})
+    assert response.status_code == 200
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    response = test_client.post("/movies/create", json={"title": "Async Movie", "description": "Awaited", "duration": 90}, headers=headers)
+    assert response.status_code == 201
+    movie_id = response.json()["data"]["id"]
+
+    response = test_client.post(f"/movies/{movie_id}/create_comment", json={"content": "Great movie!"}, headers=headers)
+    assert response.status_code == 200
+    comment_id = response.json()["data"]["id"]
+    response = test_client.post(f"/comments/{comment_id}/comments", json={"content": "I agree!"}, headers=headers)
+    assert response.status_code == 200
+
+    response = test_client.post(f"/movie/{movie_id}/create_rating", json={"rating": 6}, headers=headers)
+    assert response.status_code == 200
+    assert test_client.post(f"/movie/{movie_id}/create_rating", json={"rating": 6}, headers=headers).status_code == 400
+    response = test_client.put(f"/movie/{movie_id}/rating", json={"rating": 8}, headers=headers)
+    assert response.status_code == 200
+
+    response = test_client.get(f"/movie/{movie_id}")
+    assert response.status_code == 200
+    movie = response.json()
+    assert movie["average_rating"] == 8
+    assert movie["comments"][0]["replies"][0]["content"] == "I agree!"
+
+    response = test_client.get(f"/movies/{movie_id}/comments")
+    assert response.status_code == 200
+    assert response.json()[0]["content"] == "Great movie!"
+    assert response.json()[0]["reply_count"] == 1
+
+    response = test_client.get("/Movies/")
+    assert response.status_code == 200
+    assert [m["title"] for m in response.json()] == ["Async Movie"]
+
+    response = test_client.get("/movies/export")
+    assert response.status_code == 200
+    assert '"comment_count":1' in response.text
+
+    response = test_client.post("/movies/batch", json={"ids": [999999, movie_id], "comment_counts": True})
+    assert response.json()["missing"] == [999999]
+    assert response.json()["data"][0] == {"id": movie_id, **movie, "comment_count": 1}
+
+    response = test_client.put(f"/movies/{movie_id}", json={"title": "Renamed"}, headers=headers)
+    assert response.json()["data"]["title"] == "Renamed"
+
+    response = test_client.delete(f"/movies/{movie_id}", headers=headers)
+    assert response.status_code == 200
+    assert test_client.get(f"/movie/{movie_id}").status_code == 404
+
+
+def test_async_sqlite_statements_are_bounded_by_the_timeout(tmp_path):
+    import asyncio
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from app.async_database import create_instrumented_async_engine
+    from app.config import get_settings
+    from app.database import STATEMENT_TIMEOUT_KEY
+
+    engine = create_instrumented_async_engine(to_async_url(f"sqlite:///{tmp_path / 'timeout.db'}"), get_settings())
+    slow_query = text("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 50000000) SELECT count(*) FROM c")
+
+    async def run():
+        SessionLocal = async_sessionmaker(engine)
+        async with SessionLocal() as db:
+            db.info[STATEMENT_TIMEOUT_KEY] = 50
+            with pytest.raises(OperationalError, match="interrupted"):
+                await db.execute(slow_query)
+        async with engine.connect() as conn:
+            assert (await conn.execute(text("SELECT 1"))).scalar() == 1
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_async_reads_go_to_healthy_replicas(test_client: TestClient, tmp_path, monkeypatch: pytest.MonkeyPatch):
+    from sqlalchemy.orm import sessionmaker
+    from app import async_database, replicas
+    from app.config import get_settings
+    from app.models import Movie as MovieModel
+
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    replica_engine = create_engine(replica_url)
+    Base.metadata.create_all(bind=replica_engine)
+    with sessionmaker(bind=replica_engine)() as db:
+        db.add(MovieModel(title="Replica copy", description="d", duration=1, user_id=1))
+        db.commit()
+
+    replica_set = replicas.ReplicaSet([replica_engine], check_interval=60)
+    replica_set.check()
+    monkeypatch.setattr(replicas, "replica_set", replica_set)
+    monkeypatch.setattr(async_database, "async_replica_engines", {replica_engine: async_database.create_instrumented_async_engine(to_async_url(replica_url), get_settings())})
+    get_cache_backend().clear()
+
+    assert [m["title"] for m in test_client.get("/Movies/").json()] == ["Replica copy"]
+    assert test_client.get("/movies/batch", params={"ids": "1"}).json()["data"][0]["title"] == "Replica copy"
+    assert get_cache_backend().stats()["size"] == 0
+    test_client.cookies.set(replicas.READ_PRIMARY_COOKIE, "9999999999")
+    try:
+        assert "Replica copy" not in [m["title"] for m in test_client.get("/Movies/").json()]
+    finally:
+        test_client.cookies.clear()
+        replica_set.dispose()
@@ -0,0 +1,114 @@
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+
+from app.models import Comment as CommentModel, Reply as ReplyModel
+from app.pagination import encode_cursor
+
+
+def reply_preview_query(comment_ids:list[int], per_comment:int):
+    """First ``per_comment`` replies of every comment in ``comment_ids``, with each comment's reply total.
+
+    One windowed query serves the whole page: ``ROW_NUMBER()`` keeps the head
+    of each thread and ``COUNT()`` over the same partition gives its size.
+    Only the row numbered 1 survives when ``per_comment`` is 0, so the count is
+    still reported.
+    """
+    partition = {"partition_by": ReplyModel.comment_id}
+    ranked = (
+        select(
+            ReplyModel,
+            func.row_number().over(**partition, order_by=ReplyModel.id).label("position"),
+            func.count().over(**partition).label("reply_count"),
+        )
+        .where(ReplyModel.comment_id.in_(comment_ids))
+        .subquery()
+    )
+    reply = aliased(ReplyModel, ranked)
+    return (
+        select(reply, ranked.c.position, ranked.c.reply_count)
+        .where(ranked.c.position <= max(per_comment, 1))
+        .order_by(ranked.c.comment_id, ranked.c.id)
+    )
+
+
+def comment_threads(db_comments, preview_rows, per_comment:int) -> list[dict]:
+    """Attach the reply preview to each comment without touching the lazy ``replies`` relationship."""
+    replies, counts = {}, {}
+    for db_reply, position, reply_count in preview_rows:
+        counts[db_reply.comment_id] = reply_count
+        if position <= per_comment:
+            replies.setdefault(db_reply.comment_id, []).append(db_reply)
+    threads = []
+    for db_comment in db_comments:
+        head = replies.get(db_comment.id, [])
+        reply_count = counts.get(db_comment.id, 0)
+        has_more = reply_count > len(head)
+        threads.append({
+            "id": db_comment.id,
+            "content": db_comment.content,
+            "user_id": db_comment.user_id,
+            "created_at": db_comment.created_at,
+            "replies": head,
+            "reply_count": reply_count,
+            "has_more_replies": has_more,
+            "next_reply_cursor": encode_cursor(head[-1].id) if has_more and head else None,
+        })
+    return threads
+
+
+def comment_preview_query(movie_ids:list[int], per_movie:int):
+    """First ``per_movie`` comments of every movie in ``movie_ids``, with each movie's comment total.
+
+    The same windowed query as ``reply_preview_query``, partitioned by movie.
+    """
+    partition = {"partition_by": CommentModel.movie_id}
+    ranked = (
+        select(
+            CommentModel,
+            func.row_number().over(**partition, order_by=CommentModel.id).label("position"),
+            func.count().over(**partition).label("comment_count"),
+        )
+        .where(CommentModel.movie_id.in_(movie_ids))
+        .subquery()
+    )
+    comment = aliased(CommentModel, ranked)
+    return (
+        select(comment, ranked.c.position, ranked.c.comment_count)
+        .where(ranked.c.position <= max(per_movie, 1))
+        .order_by(ranked.c.movie_id, ranked.c.id)
+    )
+
+
+def previewed_comment_ids(comment_rows, per_movie:int) -> list[int]:
+    return [db_comment.id for db_comment, position, _ in comment_rows if position <= per_movie]
+
+
+NO_THREADS = {"comments": [], "comment_count": 0, "has_more_comments": False, "next_comment_cursor": None}
+
+
+def movie_threads(comment_rows, reply_rows, per_movie:int, per_comment:int) -> dict[int, dict]:
+    """Comment preview of each movie, keyed by movie id; movies without comments are left out.
+
+    Each comment carries its own reply preview, as in ``comment_threads``, and
+    ``next_comment_cursor`` continues the list at ``GET /movies/{movie_id}/comments``.
+    """
+    heads, counts = {}, {}
+    for db_comment, position, comment_count in comment_rows:
+        counts[db_comment.movie_id] = comment_count
+        if position <= per_movie:
+            heads.setdefault(db_comment.movie_id, []).append(db_comment)
+    previewed = [db_comment for head in heads.values() for db_comment in head]
+    comments = {}
+    for db_comment, thread in zip(previewed, comment_threads(previewed, reply_rows, per_comment)):
+        comments.setdefault(db_comment.movie_id, []).append(thread)
+    threads = {}
+    for movie_id, comment_count in counts.items():
+        head = heads.get(movie_id, [])
+        has_more = comment_count > len(head)
+        threads[movie_id] = {
+            "comments": comments.get(movie_id, []),
+            "comment_count": comment_count,
+            "has_more_comments": has_more,
+            "next_comment_cursor": encode_cursor(head[-1].id) if has_more and head else None,
+        }
+    return threads